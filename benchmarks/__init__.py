@@ -0,0 +1,6 @@
+"""MinCamlコンパイラのベンチマーク (python -m benchmarks)"""
+
+import os
+
+# ベンチマークに使うサンプルプログラムのディレクトリ
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
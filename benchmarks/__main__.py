@@ -0,0 +1,274 @@
+"""コンパイラのスループットのベンチマーク
+
+    python -m benchmarks [--corpus] [--synthetic] [--steps N] [--repeat N] [--parser rd]
+                         [--json] [--check]
+
+corpus/の各プログラムと、generateの合成プログラムをコンパイルし、段階ごとの時間
+(repeat回のうち最短のもの)と最大のメモリ使用量を測る。合成プログラムは大きさを
+steps回倍にしながら測り、伸びの指数(log nに対するlog tの傾きを最小二乗法で求めたもの)を
+示す。線形なら1、二乗なら2に近く、--max-exponentを超える段階は線形でない疑いがある。
+
+generate.STRESSの大きな形は--shapeで指定したときだけ測る。例えば10万個の束縛までは
+    python -m benchmarks --shape bindings --steps 4 --repeat 1 --check
+"""
+
+import os
+import sys
+import json
+import math
+import logging
+import argparse
+import threading
+import tracemalloc
+import collections
+
+from mincaml import logger
+from mincaml import stats
+from mincaml import parser
+from mincaml.compiler import Compiler
+
+from . import CORPUS
+from . import generate
+
+# 表に出す段階 (-jを付けたときの並列のコード生成は一つの段階になる)
+STAGES = (
+    "parse",
+    "typing",
+    "knorm",
+    "alpha",
+    "beta",
+    "assoc",
+    "inline",
+    "const_fold",
+    "elim",
+    "closure",
+    "virtual",
+    "simm",
+    "virtual+simm (parallel)",
+    "regalloc",
+    "emit",
+    "total",
+)
+
+# これより短い時間の段階は、伸びの指数を判定しない (秒)
+MIN_TIME = 0.01
+
+
+def measure(input, repeat, jobs=1, parser_backend="ply"):
+    """inputをコンパイルし、(段階から最短の時間への対応, 最大のメモリ使用量)を返す
+
+    時間は最適化の反復すべての合計。メモリはtracemallocで測るので、時間とは別に一度だけ
+    コンパイルする。parser_backendは使う構文解析器 (parser.PARSERSのいずれか)。
+    """
+    compiler = Compiler(jobs=jobs, parser_backend=parser_backend)
+    best = {}
+    for _ in range(repeat):
+        compiler.stats = stats.Stats()
+        compiler.emit(compiler.compile(input))
+        times = collections.Counter()
+        for p in compiler.stats.passes:
+            times[p.name] += p.time
+        times["total"] = compiler.stats.total
+        for name, t in times.items():
+            best[name] = min(best.get(name, t), t)
+    compiler.stats = None
+    tracemalloc.start()
+    try:
+        compiler.emit(compiler.compile(input))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def exponent(sizes, values):
+    """大きさsizesに対する測定値valuesの伸びの指数
+
+    MIN_TIMEより短い時間のように、小さすぎて当てにならない測定値は呼び出し側で除く。
+    点が二つに満たなければNone。
+    """
+    points = [(math.log(n), math.log(v)) for n, v in zip(sizes, values) if v > 0]
+    if len(points) < 2:
+        return None
+    mx = sum(x for x, _ in points) / len(points)
+    my = sum(y for _, y in points) / len(points)
+    sxx = sum((x - mx) ** 2 for x, _ in points)
+    sxy = sum((x - mx) * (y - my) for x, y in points)
+    return sxy / sxx
+
+
+def run_corpus(args):
+    result = {}
+    for fname in sorted(os.listdir(CORPUS)):
+        if not fname.endswith(".ml"):
+            continue
+        with open(os.path.join(CORPUS, fname), "rb") as fp:
+            input = fp.read()
+        times, peak = measure(input, args.repeat, args.jobs, args.parser)
+        result[fname[:-3]] = {"times": times, "peak": peak}
+    return result
+
+
+def run_synthetic(args):
+    result = {}
+    shapes = args.shape or list(generate.SHAPES)
+    for shape in shapes:
+        gen, base = generate.SHAPES.get(shape) or generate.STRESS[shape]
+        sizes = [base * 2**i for i in range(args.steps)]
+        times = collections.defaultdict(list)
+        peaks = []
+        for n in sizes:
+            t, peak = measure(gen(n).encode(), args.repeat, args.jobs, args.parser)
+            for stage in STAGES:
+                if stage in t:
+                    times[stage].append(t[stage])
+            peaks.append(peak)
+        exponents = {}
+        for stage, ts in times.items():
+            measured = [(n, t) for n, t in zip(sizes, ts) if t >= MIN_TIME]
+            x = exponent(*zip(*measured)) if measured else None
+            if x is not None:
+                exponents[stage] = x
+        x = exponent(sizes, peaks)
+        if x is not None:
+            exponents["peak"] = x
+        result[shape] = {
+            "sizes": sizes,
+            "times": dict(times),
+            "peak": peaks,
+            "exponents": exponents,
+        }
+    return result
+
+
+def regressions(synthetic, max_exponent):
+    "伸びの指数がmax_exponentを超えた(形, 段階, 指数)の列"
+    found = []
+    for shape, r in synthetic.items():
+        for stage, x in r["exponents"].items():
+            if x is not None and x > max_exponent:
+                found.append((shape, stage, x))
+    return found
+
+
+def format_time(t):
+    return f"{t * 1000:.1f}"
+
+
+def print_corpus(corpus):
+    stages = [s for s in STAGES if any(s in r["times"] for r in corpus.values())]
+    width = max(len(s) for s in stages)
+    names = list(corpus)
+    print("corpus (ms, peak in KB)")
+    print(f"{'':<{width}} " + " ".join(f"{name:>9}" for name in names))
+    for stage in stages:
+        cells = []
+        for name in names:
+            t = corpus[name]["times"].get(stage)
+            cells.append(f"{'-' if t is None else format_time(t):>9}")
+        print(f"{stage:<{width}} " + " ".join(cells))
+    cells = [f"{corpus[name]['peak'] // 1024:>9}" for name in names]
+    print(f"{'peak':<{width}} " + " ".join(cells))
+    print()
+
+
+def print_synthetic(synthetic, max_exponent):
+    for shape, r in synthetic.items():
+        stages = [s for s in STAGES if s in r["times"]]
+        width = max(len(s) for s in stages)
+        print(f"{shape} (ms, peak in KB; exp = fitted growth exponent)")
+        print(
+            f"{'n':<{width}} "
+            + " ".join(f"{n:>9}" for n in r["sizes"])
+            + f" {'exp':>6}"
+        )
+        rows = [(stage, r["times"][stage], format_time) for stage in stages]
+        rows.append(("peak", r["peak"], lambda b: str(b // 1024)))
+        for stage, values, fmt in rows:
+            x = r["exponents"].get(stage)
+            mark = "" if x is None else f"{x:6.2f}"
+            if x is not None and x > max_exponent:
+                mark += " !"
+            print(
+                f"{stage:<{width}} "
+                + " ".join(f"{fmt(v):>9}" for v in values)
+                + f" {mark:>6}"
+            )
+        print()
+
+
+def run(args):
+    result = {}
+    if args.corpus or not args.synthetic:
+        result["corpus"] = run_corpus(args)
+    if args.synthetic or not args.corpus:
+        result["synthetic"] = run_synthetic(args)
+    found = regressions(result.get("synthetic", {}), args.max_exponent)
+    result["regressions"] = [
+        {"shape": shape, "stage": stage, "exponent": x} for shape, stage, x in found
+    ]
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        if "corpus" in result:
+            print_corpus(result["corpus"])
+        if "synthetic" in result:
+            print_synthetic(result["synthetic"], args.max_exponent)
+        for shape, stage, x in found:
+            print(f"superlinear: {stage} on {shape} (exponent {x:.2f})")
+    return 1 if args.check and found else 0
+
+
+def main():
+    argparser = argparse.ArgumentParser(prog="benchmarks")
+    argparser.add_argument("--corpus", action="store_true", help="run the corpus only")
+    argparser.add_argument(
+        "--synthetic", action="store_true", help="run the synthetic programs only"
+    )
+    argparser.add_argument(
+        "--shape",
+        action="append",
+        choices=list(generate.SHAPES) + list(generate.STRESS),
+        help="synthetic shape to run (repeatable; default: all non-stress shapes)",
+    )
+    argparser.add_argument(
+        "--steps", type=int, default=5, help="number of sizes, doubling each time"
+    )
+    argparser.add_argument(
+        "--repeat", type=int, default=3, help="compilations per measurement"
+    )
+    argparser.add_argument("-j", "--jobs", type=int, default=1)
+    argparser.add_argument(
+        "--parser",
+        choices=parser.PARSERS,
+        default="ply",
+        help="parser backend to compile with (default: ply)",
+    )
+    argparser.add_argument(
+        "--max-exponent",
+        type=float,
+        default=1.5,
+        help="growth exponent above which a stage is reported (default: 1.5)",
+    )
+    argparser.add_argument(
+        "--check",
+        action="store_true",
+        help="exit with status 1 if any stage grows faster than --max-exponent",
+    )
+    argparser.add_argument("--json", action="store_true")
+    args = argparser.parse_args()
+
+    logger.setLevel(logging.ERROR)
+    # 入れ子の深いプログラムは再帰するパスを通るので、大きなスタックのスレッドで実行する
+    sys.setrecursionlimit(1000000)
+    threading.stack_size(512 * 1024 * 1024)
+    status = []
+    thread = threading.Thread(target=lambda: status.append(run(args)))
+    thread.start()
+    thread.join()
+    sys.exit(status[0] if status else 2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""コンパイル結果のキャッシュの検査と、ヒットしたときの速さ
+
+    python -m benchmarks.cache
+
+corpus/の各プログラムとgenerateの合成プログラムを、一時ディレクトリのキャッシュを
+使ってbytes・str・mmapのソースとしてコンパイルする。最初のbytesのコンパイルは
+ミスして保存し、その後のstr・mmapは同じエントリにヒットして、どれもキャッシュを
+使わないコンパイルと同じアセンブリになるはずである。そうでなければ終了ステータス1で
+終わる。ミスしたとき(保存を含む)とヒットしたときの時間も示す。
+合成プログラムは既定の大きさの4倍にして、pickleできない深さのプログラムも含める。
+"""
+
+import os
+import sys
+import mmap
+import time
+import logging
+import tempfile
+
+from mincaml import cache
+from mincaml import logger
+from mincaml.compiler import Compiler
+
+from . import CORPUS
+from . import generate
+
+
+def sources():
+    "(名前, ソースのbytes)の列"
+    for fname in sorted(os.listdir(CORPUS)):
+        if fname.endswith(".ml"):
+            with open(os.path.join(CORPUS, fname), "rb") as fp:
+                yield fname, fp.read()
+    for shape, (gen, n) in generate.SHAPES.items():
+        yield f"{shape} {n * 4}", gen(n * 4).encode()
+
+
+def compile(compiler, input):
+    "(アセンブリ, 時間)"
+    start = time.perf_counter()
+    prog = compiler.compile(input)
+    t = time.perf_counter() - start
+    return compiler.emit(prog), t
+
+
+def check(path, name, input):
+    "nameのソースinputを各形式でコンパイルし、問題の説明の列と時間を返す"
+    problems = []
+    expected, _ = compile(Compiler(), input)
+    compiler = Compiler(cache=cache.Cache(path))
+    stats = compiler.cache.stats
+
+    asm, miss = compile(compiler, input)
+    if asm != expected:
+        problems.append("bytes: different output")
+    if (stats.misses, stats.stores) != (1, 1):
+        problems.append("bytes: not stored")
+
+    asm, hit = compile(compiler, input.decode())
+    if asm != expected:
+        problems.append("str: different output")
+    if stats.hits != 1:
+        problems.append("str: missed the entry stored from bytes")
+
+    with tempfile.TemporaryFile() as fp:
+        fp.write(input)
+        fp.flush()
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            asm, _ = compile(compiler, m)
+    if asm != expected:
+        problems.append("mmap: different output")
+    if stats.hits != 2:
+        problems.append("mmap: missed the entry stored from bytes")
+    return [f"{name}: {p}" for p in problems], miss, hit
+
+
+def main():
+    logger.setLevel(logging.ERROR)
+    failures = []
+    print(f"{'program':<16} {'miss ms':>9} {'hit ms':>9}")
+    with tempfile.TemporaryDirectory() as path:
+        for name, input in sources():
+            problems, miss, hit = check(path, name, input)
+            failures.extend(problems)
+            print(f"{name:<16} {miss * 1000:>9.1f} {hit * 1000:>9.1f}")
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+(* 組とクロージャを多用する高階関数 *)
+let rec compose f g =
+  let rec composed x = g (f x) in
+  composed in
+let rec twice f =
+  let rec g x = f (f x) in
+  g in
+let rec make_adder n =
+  let rec adder x = x + n in
+  adder in
+let rec make_counter init =
+  let c = Array.create 1 init in
+  let rec next u = c.(0) <- c.(0) + 1; c.(0) in
+  let rec get u = c.(0) in
+  (next, get) in
+let rec pair x y = (x, y) in
+let rec swap p = let (x, y) = p in (y, x) in
+let rec fold f acc a i n =
+  if i >= n then acc else fold f (f acc a.(i)) a (i + 1) n in
+let rec map f a i n =
+  if i >= n then () else (a.(i) <- f a.(i); map f a (i + 1) n) in
+let a = Array.create 16 1 in
+let inc = make_adder 1 in
+let dbl = twice (make_adder 2) in
+map (compose inc dbl) a 0 16;
+let (next, get) = make_counter 10 in
+let rec sum acc x = let k = next () in acc + x + k in
+let s = fold sum 0 a 0 16 in
+let (u, v) = swap (pair s (get ())) in
+let (fa, fb) = (make_adder u, make_adder v) in
+let h = compose fa (compose fb (twice inc)) in
+let z = 1.5 in
+let rec scale k = k *. z -. 0.5 in
+let (p, q, r) = (h 3, scale 4.0, (inc, dbl)) in
+let (f1, f2) = r in
+print_int (p + f1 (f2 u));
+print_int (truncate q)
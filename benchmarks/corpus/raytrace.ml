@@ -0,0 +1,48 @@
+(* 球の集合に視線を飛ばして、各画素の明るさの合計を求める *)
+let rec dot x1 y1 z1 x2 y2 z2 = x1 *. x2 +. y1 *. y2 +. z1 *. z2 in
+let spheres = Array.create 4 (0.0, 0.0, 0.0, 0.0) in
+spheres.(0) <- (0.0, 0.0, 5.0, 1.0);
+spheres.(1) <- (2.0, 0.5, 7.0, 1.5);
+spheres.(2) <- (-2.0, -0.5, 6.0, 0.75);
+spheres.(3) <- (0.0, -101.0, 5.0, 100.0);
+let rec intersect ox oy oz dx dy dz s =
+  let (cx, cy, cz, r) = s in
+  let lx = cx -. ox in
+  let ly = cy -. oy in
+  let lz = cz -. oz in
+  let b = dot lx ly lz dx dy dz in
+  let d = b *. b -. dot lx ly lz lx ly lz +. r *. r in
+  if d < 0.0 then -1.0 else
+  let t = b -. sqrt d in
+  if t > 0.0 then t else -1.0 in
+let rec nearest ox oy oz dx dy dz i best =
+  if i < 0 then best else
+  let t = intersect ox oy oz dx dy dz spheres.(i) in
+  if t > 0.0 then
+    (if t < best then nearest ox oy oz dx dy dz (i - 1) t
+     else nearest ox oy oz dx dy dz (i - 1) best)
+  else nearest ox oy oz dx dy dz (i - 1) best in
+let rec normal i px py pz =
+  let (cx, cy, cz, r) = spheres.(i) in
+  ((px -. cx) /. r, (py -. cy) /. r, (pz -. cz) /. r) in
+let rec shade x y w h =
+  let fw = float_of_int w in
+  let fh = float_of_int h in
+  let dx = (float_of_int x -. fw *. 0.5) /. fw in
+  let dy = (float_of_int y -. fh *. 0.5) /. fh in
+  let n = sqrt (dx *. dx +. dy *. dy +. 1.0) in
+  let dx = dx /. n in
+  let dy = dy /. n in
+  let dz = 1.0 /. n in
+  let t = nearest 0.0 0.0 0.0 dx dy dz 3 1000000.0 in
+  if t < 1000000.0 then
+    let (nx, ny, nz) = normal 0 (dx *. t) (dy *. t) (dz *. t) in
+    let l = dot nx ny nz 0.577 0.577 (-0.577) in
+    let l = if l < 0.0 then 0.0 else l in
+    truncate (255.0 *. l /. (1.0 +. t *. 0.1))
+  else 0 in
+let rec row x y w h acc =
+  if x >= w then acc else row (x + 1) y w h (acc + shade x y w h) in
+let rec image y w h acc =
+  if y >= h then acc else image (y + 1) w h (row 0 y w h acc) in
+print_int (image 0 64 48 0)
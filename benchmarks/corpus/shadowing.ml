@@ -0,0 +1,18 @@
+(* 同じ名前の束縛が外側の束縛を隠すプログラム *)
+let rec f a f = a + f in
+let rec g g = g + g in
+let rec h x y =
+  let x = x + 1 in
+  let rec h x = x - y in
+  h x in
+let rec k n =
+  if n <= 0 then 0 else
+  let (n, k) = (n - 1, n) in
+  k + f n k in
+let x = 10 in
+let x = f x (g x) in
+let (x, y) = (x + 1, x) in
+let rec apply f x = f x in
+let rec f x = x - 1 in
+print_int (apply f (h x y + k 5));
+print_int (g y)
@@ -0,0 +1,113 @@
+"""ノード一つあたりの振り分けのマイクロベンチマーク
+
+    python -m benchmarks.dispatch [--nodes N] [--repeat N]
+
+generateのlet-chainとfunctionsをK正規化した式のノードを、何もしないvisit_<種類>へ
+振り分けるだけの時間を比べる。tableはvisitor.Visitorの振り分け表を一度引く方法、
+getattrは以前の各パスのようにノードごとに"visit_" + 種類の名前を作り、hasattrと
+getattrでメソッドを探す方法。
+"""
+
+import time
+import logging
+import argparse
+
+from mincaml import id
+from mincaml import ir
+from mincaml import knorm
+from mincaml import logger
+from mincaml import parser
+from mincaml import typing
+from mincaml import visitor
+
+from . import generate
+
+
+def visit_any(self, e):
+    return e
+
+
+class Table(visitor.Visitor):
+    kinds = ir.KNORMAL.kinds
+    default = visit_any
+
+    def visit(self, e):
+        return self.dispatch[e[0]](self, e)
+
+
+class Getattr:
+    def visit(self, e):
+        method = "visit_" + e[0]
+        if hasattr(self, method):
+            visitor = getattr(self, method)
+            return visitor(e)
+        else:
+            return e
+
+
+# どちらにも同じ数のvisit_<種類>を持たせる (半分の種類はメソッドを持たない)
+for kind in ir.KNORMAL.kinds[::2]:
+    setattr(Getattr, "visit_" + kind, visit_any)
+
+
+def nodes(e):
+    "K正規形の式eのすべてのノードのリスト (関数の本体も含む)"
+    fields = ir.KNORMAL.fields
+    result = []
+    stack = [e]
+    while stack:
+        e = stack.pop()
+        result.append(e)
+        for f, v in zip(fields[e[0]], e[1:]):
+            if f in ir.EXP_FIELDS:
+                stack.append(v)
+            elif f == "fundef":
+                stack.append(v.body)
+    return result
+
+
+def normalize(input):
+    with id.using(id.Supply()):
+        ast = parser.parse(input)
+        extenv = {}
+        typing.typing(ast, extenv)
+        return knorm.normalize(ast, extenv)
+
+
+def measure(visit, es, repeat):
+    "esのすべてのノードをvisitに渡す時間 (repeat回のうち最短のもの)"
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for e in es:
+            visit(e)
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    return best
+
+
+def main():
+    argparser = argparse.ArgumentParser(prog="benchmarks.dispatch")
+    argparser.add_argument(
+        "--nodes", type=int, default=1000000, help="nodes dispatched per measurement"
+    )
+    argparser.add_argument("--repeat", type=int, default=5)
+    args = argparser.parse_args()
+
+    logger.setLevel(logging.ERROR)
+    es = []
+    for shape in ("let-chain", "functions"):
+        gen, base = generate.SHAPES[shape]
+        es.extend(nodes(normalize(gen(base * 8).encode())))
+    es = (es * (args.nodes // len(es) + 1))[: args.nodes]
+
+    table = measure(Table().visit, es, args.repeat)
+    plain = measure(Getattr().visit, es, args.repeat)
+    print(f"{len(es)} nodes")
+    print(f"table   {table:.3f}s ({table / len(es) * 1e9:.0f} ns/node)")
+    print(f"getattr {plain:.3f}s ({plain / len(es) * 1e9:.0f} ns/node)")
+    print(f"speedup {plain / table:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
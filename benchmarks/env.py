@@ -0,0 +1,154 @@
+"""env.Envと、以前の各パスが使っていたpyrsistentのpmapの環境の比較
+
+    python -m benchmarks.env [--repeat N]
+
+generateの各形をK正規化した式を、パスと同じように束縛を加えながらたどり、
+変数を参照するたびに環境を引く。pmapは束縛のたびに新しい環境を作り、Envは一つの
+辞書を更新してスコープを抜けるときに巻き戻す。時間(repeat回のうち最短のもの)と、
+tracemallocで測ったたどる間の最大のメモリ使用量を比べる。
+pyrsistentがなければEnvだけを測る。
+"""
+
+import time
+import logging
+import argparse
+import tracemalloc
+
+from mincaml import ir
+from mincaml import logger
+from mincaml.env import Env
+
+from . import generate
+from .dispatch import normalize
+
+try:
+    from pyrsistent import pmap
+except ImportError:
+    pmap = None
+
+# 変数を参照するフィールド (一つの名前と、名前のリスト)
+NAME_FIELDS = frozenset(("x", "y", "z"))
+NAMES_FIELDS = frozenset(("xs", "ys"))
+
+
+def references(e):
+    "ノードeが参照する変数名の列"
+    for f, v in zip(ir.KNORMAL.fields[e[0]], e[1:]):
+        if f in NAME_FIELDS:
+            yield v
+        elif f in NAMES_FIELDS:
+            yield from v
+
+
+def walk_pmap(e):
+    "pmapの環境でeをたどり、環境で見つかった参照の数を返す"
+    found = 0
+    stack = [(pmap(), e)]
+    while stack:
+        env, e = stack.pop()
+        for x in references(e):
+            if x in env:
+                found += 1
+        kind = e[0]
+        if kind == "Let":
+            (x, t), e1, e2 = e[1:]
+            stack.append((env.set(x, t), e2))
+            stack.append((env, e1))
+        elif kind == "LetRec":
+            fundef, e2 = e[1:]
+            env = env.set(fundef.name, fundef.typ)
+            stack.append((env, e2))
+            stack.append((env.update(dict(fundef.args)), fundef.body))
+        elif kind == "LetTuple":
+            stack.append((env.update(dict(e[1])), e[3]))
+        elif kind in ("IfEq", "IfLE"):
+            stack.append((env, e[4]))
+            stack.append((env, e[3]))
+    return found
+
+
+def walk_env(e):
+    "Envでeをたどり、環境で見つかった参照の数を返す"
+    found = 0
+    env = Env()
+    # 印は式を積んだときの環境で、取り出したときにそこまで巻き戻す
+    stack = [(env.mark(), e)]
+    while stack:
+        mark, e = stack.pop()
+        env.undo(mark)
+        for x in references(e):
+            if x in env:
+                found += 1
+        kind = e[0]
+        if kind == "Let":
+            # 巻き戻しでは束縛を足せないので、先にxを束縛してe1もその環境でたどる
+            # (α変換の後なのでe1がxを参照することはない)
+            (x, t), e1, e2 = e[1:]
+            env.bind(x, t)
+            mark = env.mark()
+            stack.append((mark, e2))
+            stack.append((mark, e1))
+        elif kind == "LetRec":
+            fundef, e2 = e[1:]
+            env.bind(fundef.name, fundef.typ)
+            stack.append((env.mark(), e2))
+            env.update(fundef.args)
+            stack.append((env.mark(), fundef.body))
+        elif kind == "LetTuple":
+            env.update(e[1])
+            stack.append((env.mark(), e[3]))
+        elif kind in ("IfEq", "IfLE"):
+            mark = env.mark()
+            stack.append((mark, e[4]))
+            stack.append((mark, e[3]))
+    return found
+
+
+def measure(walk, e, repeat):
+    "(見つかった参照の数, 最短の時間, 最大のメモリ使用量)"
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = walk(e)
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    tracemalloc.start()
+    try:
+        walk(e)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return found, best, peak
+
+
+def main():
+    argparser = argparse.ArgumentParser(prog="benchmarks.env")
+    argparser.add_argument("--repeat", type=int, default=5)
+    args = argparser.parse_args()
+
+    logger.setLevel(logging.ERROR)
+    walks = [("env", walk_env)]
+    if pmap is None:
+        print("pyrsistent is not installed; measuring env.Env only")
+    else:
+        walks.append(("pmap", walk_pmap))
+    print(
+        f"{'shape':<10} {'n':>6} "
+        + " ".join(f"{w + ' ms':>9} {'KB':>7}" for w, _ in walks)
+    )
+    for shape, (gen, base) in generate.SHAPES.items():
+        n = base * 16
+        e = normalize(gen(n).encode())
+        cells = []
+        counts = set()
+        for _, walk in walks:
+            found, t, peak = measure(walk, e, args.repeat)
+            counts.add(found)
+            cells.append(f"{t * 1000:>9.1f} {peak // 1024:>7}")
+        if len(counts) != 1:
+            raise ValueError(f"{shape}: environments disagree ({sorted(counts)})")
+        print(f"{shape:<10} {n:>6} " + " ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
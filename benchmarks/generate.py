@@ -0,0 +1,187 @@
+"""型の付く合成プログラムの生成器
+
+どの形も大きさnに比例した長さのプログラムを作るので、nを倍にしたときに
+コンパイル時間が倍より大きく伸びるパスがあれば、その形で分かる。
+"""
+
+import random
+import itertools
+
+
+def let_chain(n):
+    "n個のletが続く一本の長い式"
+    lines = ["let x0 = read_int () in", "let x1 = x0 + 1 in"]
+    for i in range(2, n + 1):
+        op = "+" if i % 2 == 0 else "-"
+        lines.append(f"let x{i} = x{i - 1} {op} x{i - 2} in")
+    lines.append(f"print_int x{n}")
+    return "\n".join(lines)
+
+
+def functions(n):
+    "n個の小さな関数と、それらを順に呼び出す式"
+    lines = []
+    for i in range(n):
+        lines.append(
+            f"let rec f{i} x y = let a = x + {i} in let b = y *. {i % 13}.5 in "
+            f"if a <= 0 then b else b -. {i % 7}.25 in"
+        )
+    lines.append("let s0 = 0.0 in")
+    for i in range(n):
+        lines.append(f"let s{i + 1} = s{i} +. f{i} {i} 1.0 in")
+    lines.append(f"print_int (truncate s{n})")
+    return "\n".join(lines)
+
+
+def nesting(n):
+    "深さnの入れ子のif式と、束縛する式の中の深さnのlet"
+    cond = ["let rec f x ="]
+    for i in range(n):
+        cond.append(f"  if x <= {i} then {i} else")
+    cond.append(f"  {n} in")
+    bound = ["let y ="]
+    for i in range(n):
+        bound.append(f"  let y{i} = read_int () + {i} in")
+    bound.append("  " + " + ".join(f"y{i}" for i in range(min(n, 8))) + " in")
+    return "\n".join(cond + bound + ["print_int (f y)"])
+
+
+def floats(n):
+    "n個の異なる浮動小数点数の定数を使う式"
+    lines = ["let d0 = float_of_int (read_int ()) in"]
+    for i in range(1, n + 1):
+        lines.append(f"let d{i} = d{i - 1} *. 1.{i % 10}{i} +. {i}.25 in")
+    lines.append(f"print_int (truncate d{n})")
+    return "\n".join(lines)
+
+
+def tuples(n):
+    """深さがnまで伸びる入れ子の組と、それぞれの深さの組を受け取るn個の関数
+
+    組の型の大きさが深さに比例するので、型の全体を何度もたどる型推論は二乗になる。
+    """
+    lines = ["let t0 = (read_int (), 0) in", "let s0 = 0 in"]
+    for i in range(1, n + 1):
+        lines.append(f"let t{i} = (t{i - 1}, {i}) in")
+        lines.append(f"let rec f{i} t = let (u, x) = t in x + {i} in")
+        lines.append(f"let s{i} = s{i - 1} + f{i} t{i} in")
+    lines.append(f"print_int s{n}")
+    return "\n".join(lines)
+
+
+def bindings(n):
+    """n個の束縛が続く式 (使われない変数と、自由変数を持つ関数を交互に含む)
+
+    束縛ごとに本体全体の自由変数を求め直すと、不要定義削除とクロージャ変換が二乗になる。
+    """
+    lines = ["let x0 = read_int () in", "let x1 = x0 + 1 in"]
+    for i in range(2, n + 1):
+        if i % 4 == 0:
+            lines.append(f"let rec g{i} y = y + x{i - 1} - x{i - 2} in")
+            lines.append(f"let x{i} = g{i} x{i - 1} in")
+        elif i % 4 == 1:
+            lines.append(f"let u{i} = x{i - 1} + x{i - 2} in")
+            lines.append(f"let x{i} = x{i - 1} - 1 in")
+        else:
+            lines.append(f"let x{i} = x{i - 1} + x{i - 2} in")
+    lines.append(f"print_int x{n}")
+    return "\n".join(lines)
+
+
+def statements(n):
+    """;で続くn個の文 (組の分解と配列の読み書き)
+
+    組の分解の続きの式はプログラムの残り全体なので、そのたびに続きの式をたどるパスは
+    二乗になり、再帰するパスは文の数だけ深く再帰する。
+    """
+    lines = [
+        "let rec triple x = (x, x + 1, x + 2) in",
+        "let t = triple (read_int ()) in",
+        "let a = Array.make 1 0 in",
+    ]
+    for i in range(n):
+        if i % 2 == 0:
+            lines.append(f"let (p{i}, q{i}, r{i}) = t in a.(0) <- a.(0) + p{i};")
+        else:
+            lines.append(f"a.(0) <- a.(0) - {i};")
+    lines.append("print_int a.(0)")
+    return "\n".join(lines)
+
+
+def random_program(seed):
+    """乱数の種seedから作る、整数と浮動小数点数の算術・条件分岐・関数呼び出しの式
+
+    関数はそれより前に定義した関数だけを呼ぶので、必ず停止する。結果は最後にprint_intで
+    出力する。最適化やコード生成の結果を、最適化しないときの結果と比べるのに使う。
+    """
+    rng = random.Random(seed)
+    count = itertools.count(1)
+
+    def int_exp(ivars, fvars, funcs, depth):
+        c = rng.random()
+        if not ivars or c < 0.1:
+            return str(rng.randint(-5, 20))
+        if c < 0.45:
+            return f"({rng.choice(ivars)} {rng.choice('+-')} {rng.choice(ivars)})"
+        if c < 0.6 and funcs:
+            f, n = rng.choice(funcs)
+            return f"({f} {' '.join(rng.choice(ivars) for _ in range(n))})"
+        if c < 0.7 and fvars:
+            return f"(truncate ({rng.choice(fvars)} *. 0.5))"
+        if c < 0.85 and depth < 3:
+            x, y = rng.choice(ivars), rng.choice(ivars)
+            e1 = block(ivars, fvars, funcs, depth + 1, 3)
+            e2 = block(ivars, fvars, funcs, depth + 1, 3)
+            return f"(if {x} <= {y} then {e1} else {e2})"
+        return rng.choice(ivars)
+
+    def block(ivars, fvars, funcs, depth, n):
+        ivars = list(ivars)
+        fvars = list(fvars)
+        lines = []
+        for _ in range(rng.randint(1, n)):
+            if rng.random() < 0.3:
+                x = f"d{next(count)}"
+                if not fvars or rng.random() < 0.5:
+                    e = f"(float_of_int ({int_exp(ivars, fvars, funcs, depth)}))"
+                else:
+                    op = rng.choice(["+.", "-.", "*."])
+                    e = f"({rng.choice(fvars)} {op} {rng.choice(fvars)})"
+                lines.append(f"let {x} = {e} in")
+                fvars.append(x)
+            else:
+                x = f"x{next(count)}"
+                lines.append(f"let {x} = {int_exp(ivars, fvars, funcs, depth)} in")
+                ivars.append(x)
+        k = min(len(ivars), rng.randint(1, 8))
+        result = " + ".join(rng.sample(ivars, k)) if k else "0"
+        if fvars and rng.random() < 0.5:
+            result += f" + truncate ({rng.choice(fvars)})"
+        return "\n".join(lines + [result])
+
+    lines = []
+    funcs = []
+    for i in range(rng.randint(1, 4)):
+        args = [f"a{i}_{j}" for j in range(rng.randint(1, 4))]
+        body = block(args, [], funcs, 0, 12)
+        lines.append(f"let rec f{i} {' '.join(args)} = {body} in")
+        funcs.append((f"f{i}", len(args)))
+    lines.append(f"print_int ({block([], [], funcs, 0, 25)})")
+    return "\n".join(lines)
+
+
+# 形の名前から(生成器, 既定の最小の大きさ)への対応
+SHAPES = {
+    "let-chain": (let_chain, 500),
+    "functions": (functions, 50),
+    "nesting": (nesting, 25),
+    "floats": (floats, 250),
+    "tuples": (tuples, 100),
+}
+
+# 既定では測らない大きな形 (--shapeで名前を指定したときだけ測る)
+# bindingsは--steps 4で10万個の束縛に、statementsは--steps 3で20万個の文に届く
+STRESS = {
+    "bindings": (bindings, 12500),
+    "statements": (statements, 50000),
+}
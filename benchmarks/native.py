@@ -0,0 +1,283 @@
+"""x86-64の実行ファイルの出力を、最適化しないK正規形の解釈実行の結果と比べる検査
+
+    python -m benchmarks.native [--random N] [--inline N ...] [--max-calls N]
+
+corpus/の各プログラム、generateの合成プログラム、N個のrandom_programを、各インライン
+展開の閾値でコンパイルしてランタイムとリンクし、実行した標準出力を比べる。
+比べる相手は、K正規化とα変換だけを行った式をこのモジュールのInterpreterで
+実行した結果なので、最適化のパスの誤りも分かる。違うものがあれば終了ステータス1で
+終わる。解釈実行で関数の呼び出しが--max-callsを超えるプログラム(ackなど)は飛ばす。
+Cコンパイラ(環境変数CCかcc)がなければ何もせずに終わる。
+"""
+
+import os
+import sys
+import math
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+
+from mincaml import id
+from mincaml import alpha
+from mincaml import knorm
+from mincaml import logger
+from mincaml import parser
+from mincaml import typing
+from mincaml.compiler import Compiler
+from mincaml.x86 import emit
+
+from . import CORPUS
+from . import generate
+
+# read_intとread_floatに与える入力
+STDIN = b"7 3 5 2 9 4 1 8 6\n" * 4
+
+
+def wrap(n):
+    "nを64ビットの符号付き整数に丸める (実行ファイルの整数と同じ)"
+    return (n + (1 << 63)) % (1 << 64) - (1 << 63)
+
+
+def truncate(d):
+    "dを0の方向に丸めた整数 (範囲外ならx86のcvttsd2siと同じく最小の整数)"
+    if -(2.0**63) <= d < 2.0**63:
+        return int(d)
+    return -(1 << 63)
+
+
+def format_float(d):
+    "libmincaml.cのprint_floatと同じ形式"
+    s = "%.12g" % d
+    if s.lstrip("-").isdigit():
+        s += "."
+    return s
+
+
+class Frame:
+    "関数の呼び出しごとの変数の表 (parentは関数を定義したところの表)"
+
+    __slots__ = ("vars", "parent")
+
+    def __init__(self, vars, parent):
+        self.vars = vars
+        self.parent = parent
+
+    def __getitem__(self, x):
+        frame = self
+        while x not in frame.vars:
+            frame = frame.parent
+        return frame.vars[x]
+
+
+class TooManyCalls(Exception):
+    pass
+
+
+class Interpreter:
+    """α変換したK正規形の式の解釈実行
+
+    α変換の後なので変数名は重ならず、一つの関数の呼び出しの中では一つの表に束縛する。
+    Letの列や末尾の呼び出しはループでたどるので、Pythonの再帰は末尾でない呼び出しと
+    束縛する式の中の入れ子の分だけになる。関数の呼び出しがmax_callsを超えると
+    TooManyCallsを投げる。
+    """
+
+    def __init__(self, stdin, max_calls):
+        self.tokens = stdin.split()[::-1]
+        self.out = bytearray()
+        self.calls = max_calls
+
+    def write(self, s):
+        self.out += s.encode()
+
+    def run(self, e):
+        self.eval(Frame({}, None), e)
+        return bytes(self.out)
+
+    def eval(self, frame, e):
+        while True:
+            kind = e[0]
+            if kind == "Let":
+                (x, _), e1, e = e[1:]
+                frame.vars[x] = self.eval(frame, e1)
+            elif kind == "LetRec":
+                fundef, e = e[1:]
+                frame.vars[fundef.name] = (fundef, frame)
+            elif kind == "LetTuple":
+                xts, y, e = e[1:]
+                for (x, _), v in zip(xts, frame[y]):
+                    frame.vars[x] = v
+            elif kind == "IfEq":
+                e = e[3] if frame[e[1]] == frame[e[2]] else e[4]
+            elif kind == "IfLE":
+                e = e[3] if frame[e[1]] <= frame[e[2]] else e[4]
+            elif kind == "App":
+                self.calls -= 1
+                if self.calls < 0:
+                    raise TooManyCalls
+                (fundef, parent), ys = frame[e[1]], e[2]
+                vars = {x: frame[y] for (x, _), y in zip(fundef.args, ys)}
+                frame, e = Frame(vars, parent), fundef.body
+            else:
+                return self.value(frame, e)
+
+    def value(self, frame, e):
+        kind = e[0]
+        if kind == "Unit":
+            return ()
+        if kind in ("Int", "Float"):
+            return e[1]
+        if kind == "Var":
+            return frame[e[1]]
+        if kind == "Neg":
+            return wrap(-frame[e[1]])
+        if kind == "Add":
+            return wrap(frame[e[1]] + frame[e[2]])
+        if kind == "Sub":
+            return wrap(frame[e[1]] - frame[e[2]])
+        if kind == "FNeg":
+            return -frame[e[1]]
+        if kind == "FAdd":
+            return frame[e[1]] + frame[e[2]]
+        if kind == "FSub":
+            return frame[e[1]] - frame[e[2]]
+        if kind == "FMul":
+            return frame[e[1]] * frame[e[2]]
+        if kind == "FDiv":
+            return frame[e[1]] / frame[e[2]]
+        if kind == "Tuple":
+            return tuple(frame[x] for x in e[1])
+        if kind == "Get":
+            return frame[e[1]][frame[e[2]]]
+        if kind == "Put":
+            frame[e[1]][frame[e[2]]] = frame[e[3]]
+            return ()
+        if kind == "ExtFunApp":
+            return self.external(e[1], [frame[y] for y in e[2]])
+        raise ValueError(f"cannot interpret {kind}")
+
+    def external(self, name, args):
+        "libmincaml.cの外部関数"
+        if name == "print_int":
+            self.write(str(args[0]))
+        elif name == "print_float":
+            self.write(format_float(args[0]))
+        elif name == "print_byte":
+            self.out.append(args[0] & 0xFF)
+        elif name == "print_newline":
+            self.write("\n")
+        elif name in ("prerr_int", "prerr_byte", "prerr_float"):
+            pass  # 標準エラー出力は比べない
+        elif name == "read_int":
+            return int(self.tokens.pop())
+        elif name == "read_float":
+            return float(self.tokens.pop())
+        elif name in ("create_array", "create_float_array"):
+            return [args[1]] * max(args[0], 0)
+        elif name == "float_of_int":
+            return float(args[0])
+        elif name in ("int_of_float", "truncate"):
+            return truncate(args[0])
+        elif name == "abs_float":
+            return abs(args[0])
+        elif name in ("sqrt", "floor", "cos", "sin", "atan"):
+            return float(getattr(math, name)(args[0]))
+        else:
+            raise ValueError(f"unknown external function {name}")
+        return ()
+
+
+def interpret(input, stdin, max_calls):
+    "ソースinputをK正規化・α変換だけして解釈実行し、標準出力を返す"
+    with id.using(id.Supply()):
+        ast = parser.parse(input)
+        extenv = {}
+        typing.typing(ast, extenv)
+        e = alpha.conversion(knorm.normalize(ast, extenv))
+    return Interpreter(stdin, max_calls).run(e)
+
+
+def execute(input, stdin, threshold, path):
+    "ソースinputをインライン展開の閾値thresholdでコンパイルし、実行して標準出力を返す"
+    compiler = Compiler(inlining_threthold=threshold)
+    emit.link(compiler.emit(compiler.compile(input)), path)
+    return subprocess.run(
+        [path], input=stdin, stdout=subprocess.PIPE, check=True, timeout=60
+    ).stdout
+
+
+def sources(n_random):
+    "(名前, ソース)の列"
+    for fname in sorted(os.listdir(CORPUS)):
+        if fname.endswith(".ml"):
+            with open(os.path.join(CORPUS, fname), "rb") as fp:
+                yield fname, fp.read()
+    for shape, (gen, n) in generate.SHAPES.items():
+        yield f"{shape} {n}", gen(n).encode()
+    for seed in range(n_random):
+        yield f"random {seed}", generate.random_program(seed).encode()
+
+
+def run(args):
+    if shutil.which(os.environ.get("CC", "cc")) is None:
+        print("no C compiler; skipped")
+        return 0
+    thresholds = args.inline or [0, 10]
+    failures = 0
+    count = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "a.out")
+        for name, input in sources(args.random):
+            try:
+                expected = interpret(input, STDIN, args.max_calls)
+            except TooManyCalls:
+                print(f"{name}: skipped (more than {args.max_calls} calls)")
+                continue
+            for threshold in thresholds:
+                count += 1
+                try:
+                    output = execute(input, STDIN, threshold, path)
+                except Exception as e:
+                    output = f"{type(e).__name__}: {e}".encode()
+                if output != expected:
+                    failures += 1
+                    print(f"{name} (inline {threshold}): {output!r} != {expected!r}")
+    print(f"{count} executables, {failures} different")
+    return 1 if failures else 0
+
+
+def main():
+    argparser = argparse.ArgumentParser(prog="benchmarks.native")
+    argparser.add_argument(
+        "--random", type=int, default=100, help="number of random programs"
+    )
+    argparser.add_argument(
+        "--inline",
+        type=int,
+        action="append",
+        help="inlining threshold (repeatable; default: 0 and 10)",
+    )
+    argparser.add_argument(
+        "--max-calls",
+        type=int,
+        default=1000000,
+        help="skip programs making more calls than this when interpreted",
+    )
+    args = argparser.parse_args()
+
+    logger.setLevel(logging.ERROR)
+    # 末尾でない再帰呼び出しの深いプログラムも解釈できるよう、大きなスタックのスレッドで実行する
+    sys.setrecursionlimit(1000000)
+    threading.stack_size(512 * 1024 * 1024)
+    status = []
+    thread = threading.Thread(target=lambda: status.append(run(args)))
+    thread.start()
+    thread.join()
+    sys.exit(status[0] if status else 2)
+
+
+if __name__ == "__main__":
+    main()
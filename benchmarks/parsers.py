@@ -0,0 +1,128 @@
+"""二つの構文解析器 (PLYとrdparser) が同じ構文木を作るかの検査
+
+    python -m benchmarks.parsers
+
+corpus/の各プログラム、generateの合成プログラム、文法の境目を突く短い式を両方の
+構文解析器で解析し、ノードの種類・属性・範囲(span)がすべて一致するかを調べる。
+一致しないものがあれば終了ステータス1で終わる。速さはpython -m benchmarks --parser rd
+のparseの段階で比べる。
+"""
+
+import os
+import sys
+import logging
+
+from mincaml import id
+from mincaml import logger
+from mincaml import types
+from mincaml import syntax
+from mincaml import parser
+
+from . import CORPUS
+from . import generate
+
+# 優先順位・結合性・ぶら下がりelseなど、二つの構文解析器で食い違いやすい式
+EDGE_CASES = (
+    "if a then if b then 1 else 2 else 3",
+    "if a then 1 else if b then 2 else 3",
+    "1 + 2 - 3 + 4",
+    "1.0 +. 2.0 *. 3.0 /. 4.0 -. 5.0",
+    "- 1 - - 2",
+    "-. 1.5 +. -1.5",
+    "- 1.5",
+    "f x y - g (-1) z",
+    "f (g x) y.(0) (h, i)",
+    "a.(i).(j) <- b.(j) + 1",
+    "a.(i) <- 1; b.(j) <- 2; c",
+    "x; y; z",
+    "let x = 1 in let y = 2 in x; y",
+    "let (a, b, c) = t in a + b + c",
+    "let rec f x y = x y in let rec g _ = f in g",
+    "1, 2, (3, 4)",
+    "x = y, x <> y, x < y, x > y, x <= y, x >= y",
+    "not a = b",
+    "if not (a <= b) then () else print_int (a - b)",
+    "Array.create n (Array.make m 0.0)",
+    "let x = if a then b else c in x",
+    "(let x = 1 in x) + 2",
+    "f -1",
+    "let _ = g () in h ()",
+)
+
+
+def shape(v):
+    "構文木のノード以外の属性値を比べられる形にする (型変数は中身だけを見る)"
+    t = type(v)
+    if t is types.Var:
+        return "Var" if v.ref.contents is None else shape(v.ref.contents)
+    if t is list or t is tuple:
+        return tuple(shape(u) for u in v)
+    if isinstance(v, (types.Premitive, types.Composite)):
+        return str(v)
+    return v
+
+
+def difference(a, b):
+    "構文木aとbの最初の違いの説明 (同じならNone)"
+    stack = [(a, b, syntax.kind_of(a))]
+    while stack:
+        a, b, path = stack.pop()
+        if type(a) is not type(b):
+            return f"{path}: {type(a).__name__} != {type(b).__name__}"
+        if not isinstance(a, syntax.Node):
+            if shape(a) != shape(b):
+                return f"{path}: {shape(a)!r} != {shape(b)!r}"
+            continue
+        if a.span != b.span:
+            return f"{path}.span: {a.span:#x} != {b.span:#x}"
+        for field in a.__slots__:
+            x, y = getattr(a, field), getattr(b, field)
+            if field in a.child_fields and type(x) is list:
+                if len(x) != len(y):
+                    return f"{path}.{field}: {len(x)} != {len(y)} elements"
+                for i, (u, v) in enumerate(zip(x, y)):
+                    stack.append((u, v, f"{path}.{field}[{i}]"))
+            else:
+                stack.append((x, y, f"{path}.{field}"))
+    return None
+
+
+def parse(input, backend):
+    # 一時変数の名前も比べるので、通し番号をそろえる
+    with id.using(id.Supply()):
+        return parser.parse(input, parser=backend)
+
+
+def inputs():
+    "(名前, ソース)の列"
+    for fname in sorted(os.listdir(CORPUS)):
+        if fname.endswith(".ml"):
+            with open(os.path.join(CORPUS, fname), "rb") as fp:
+                yield fname, fp.read()
+    for shape_name, (gen, n) in generate.SHAPES.items():
+        yield f"{shape_name} {n}", gen(n).encode()
+    for i, s in enumerate(EDGE_CASES):
+        yield f"edge case {i}: {s}", s.encode()
+
+
+def main():
+    logger.setLevel(logging.ERROR)
+    failures = 0
+    count = 0
+    for name, input in inputs():
+        count += 1
+        e1 = parse(input, "ply")
+        e2 = parse(input, "rd")
+        if e1 is None or e2 is None:
+            reason = "syntax error"
+        else:
+            reason = difference(e1, e2)
+        if reason is not None:
+            failures += 1
+            print(f"{name}: {reason}")
+    print(f"{count} inputs, {failures} different")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""一つのプロセスの複数のスレッドで同時にコンパイルしても結果が変わらないかの検査
+
+    python -m benchmarks.threads [--threads N] [--rounds N]
+
+corpus/の各プログラムとgenerateの合成プログラムを、まず一つずつ順にコンパイルして
+アセンブリを記録する。次にthreads個のスレッドがそれぞれ別々のCompilerで、同じ
+プログラムを順番を変えてrounds回ずつコンパイルし、どれも順に作ったものと
+バイト単位で同じかを調べる。違うものや例外があれば終了ステータス1で終わる。
+スレッドが頻繁に切り替わるよう、実行中はsys.setswitchintervalを小さくする。
+"""
+
+import os
+import sys
+import random
+import logging
+import argparse
+import threading
+
+from mincaml import logger
+from mincaml import parser
+from mincaml.compiler import Compiler
+
+from . import CORPUS
+from . import generate
+
+
+def sources():
+    "(名前, ソース)の列"
+    result = []
+    for fname in sorted(os.listdir(CORPUS)):
+        if fname.endswith(".ml"):
+            with open(os.path.join(CORPUS, fname), "rb") as fp:
+                result.append((fname, fp.read()))
+    for shape, (gen, n) in generate.SHAPES.items():
+        result.append((f"{shape} {n}", gen(n).encode()))
+    return result
+
+
+def compile(input, backend):
+    compiler = Compiler(parser_backend=backend)
+    return compiler.emit(compiler.compile(input))
+
+
+def worker(seed, jobs, expected, rounds, failures):
+    "jobsを順番を変えてrounds回コンパイルし、expectedと違うものをfailuresに加える"
+    jobs = list(jobs)
+    rng = random.Random(seed)
+    for _ in range(rounds):
+        rng.shuffle(jobs)
+        for name, input, backend in jobs:
+            try:
+                asm = compile(input, backend)
+            except Exception as e:
+                failures.append(f"{name} ({backend}): {type(e).__name__}: {e}")
+                continue
+            if asm != expected[name, backend]:
+                failures.append(f"{name} ({backend}): different output")
+
+
+def main():
+    argparser = argparse.ArgumentParser(prog="benchmarks.threads")
+    argparser.add_argument("--threads", type=int, default=8)
+    argparser.add_argument(
+        "--rounds", type=int, default=2, help="compilations of each program per thread"
+    )
+    args = argparser.parse_args()
+
+    logger.setLevel(logging.ERROR)
+    jobs = [
+        (name, input, backend)
+        for name, input in sources()
+        for backend in parser.PARSERS
+    ]
+    expected = {
+        (name, backend): compile(input, backend) for name, input, backend in jobs
+    }
+
+    failures = []
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    try:
+        threads = [
+            threading.Thread(
+                target=worker, args=(i, jobs, expected, args.rounds, failures)
+            )
+            for i in range(args.threads)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    for failure in failures:
+        print(failure)
+    count = len(jobs) * args.threads * args.rounds
+    print(f"{count} compilations in {args.threads} threads, {len(failures)} failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,217 @@
 import sys
+import mmap
 import logging
-import pprint
-import functools
+import argparse
+import contextlib
 
 from . import logger
-from . import id
-from .parser import parser
-from . import typing
-from . import knorm
-from . import alpha
-from . import beta
-from . import assoc
-from . import inline
-from . import const_fold
-from . import elim
-from . import closure
-from .x86 import virtual, simm
+from . import batch
+from . import cache
+from . import stats
+from . import remarks
+from . import profiling
+from . import parser
+from .compiler import Compiler
+from .x86 import asm, emit
 
 
 handler = logging.StreamHandler(sys.stderr)
 logger.addHandler(handler)
 
 
-def compile(input, inlining_threthold, niter):
-    id.reset()
-
-    extenv = {}
-    ast = parser.parse(input)
-    typing.typing(ast, extenv)
-    e = alpha.conversion(knorm.normalize(ast, extenv))
-
-    optimizer = [
-        beta.reduction,
-        assoc.nested_let_reduction,
-        functools.partial(inline.expand, inlining_threthold),
-        const_fold.constant_folding,
-        elim.unused_definitions_elimination,
-    ]
-    for i in range(niter):
-        logger.info(f"iteration {i+1}.")
-        new_e = e
-        for f in optimizer:
-            new_e = f(new_e)
-        if new_e == e:
-            break
-        e = new_e
-
-    pipelines = [closure.conversion, virtual.generate, simm.optimize]
-    prog = e
-    for f in pipelines:
-        prog = f(prog)
-    return prog
+def compile(
+    input,
+    inlining_threthold,
+    niter,
+    lexer="fast",
+    parser_backend="ply",
+    jobs=1,
+    cache=None,
+    stats=None,
+    remarks=None,
+    profiler=None,
+    asm=False,
+):
+    """呼び出しごとに新しいCompilerでinputをコンパイルする (スレッドから同時に呼べる)
+
+    asmが真なら、仮想マシンコードの代わりにアセンブリを返す。
+    """
+    compiler = Compiler(
+        inlining_threthold,
+        niter,
+        lexer,
+        parser_backend,
+        jobs,
+        cache,
+        stats,
+        remarks,
+        profiler,
+    )
+    prog = compiler.compile(input)
+    return compiler.emit(prog) if asm else prog
+
+
+@contextlib.contextmanager
+def open_source(fname):
+    "ソースファイルを読み込まずにmmapして返す"
+    with open(fname, "rb") as fp:
+        try:
+            m = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空のファイルはmmapできない
+            yield b""
+            return
+        with m:
+            yield m
 
 
 def main():
-    assert len(sys.argv) == 2, "usage: mincaml FILENAME"
-    fname = sys.argv[1]
+    argparser = argparse.ArgumentParser(prog="mincaml")
+    argparser.add_argument("filenames", nargs="*", metavar="filename")
+    argparser.add_argument("--lexer", choices=parser.LEXERS, default="fast")
+    argparser.add_argument("--parser", choices=parser.PARSERS, default="ply")
+    argparser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes for code generation, or of batch workers "
+        "(0: number of CPUs)",
+    )
+    argparser.add_argument(
+        "--batch",
+        action="store_true",
+        help="write each result next to its source (implied by several files)",
+    )
+    argparser.add_argument(
+        "--manifest", help="file listing source files to compile in batch mode"
+    )
+    argparser.add_argument(
+        "--cache-dir", help="directory of the on-disk cache of compiled programs"
+    )
+    argparser.add_argument(
+        "--cache-size",
+        type=int,
+        default=100,
+        help="maximum size of the cache in megabytes (default: 100)",
+    )
+    argparser.add_argument(
+        "--clear-cache", action="store_true", help="empty the cache before compiling"
+    )
+    argparser.add_argument(
+        "--stats",
+        nargs="?",
+        const="table",
+        choices=("table", "json"),
+        help="print the time and IR size of each pass to stderr",
+    )
+    argparser.add_argument(
+        "--remarks",
+        metavar="FILE",
+        help="write optimization remarks as JSON lines to FILE (-: stderr)",
+    )
+    argparser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="profile each stage with cProfile, writing DIR/<n>-<stage>.prof "
+        "and printing the hottest functions to stderr",
+    )
+    argparser.add_argument(
+        "-S",
+        "--asm",
+        action="store_true",
+        help="print x86-64 assembly instead of the virtual machine code",
+    )
+    argparser.add_argument(
+        "-o",
+        "--output",
+        metavar="FILE",
+        help="link the assembly with the runtime into the executable FILE",
+    )
+    argparser.add_argument(
+        "-v", "--verbose", action="store_true", help="log progress messages"
+    )
+    args = argparser.parse_args()
+    if args.verbose:
+        logger.setLevel(logging.INFO)
 
     inlining_threthold = 0
     niter = 1000
 
-    with open(fname) as fp:
-        input = fp.read()
-    prog = compile(input, inlining_threthold, niter)
-    pprint.pprint(prog)
+    filenames = args.filenames
+    if args.manifest is not None:
+        filenames = filenames + batch.read_manifest(args.manifest)
+    if not filenames:
+        argparser.error("no source files")
+
+    compile_cache = None
+    if args.cache_dir is not None:
+        compile_cache = cache.Cache(args.cache_dir, args.cache_size * 1024 * 1024)
+        if args.clear_cache:
+            compile_cache.clear()
+
+    if args.batch or args.manifest is not None or len(filenames) > 1:
+        if args.stats is not None:
+            argparser.error("--stats cannot be used in batch mode")
+        if args.remarks is not None:
+            argparser.error("--remarks cannot be used in batch mode")
+        if args.profile is not None:
+            argparser.error("--profile cannot be used in batch mode")
+        if args.asm or args.output is not None:
+            argparser.error("-S and -o cannot be used in batch mode")
+        result = batch.run(
+            filenames,
+            jobs=args.jobs,
+            inlining_threthold=inlining_threthold,
+            niter=niter,
+            lexer=args.lexer,
+            parser_backend=args.parser,
+            cache=compile_cache,
+        )
+        for fname, error in result.errors:
+            logger.error(f"{fname}: {error}")
+        print(result)
+        if result.errors:
+            sys.exit(1)
+        return
+
+    pass_stats = None if args.stats is None else stats.Stats()
+    profiler = None if args.profile is None else profiling.Profiler(args.profile)
+    with contextlib.ExitStack() as stack:
+        opt_remarks = None
+        if args.remarks == "-":
+            opt_remarks = remarks.Remarks(sys.stderr)
+        elif args.remarks is not None:
+            opt_remarks = remarks.Remarks(stack.enter_context(open(args.remarks, "w")))
+        input = stack.enter_context(open_source(filenames[0]))
+        prog = compile(
+            input,
+            inlining_threthold,
+            niter,
+            lexer=args.lexer,
+            parser_backend=args.parser,
+            jobs=args.jobs,
+            cache=compile_cache,
+            stats=pass_stats,
+            remarks=opt_remarks,
+            profiler=profiler,
+            asm=args.asm or args.output is not None,
+        )
+    if args.output is not None:
+        emit.link(prog, args.output)
+    elif args.asm:
+        sys.stdout.write(prog)
+    else:
+        sys.stdout.write(asm.listing(prog))
+    if pass_stats is not None:
+        if args.stats == "json":
+            print(pass_stats.to_json(), file=sys.stderr)
+        else:
+            print(pass_stats.to_table(), file=sys.stderr)
+    if profiler is not None:
+        print(profiler.report(), file=sys.stderr)
+    if compile_cache is not None:
+        logger.info(compile_cache.stats)
 
 
 if __name__ == "__main__":
@@ -1,15 +1,16 @@
-from pyrsistent import pmap
-
+from . import ir
+from . import visitor
+from .env import Env
 from .id import gen_id
 from .knorm import Fundef
 from .util import find
 
 
-class Visitor:
+class Visitor(visitor.Visitor):
+    kinds = ir.KNORMAL.kinds
+
     def visit(self, env, e):
-        method = "visit_" + e[0]
-        visitor = getattr(self, method)
-        return visitor(env, e)
+        return self.dispatch[e[0]](self, env, e)
 
     def visit_Unit(self, env, e):
         return e
@@ -62,33 +63,32 @@ class Visitor:
             self.visit(env, e[4]),
         )
 
-    def visit_Let(self, env, e):
+    def enter_Let(self, env, e):
         (x, t) = e[1]
         new_x = gen_id(x)
-        return (
-            e[0],
-            (new_x, t),
-            self.visit(env, e[2]),
-            self.visit(env.set(x, new_x), e[3]),
-        )
+        e1 = self.visit(env, e[2])
+        mark = env.mark()
+        env.bind(x, new_x)
+        return env.leave(mark, lambda e2: (e[0], (new_x, t), e1, e2)), (env,), e[3]
 
     def visit_Var(self, env, e):
         return (e[0], find(env, e[1]))
 
-    def visit_LetRec(self, env, e):
+    def enter_LetRec(self, env, e):
         fundef = e[1]
-        new_env1 = env.set(fundef.name, gen_id(fundef.name))
-        new_env2 = new_env1.update({name: gen_id(name) for name, _ in fundef.args})
-        return (
-            e[0],
-            Fundef(
+        new_name = gen_id(fundef.name)
+        mark = env.mark()
+        env.bind(fundef.name, new_name)
+        args = {name: gen_id(name) for name, _ in fundef.args}
+        # 引数が関数と同じ名前なら、本体では引数の束縛が関数の束縛を隠す
+        with env.scope(args):
+            new_fundef = Fundef(
                 typ=fundef.typ,
-                name=new_env1[fundef.name],
-                args=[(new_env2[name], t) for name, t in fundef.args],
-                body=self.visit(new_env2, fundef.body),
-            ),
-            self.visit(new_env1, e[2]),
-        )
+                name=new_name,
+                args=[(args[name], t) for name, t in fundef.args],
+                body=self.visit(env, fundef.body),
+            )
+        return env.leave(mark, lambda e2: (e[0], new_fundef, e2)), (env,), e[2]
 
     def visit_App(self, env, e):
         return (e[0], find(env, e[1]), [find(env, arg) for arg in e[2]])
@@ -96,14 +96,13 @@ class Visitor:
     def visit_Tuple(self, env, e):
         return (e[0], [find(env, name) for name in e[1]])
 
-    def visit_LetTuple(self, env, e):
-        new_env = env.update({name: gen_id(name) for name, _ in e[1]})
-        return (
-            e[0],
-            [(new_env[name], t) for name, t in e[1]],
-            find(env, e[2]),
-            self.visit(new_env, e[3]),
-        )
+    def enter_LetTuple(self, env, e):
+        new_xs = {name: gen_id(name) for name, _ in e[1]}
+        y = find(env, e[2])
+        mark = env.mark()
+        env.update(new_xs)
+        xts = [(env[name], t) for name, t in e[1]]
+        return env.leave(mark, lambda e1: (e[0], xts, y, e1)), (env,), e[3]
 
     def visit_Get(self, env, e):
         return (e[0], find(env, e[1]), find(env, e[2]))
@@ -120,5 +119,5 @@ class Visitor:
 
 def conversion(e, env=None):
     if env is None:
-        env = pmap()
+        env = Env()
     return Visitor().visit(env, e)
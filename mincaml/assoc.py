@@ -1,40 +1,54 @@
-class Visitor:
+from . import ir
+from . import visitor
+from .util import rebuild
+from .worklist import Worklist
+
+
+class Visitor(visitor.Visitor):
+    kinds = ir.KNORMAL.kinds
+    default = visitor.pass_through
+
+    def __init__(self, worklist):
+        self.worklist = worklist
+
     def visit(self, e):
-        method = "visit_" + e[0]
-        if hasattr(self, method):
-            visitor = getattr(self, method)
-            return visitor(e)
-        else:
-            return e
+        return self.dispatch[e[0]](self, e)
 
     def visit_IfEq(self, e):
-        return (e[0], e[1], e[2], self.visit(e[3]), self.visit(e[4]))
+        return rebuild(e, e[1], e[2], self.visit(e[3]), self.visit(e[4]))
 
     def visit_IfLE(self, e):
-        return (e[0], e[1], e[2], self.visit(e[3]), self.visit(e[4]))
+        return rebuild(e, e[1], e[2], self.visit(e[3]), self.visit(e[4]))
 
-    def visit_Let(self, e):
+    def enter_Let(self, e):
         xt, e1, e2 = e[1], e[2], e[3]
+        new_e1 = self.visit(e1)
+        if new_e1[0] not in ("Let", "LetRec", "LetTuple"):
+            return (lambda new_e2: rebuild(e, xt, new_e1, new_e2)), (), e2
+
+        def _insert(new_e2):
+            # new_e1の最後の式をlet xt = ... in new_e2で置き換える
+            spine = []
+            e = new_e1
+            while e[0] in ("Let", "LetRec", "LetTuple"):
+                spine.append(e)
+                e = e[-1]
+            e = ("Let", xt, e, new_e2)
+            for node in reversed(spine):
+                e = (*node[:-1], e)
+            return e
 
-        def _insert(e):
-            if e[0] == "Let":
-                return ("Let", e[1], e[2], _insert(e[3]))
-            elif e[0] == "LetRec":
-                return ("LetRec", e[1], _insert(e[2]))
-            elif e[0] == "LetTuple":
-                return ("LetTuple", e[1], e[2], _insert(e[3]))
-            else:
-                return ("Let", xt, e, self.visit(e2))
-
-        return _insert(self.visit(e1))
+        return _insert, (), e2
 
-    def visit_LetRec(self, e):
-        fundef = e[1]
-        return (e[0], fundef._replace(body=self.visit(fundef.body)), self.visit(e[2]))
+    def enter_LetRec(self, e):
+        fundef = self.worklist.visit_body(e[1], self.visit)
+        return (lambda e2: rebuild(e, fundef, e2)), (), e[2]
 
-    def visit_LetTuple(self, e):
-        return (e[0], e[1], e[2], self.visit(e[3]))
+    def enter_LetTuple(self, e):
+        return (lambda e1: rebuild(e, e[1], e[2], e1)), (), e[3]
 
 
-def nested_let_reduction(e):
-    return Visitor().visit(e)
+def nested_let_reduction(e, worklist=None):
+    if worklist is None:
+        worklist = Worklist()
+    return Visitor(worklist).visit(e)
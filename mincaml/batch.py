@@ -0,0 +1,115 @@
+"""多数のソースファイルを、起動したままのワーカープロセスでまとめてコンパイルする
+
+各ワーカーは最初に一度だけ構文解析器のテーブルを読み込んでCompilerを作り、
+割り当てられたファイルを順にコンパイルして、結果をソースファイルの隣に書き出す。
+"""
+
+import os
+import time
+import logging
+import concurrent.futures
+
+from . import logger
+from . import cache
+from .compiler import Compiler
+from .x86 import asm
+
+# ワーカーごとのCompiler (initで作り、ファイルごとに使い回す)
+_compiler = None
+
+# ワーカーに一度に渡すファイルの数の目安 (ワーカー数に対する倍率)
+CHUNKS_PER_WORKER = 4
+
+
+def init(options):
+    "ワーカーの初期化"
+    global _compiler
+    # 多数のファイルのログが混ざらないよう、エラーだけを出す
+    # (失敗したファイルはrunの結果からも分かる)
+    logger.setLevel(logging.ERROR)
+    # PLYの構文解析器のテーブルはCompilerを作るときに読み込まれる
+    _compiler = Compiler(**options)
+
+
+def output_path(fname):
+    "fnameのコンパイル結果を書き出すファイル"
+    return os.path.splitext(fname)[0] + ".out"
+
+
+def compile_file(fname):
+    """fnameをコンパイルして結果を書き出し、(行数, エラー, キャッシュの統計)を返す
+
+    成功ならエラーはNone。キャッシュを使わなければキャッシュの統計はNone。
+    """
+    if _compiler.cache is not None:
+        _compiler.cache.stats = cache.Stats()
+    try:
+        with open(fname, "rb") as fp:
+            input = fp.read()
+        prog = _compiler.compile(input)
+        with open(output_path(fname), "w") as fp:
+            fp.write(asm.listing(prog))
+    except Exception as e:
+        return 0, f"{type(e).__name__}: {e}", None
+    cache_stats = _compiler.cache and _compiler.cache.stats
+    return input.count(b"\n"), None, cache_stats
+
+
+def read_manifest(fname):
+    """マニフェストに列挙されたソースファイルのパスを返す
+
+    一行に一つのパスを書く (相対パスはマニフェストのあるディレクトリから)。
+    空行と#で始まる行は読み飛ばす。
+    """
+    base = os.path.dirname(fname)
+    with open(fname) as fp:
+        lines = [line.strip() for line in fp]
+    return [os.path.join(base, line) for line in lines if line and line[0] != "#"]
+
+
+class Stats:
+    "バッチコンパイルの結果の集計"
+
+    def __init__(self):
+        self.files = 0
+        self.lines = 0
+        self.errors = []  # (ファイル名, エラー)の列
+        self.elapsed = 0.0
+        self.cache = None  # キャッシュを使ったときのcache.Stats
+
+    def __str__(self):
+        t = self.elapsed or float("inf")
+        s = (
+            f"{self.files} files ({len(self.errors)} failed), {self.lines} lines "
+            f"in {self.elapsed:.2f}s: {self.files / t:.1f} files/s, "
+            f"{self.lines / t:.0f} lines/s"
+        )
+        if self.cache is not None:
+            s += f"\n{self.cache}"
+        return s
+
+
+def run(fnames, jobs=None, **options):
+    """fnamesの各ファイルをjobs個のワーカーでコンパイルし、集計を返す
+
+    jobsがNoneや0ならCPUの数だけワーカーを起動する。optionsはCompilerに渡す。
+    """
+    jobs = jobs or os.cpu_count() or 1
+    chunksize = max(1, len(fnames) // (jobs * CHUNKS_PER_WORKER))
+    stats = Stats()
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(
+        jobs, initializer=init, initargs=(options,)
+    ) as executor:
+        results = executor.map(compile_file, fnames, chunksize=chunksize)
+        for fname, (lines, error, cache_stats) in zip(fnames, results):
+            stats.files += 1
+            stats.lines += lines
+            if error is not None:
+                stats.errors.append((fname, error))
+            if cache_stats is not None:
+                if stats.cache is None:
+                    stats.cache = cache.Stats()
+                stats.cache += cache_stats
+    stats.elapsed = time.perf_counter() - start
+    return stats
@@ -1,14 +1,20 @@
-from pyrsistent import pmap
+from . import ir
+from . import remarks
+from . import visitor
+from .env import Env
+from .util import find, find_all, rebuild
+from .worklist import Worklist
 
-from . import logger
-from .util import find
 
+class Visitor(visitor.Visitor):
+    kinds = ir.KNORMAL.kinds
+
+    def __init__(self, worklist):
+        self.worklist = worklist
+        self.remarks = remarks.current.get()
 
-class Visitor:
     def visit(self, env, e):
-        method = "visit_" + e[0]
-        visitor = getattr(self, method)
-        return visitor(env, e)
+        return self.dispatch[e[0]](self, env, e)
 
     def visit_Unit(self, env, e):
         return e
@@ -20,32 +26,32 @@ class Visitor:
         return e
 
     def visit_Neg(self, env, e):
-        return (e[0], find(env, e[1]))
+        return rebuild(e, find(env, e[1]))
 
     def visit_Add(self, env, e):
-        return (e[0], find(env, e[1]), find(env, e[2]))
+        return rebuild(e, find(env, e[1]), find(env, e[2]))
 
     def visit_Sub(self, env, e):
-        return (e[0], find(env, e[1]), find(env, e[2]))
+        return rebuild(e, find(env, e[1]), find(env, e[2]))
 
     def visit_FNeg(self, env, e):
-        return (e[0], find(env, e[1]))
+        return rebuild(e, find(env, e[1]))
 
     def visit_FAdd(self, env, e):
-        return (e[0], find(env, e[1]), find(env, e[2]))
+        return rebuild(e, find(env, e[1]), find(env, e[2]))
 
     def visit_FSub(self, env, e):
-        return (e[0], find(env, e[1]), find(env, e[2]))
+        return rebuild(e, find(env, e[1]), find(env, e[2]))
 
     def visit_FMul(self, env, e):
-        return (e[0], find(env, e[1]), find(env, e[2]))
+        return rebuild(e, find(env, e[1]), find(env, e[2]))
 
     def visit_FDiv(self, env, e):
-        return (e[0], find(env, e[1]), find(env, e[2]))
+        return rebuild(e, find(env, e[1]), find(env, e[2]))
 
     def visit_IfEq(self, env, e):
-        return (
-            e[0],
+        return rebuild(
+            e,
             find(env, e[1]),
             find(env, e[2]),
             self.visit(env, e[3]),
@@ -53,57 +59,61 @@ class Visitor:
         )
 
     def visit_IfLE(self, env, e):
-        return (
-            e[0],
+        return rebuild(
+            e,
             find(env, e[1]),
             find(env, e[2]),
             self.visit(env, e[3]),
             self.visit(env, e[4]),
         )
 
-    def visit_Let(self, env, e):
+    def enter_Let(self, env, e):
         (x, t), e1, e2 = e[1], e[2], e[3]
         new_e1 = self.visit(env, e1)
         if new_e1[0] == "Var":
             y = new_e1[1]
-            logger.info(f"beta-reduction {x} = {y}.")
-            return self.visit(env.set(x, y), e2)
+            if self.remarks is not None:
+                self.remarks.emit("beta", "reduction", (x, y), self.function)
+            mark = env.mark()
+            env.bind(x, y)
+            return env.leave(mark), (env,), e2
         else:
-            new_e2 = self.visit(env, e2)
-            return (e[0], (x, t), new_e1, new_e2)
+            return (lambda new_e2: rebuild(e, e[1], new_e1, new_e2)), (env,), e2
 
     def visit_Var(self, env, e):
-        return (e[0], find(env, e[1]))
-
-    def visit_LetRec(self, env, e):
-        fundef = e[1]
-        return (
-            e[0],
-            fundef._replace(body=self.visit(env, fundef.body)),
-            self.visit(env, e[2]),
+        return rebuild(e, find(env, e[1]))
+
+    def enter_LetRec(self, env, e):
+        name = e[1].name
+        fundef = self.worklist.visit_body(
+            e[1], lambda body: self.within(name, self.visit, env, body), env
         )
+        return (lambda e2: rebuild(e, fundef, e2)), (env,), e[2]
 
     def visit_App(self, env, e):
-        return (e[0], find(env, e[1]), [find(env, arg) for arg in e[2]])
+        return rebuild(e, find(env, e[1]), find_all(env, e[2]))
 
     def visit_Tuple(self, env, e):
-        return (e[0], [find(env, name) for name in e[1]])
+        return rebuild(e, find_all(env, e[1]))
 
-    def visit_LetTuple(self, env, e):
-        return (e[0], e[1], find(env, e[2]), self.visit(env, e[3]))
+    def enter_LetTuple(self, env, e):
+        y = find(env, e[2])
+        return (lambda e1: rebuild(e, e[1], y, e1)), (env,), e[3]
 
     def visit_Get(self, env, e):
-        return (e[0], find(env, e[1]), find(env, e[2]))
+        return rebuild(e, find(env, e[1]), find(env, e[2]))
 
     def visit_Put(self, env, e):
-        return (e[0], find(env, e[1]), find(env, e[2]), find(env, e[3]))
+        return rebuild(e, find(env, e[1]), find(env, e[2]), find(env, e[3]))
 
     def visit_ExtArray(self, env, e):
         return e
 
     def visit_ExtFunApp(self, env, e):
-        return (e[0], e[1], [find(env, arg) for arg in e[2]])
+        return rebuild(e, e[1], find_all(env, e[2]))
 
 
-def reduction(e):
-    return Visitor().visit(pmap(), e)
+def reduction(e, worklist=None):
+    if worklist is None:
+        worklist = Worklist()
+    return Visitor(worklist).visit(Env(), e)
@@ -0,0 +1,219 @@
+"""コンパイル結果をディスクに保存する、内容アドレス方式のキャッシュ
+
+キーはソースの内容、コンパイラのバージョン(パッケージのソースのハッシュ)、
+結果に影響するオプションから作るSHA-256で、値はcompileが返すプログラムを
+pickleしてzlibで圧縮したもの。ヒットすれば構文解析・型推論・最適化をすべて省ける。
+pickleは入れ子の深さだけ再帰するので、長いletの列を含むプログラムはpickleできない。
+その場合は再帰しないserializeの形式で保存する (読むときは先頭のMAGICで見分ける)。
+
+エントリはキーの名前のファイルで、一時ファイルに書いてからos.replaceで置くので、
+複数のプロセスが同じディレクトリを同時に使っても、壊れたエントリを読むことはない。
+読んだエントリは更新時刻を新しくし、合計の大きさがmax_sizeを超えたら
+更新時刻の古いもの(最も長く使われていないもの)から消す。
+合計の大きさは、最初の保存のときにディレクトリを一度調べて求め、その後は保存した
+大きさを足して見積もる。見積もりがmax_sizeを超えたときだけディレクトリを調べ直して
+消し、そのときはmax_sizeより少し小さくなるまで消すので、保存のたびにすべての
+エントリを調べることはない。他のプロセスが保存したエントリは、次に調べ直すときに
+数えられる。
+"""
+
+import os
+import zlib
+import pickle
+import hashlib
+import tempfile
+import functools
+
+from . import ir
+from . import logger
+from . import serialize
+
+# エントリの形式を変えたら上げる
+FORMAT = 1
+
+SUFFIX = ".mcc"
+
+# 消すときは合計の大きさをmax_sizeのこの割合まで減らし、次に調べ直すまでに
+# 保存できる分を空けておく
+EVICT_TO = 0.9
+
+
+@functools.lru_cache(maxsize=None)
+def compiler_version():
+    "コンパイラのバージョン (パッケージのソースファイルの内容のハッシュ)"
+    h = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if fname.endswith(".py"):
+                path = os.path.join(dirpath, fname)
+                h.update(os.path.relpath(path, root).encode())
+                with open(path, "rb") as fp:
+                    h.update(fp.read())
+    return h.hexdigest()
+
+
+def dumps(prog):
+    "エントリの内容 (pickleできなければserializeの形式)"
+    try:
+        return pickle.dumps(prog, pickle.HIGHEST_PROTOCOL)
+    except RecursionError:
+        return serialize.dumps(prog, ir.VIRTUAL)
+
+
+def loads(data):
+    if data.startswith(serialize.MAGIC):
+        return serialize.loads(data)
+    return pickle.loads(data)
+
+
+class Stats:
+    "キャッシュのヒット・ミスの回数"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __iadd__(self, other):
+        self.hits += other.hits
+        self.misses += other.misses
+        self.stores += other.stores
+        self.evictions += other.evictions
+        return self
+
+    def __str__(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return (
+            f"cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit), "
+            f"{self.stores} stores, {self.evictions} evictions"
+        )
+
+
+class Cache:
+    "ディレクトリpathに置く、合計の大きさがmax_sizeバイトまでのキャッシュ"
+
+    def __init__(self, path, max_size=100 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.stats = Stats()
+        self.size = None  # エントリの合計の大きさの見積もり (Noneならまだ調べていない)
+
+    def key(self, input, options):
+        """ソースinputとオプションoptions (名前から値へのdict) のキー
+
+        inputはbytes・mmap・strのいずれでもよく、strは字句解析器と同じくUTF-8で
+        符号化するので、同じ内容のbytesと同じキーになる。
+        """
+        if isinstance(input, str):
+            input = input.encode()
+        h = hashlib.sha256()
+        h.update(f"{FORMAT}\0{compiler_version()}\0".encode())
+        h.update(repr(sorted(options.items())).encode())
+        h.update(b"\0")
+        h.update(input)
+        return h.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.path, key[:2], key + SUFFIX)
+
+    def get(self, key):
+        "keyの値を返す (なければNone)"
+        fname = self.entry(key)
+        try:
+            with open(fname, "rb") as fp:
+                data = fp.read()
+            value = loads(zlib.decompress(data))
+        except FileNotFoundError:
+            self.stats.misses += 1
+            return None
+        except Exception as e:
+            # 壊れたエントリは消して、ミスとして扱う
+            logger.warning(f"broken cache entry {fname}: {e}")
+            self.remove(fname)
+            self.stats.misses += 1
+            return None
+        try:
+            os.utime(fname)
+        except OSError:
+            pass  # 他のプロセスが消した
+        self.stats.hits += 1
+        return value
+
+    def put(self, key, value):
+        "keyの値をvalueにする"
+        data = zlib.compress(dumps(value))
+        fname = self.entry(key)
+        dirname = os.path.dirname(fname)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            os.replace(tmp, fname)
+        except BaseException:
+            self.remove(tmp)
+            raise
+        self.stats.stores += 1
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.entries())
+        else:
+            self.size += len(data)
+        if self.size > self.max_size:
+            self.evict()
+
+    def entries(self):
+        "(更新時刻, 大きさ, ファイル名)の列"
+        result = []
+        try:
+            dirs = os.scandir(self.path)
+        except FileNotFoundError:
+            return result
+        with dirs:
+            for d in dirs:
+                if not d.is_dir():
+                    continue
+                with os.scandir(d.path) as files:
+                    for f in files:
+                        if not f.name.endswith(SUFFIX):
+                            continue
+                        try:
+                            st = f.stat()
+                        except FileNotFoundError:
+                            continue
+                        result.append((st.st_mtime, st.st_size, f.path))
+        return result
+
+    def evict(self):
+        """合計の大きさがmax_sizeを超えていれば、max_sizeのEVICT_TOの割合以下に
+        なるまで、最も長く使われていないエントリを消す"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_size:
+            entries.sort()
+            limit = self.max_size * EVICT_TO
+            for _, size, fname in entries:
+                if total <= limit:
+                    break
+                if self.remove(fname):
+                    self.stats.evictions += 1
+                total -= size
+        self.size = total
+
+    def clear(self):
+        "すべてのエントリを消す"
+        for _, _, fname in self.entries():
+            self.remove(fname)
+        self.size = 0
+
+    @staticmethod
+    def remove(fname):
+        "fnameを消す (他のプロセスが先に消していればFalse)"
+        try:
+            os.remove(fname)
+        except FileNotFoundError:
+            return False
+        return True
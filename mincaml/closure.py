@@ -1,7 +1,10 @@
-from pyrsistent import pmap
 from collections import namedtuple
 
-from . import logger
+from . import ir
+from . import remarks
+from . import visitor
+from .env import Env
+from .util import union
 
 
 Closure = namedtuple("Closure", "entry actual_fv")
@@ -9,116 +12,182 @@ Fundef = namedtuple("Fundef", "name typ args formal_fv body")
 
 
 def free_variables(e):
+    # Let・MakeCls・LetTupleの続きの式は再帰せずにたどり、内側から自由変数を集める
+    spine = []
+    while e[0] in ("Let", "MakeCls", "LetTuple"):
+        spine.append(e)
+        e = e[-1]
+
     name = e[0]
     if name in ("Unit", "Int", "Float", "ExtArray"):
-        return set()
+        fv = set()
     elif name in ("Var", "Neg", "FNeg"):
-        return {e[1]}
+        fv = {e[1]}
     elif name in ("Add", "Sub", "FAdd", "FSub", "FMul", "FDiv", "Get"):
-        return {e[1], e[2]}
+        fv = {e[1], e[2]}
     elif name in ("IfEq", "IfLE"):
         x, y, e1, e2 = e[1:]
-        return {x, y} | free_variables(e1) | free_variables(e2)
-    elif name == "Let":
-        (x, t), e1, e2 = e[1:]
-        return free_variables(e1) | (free_variables(e2) - {x})
-    elif name == "MakeCls":
-        (x, t), (l, ys), e = e[1:]
-        return (set(ys) | free_variables(e)) - {x}
+        fv = {x, y} | free_variables(e1) | free_variables(e2)
     elif name == "AppCls":
         x, ys = e[1:]
-        return {x} | set(ys)
+        fv = {x} | set(ys)
     elif name == "AppDir":
-        return set(e[2])
+        fv = set(e[2])
     elif name == "Tuple":
-        return set(e[1])
-    elif name == "LetTuple":
-        xs, y, e = e[1:]
-        return {y} | (free_variables(e) - {x for x, _ in xs})
+        fv = set(e[1])
     elif name == "Put":
-        return set(e[1:])
+        fv = set(e[1:])
     else:
         raise ValueError(f"unknown expression: {name}")
 
+    for e in reversed(spine):
+        name = e[0]
+        if name == "Let":
+            (x, _), e1 = e[1], e[2]
+            fv.discard(x)
+            fv |= free_variables(e1)
+        elif name == "MakeCls":
+            (x, _), (_, ys) = e[1], e[2]
+            fv.update(ys)
+            fv.discard(x)
+        else:  # LetTuple
+            xs, y = e[1], e[2]
+            fv.difference_update(x for x, _ in xs)
+            fv.add(y)
+    return fv
+
+
+class Visitor(visitor.Visitor):
+    """クロージャ変換した式と、その自由変数の集合の組を返すVisitor
+
+    自由変数の集合は部分式のものから一度だけ組み立てるので、
+    関数定義ごとに変換後の本体を走査し直すことはない。
+    """
+
+    kinds = ir.KNORMAL.kinds
 
-class Visitor:
     def __init__(self):
         self.toplevel = []
+        self.remarks = remarks.current.get()
 
     def visit(self, env, known, e):
-        method = "visit_" + e[0]
-        if hasattr(self, method):
-            visitor = getattr(self, method)
-            return visitor(env, known, e)
-        else:
-            return e
+        return self.dispatch[e[0]](self, env, known, e)
+
+    def default(self, env, known, e):
+        return e, free_variables(e)
 
     def visit_IfEq(self, env, known, e):
         x, y, e1, e2 = e[1:]
-        return (e[0], x, y, self.visit(env, known, e1), self.visit(env, known, e2))
+        new_e1, fv1 = self.visit(env, known, e1)
+        new_e2, fv2 = self.visit(env, known, e2)
+        fv = union(fv1, fv2)
+        fv.update((x, y))
+        return (e[0], x, y, new_e1, new_e2), fv
 
     def visit_IfLE(self, env, known, e):
         x, y, e1, e2 = e[1:]
-        return (e[0], x, y, self.visit(env, known, e1), self.visit(env, known, e2))
+        new_e1, fv1 = self.visit(env, known, e1)
+        new_e2, fv2 = self.visit(env, known, e2)
+        fv = union(fv1, fv2)
+        fv.update((x, y))
+        return (e[0], x, y, new_e1, new_e2), fv
 
-    def visit_Let(self, env, known, e):
+    def enter_Let(self, env, known, e):
         (x, t), e1, e2 = e[1:]
-        return (
-            e[0],
-            (x, t),
-            self.visit(env, known, e1),
-            self.visit(env.set(x, t), known, e2),
-        )
-
-    def visit_LetRec(self, env, known, e):
+        new_e1, fv1 = self.visit(env, known, e1)
+
+        def leave(result):
+            new_e2, fv2 = result
+            fv2.discard(x)
+            return (e[0], (x, t), new_e1, new_e2), union(fv1, fv2)
+
+        mark = env.mark()
+        env.bind(x, t)
+        return env.leave(mark, leave), (env, known), e2
+
+    def enter_LetRec(self, env, known, e):
         # 関数定義let rec x y1 ... yn = e1 in e2の場合は、
         # xが自由変数を含まないと仮定して、クロージャー変換を行う
         (x, t, yts, e1), e2 = e[1], e[2]
-        toplevel_backup = self.toplevel[:]
-        new_env = env.set(x, t)
-        new_known = known | {x}  # knownにxを追加する
-        new_e1 = self.visit(new_env.update(dict(yts)), new_known, e1)
+        n_toplevel = len(self.toplevel)
+        mark, known_mark = env.mark(), known.mark()
+        env.bind(x, t)
+        known.bind(x, True)  # knownにxを追加する
+        # 試しの変換の報告は、やり直さないと決まってから書き出す
+        outer = self.remarks
+        if outer is not None:
+            self.remarks = remarks.Buffer(outer)
+        try:
+            with env.scope(yts):
+                new_e1, fv1 = self.within(x, self.visit, env, known, e1)
+        finally:
+            trial, self.remarks = self.remarks, outer
         # 自由変数がなかったか、new_e1を確認する
         # NOTE: new_e1にx自身が変数として出現する場合はclosureが必要
-        zs = free_variables(new_e1) - {y for y, _ in yts}
-        if len(zs) > 0:
+        zs = fv1 - {y for y, _ in yts}
+        if len(zs) == 0:
+            if trial is not None:
+                trial.commit()
+        else:
             # NOTE: new_e1に自由変数が含まれているので、toplevelを復元してクロージャー変換をやり直す
-            logger.info(f"free variable(s) {zs} found in function {x}.")
-            logger.info(f"function {x} cannot be directly applied in fact.")
-            self.toplevel = toplevel_backup
-            new_known = known
-            new_e1 = self.visit(env.update(dict(yts)), known, e1)
+            if self.remarks is not None:
+                self.remarks.emit(
+                    "closure", "free-variables", (x, *sorted(zs)), self.function
+                )
+            del self.toplevel[n_toplevel:]
+            known.undo(known_mark)
+            env.undo(mark)
+            with env.scope(yts):
+                new_e1, fv1 = self.within(x, self.visit, env, known, e1)
+            env.bind(x, t)
         # xをtoplevelに追加する
-        zs = free_variables(new_e1) - ({x} | {y for y, _ in yts})
-        zts = [(z, new_env[z]) for z in zs]
+        zs = fv1 - ({x} | {y for y, _ in yts})
+        zts = [(z, env[z]) for z in zs]
         self.toplevel.append(Fundef(x, t, yts, zts, new_e1))
-        # e2のクロージャー変換を行う
-        new_e2 = self.visit(new_env, new_known, e2)
-        if x in free_variables(new_e2):
-            # new_e2にxが変数として出現するので、クロージャーを生成する
-            return ("MakeCls", (x, t), Closure(x, zs), new_e2)
-        else:
-            logger.info(f"eliminating closure(s) {x}.")
-            return new_e2
+
+        # e2のクロージャー変換の結果から、クロージャーが必要か判定する
+        def leave(result):
+            new_e2, fv2 = result
+            if x in fv2:
+                # new_e2にxが変数として出現するので、クロージャーを生成する
+                fv2.discard(x)
+                fv2 |= zs
+                return ("MakeCls", (x, t), Closure(x, zs), new_e2), fv2
+            else:
+                if self.remarks is not None:
+                    self.remarks.emit("closure", "unused-closure", (x,), self.function)
+                return new_e2, fv2
+
+        return known.leave(known_mark, env.leave(mark, leave)), (env, known), e2
 
     def visit_App(self, env, known, e):
         x, ys = e[1:]
         if x in known:
-            logger.info(f"directly applying {x}.")
-            return ("AppDir", x, ys)
+            if self.remarks is not None:
+                self.remarks.emit("closure", "direct-call", (x,), self.function)
+            return ("AppDir", x, ys), set(ys)
         else:
-            return ("AppCls", x, ys)
+            return ("AppCls", x, ys), {x, *ys}
 
-    def visit_LetTuple(self, env, known, e):
+    def enter_LetTuple(self, env, known, e):
         xts, y, e1 = e[1:]
-        return (e[0], xts, y, self.visit(env.update(dict(xts)), known, e1))
+
+        def leave(result):
+            new_e1, fv = result
+            fv.difference_update(x for x, _ in xts)
+            fv.add(y)
+            return (e[0], xts, y, new_e1), fv
+
+        mark = env.mark()
+        env.update(xts)
+        return env.leave(mark, leave), (env, known), e1
 
     def visit_ExtFunApp(self, env, known, e):
         x, ys = e[1:]
-        return ("AppDir", "min_caml_" + x, ys)
+        return ("AppDir", "min_caml_" + x, ys), set(ys)
 
 
 def conversion(e):
     visitor = Visitor()
-    new_e = visitor.visit(pmap(), set(), e)
+    new_e, _ = visitor.visit(Env(), Env(), e)
     return visitor.toplevel, new_e
@@ -0,0 +1,176 @@
+import functools
+
+from . import logger
+from . import id
+from . import parser
+from . import typing
+from . import knorm
+from . import alpha
+from . import beta
+from . import assoc
+from . import inline
+from . import const_fold
+from . import elim
+from . import closure
+from . import remarks
+from . import worklist
+from .x86 import virtual, simm, parallel, regalloc, emit
+
+
+class Compiler:
+    """一つのプログラムをコンパイルするのに必要な状態をまとめたもの
+
+    変数名の通し番号(id.Supply)、字句解析器と構文解析器(parser.Parser)、
+    外部変数の型環境extenvをコンパイラごとに持つので、別々のCompilerは
+    異なるスレッドで同時に使える。一つのCompilerは続けて何度使ってもよいが、
+    同時に使ってはならない。
+
+    jobsが1でなければ、仮想マシンコードの生成と即値最適化をトップレベルの関数ごとに
+    jobs個のプロセスで並列に行う (Noneや0ならCPUの数)。結果は逐次の場合と同じになる。
+
+    cache (cache.Cache) を渡すと、同じソースを同じオプションでコンパイルした結果を
+    キャッシュから返し、構文解析以降をすべて省く。ただしstats・remarks・profilerの
+    どれかを渡したときは、パスを実行しなければならないのでキャッシュを使わない。
+
+    stats (stats.Stats) を渡すと、各パスの時間と中間表現の大きさを記録する。
+    remarks (remarks.Remarks) を渡すと、最適化の報告を書き出す。
+    profiler (profiling.Profiler) を渡すと、段階ごとのプロファイルを書き出す。
+    """
+
+    def __init__(
+        self,
+        inlining_threthold=0,
+        niter=1000,
+        lexer="fast",
+        parser_backend="ply",
+        jobs=1,
+        cache=None,
+        stats=None,
+        remarks=None,
+        profiler=None,
+    ):
+        self.inlining_threthold = inlining_threthold
+        self.niter = niter
+        self.jobs = jobs
+        self.cache = cache
+        self.stats = stats
+        self.remarks = remarks
+        self.profiler = profiler
+        self.options = {
+            "inlining_threthold": inlining_threthold,
+            "niter": niter,
+            "lexer": lexer,
+            "parser_backend": parser_backend,
+        }  # 結果に影響するオプション (jobsは結果を変えない)
+        self.parser = parser.Parser(lexer, parser_backend)
+        self.ids = id.Supply()
+        self.extenv = {}
+
+    def compile(self, input):
+        "inputをコンパイルし、即値最適化までを行った仮想マシンコードを返す"
+        # 報告やプロファイル、各パスの統計はパスを実行しなければ作れないので、
+        # キャッシュを使わない
+        if (
+            self.cache is None
+            or self.remarks is not None
+            or self.profiler is not None
+            or self.stats is not None
+        ):
+            return self.compile_uncached(input)
+        key = self.cache.key(input, self.options)
+        prog = self.cache.get(key)
+        if prog is None:
+            prog = self.compile_uncached(input)
+            self.cache.put(key, prog)
+        return prog
+
+    def compile_uncached(self, input):
+        "キャッシュを使わずにinputをコンパイルする"
+        self.ids = id.Supply()
+        self.extenv = {}
+        run = self.run
+        with id.using(self.ids), remarks.using(self.remarks):
+            ast = run("parse", self.parser.parse, input)
+            if ast is None:
+                exc = parser.ParseError(self.parser.error_span)
+                exc.location = self.parser.location(input, exc.span)
+                raise exc
+            try:
+                run("typing", self.typing, ast)
+            except typing.UnifyError as exc:
+                exc.location = self.parser.location(input, exc.span)
+                raise
+            e = run("knorm", knorm.normalize, ast, self.extenv)
+            del ast  # 構文木はもう使わないので、最適化の間は持たない
+            e = run("alpha", alpha.conversion, e)
+
+            # 各パスは変化のない式を同じオブジェクトのまま返すので、isで不動点を判定する
+            # また、worklistに記録された、前の反復で変化した関数の本体だけを再び最適化する
+            wl = worklist.Worklist()
+            optimizer = [
+                ("beta", beta.reduction),
+                ("assoc", assoc.nested_let_reduction),
+                ("inline", functools.partial(inline.expand, self.inlining_threthold)),
+                ("const_fold", const_fold.constant_folding),
+                ("elim", elim.unused_definitions_elimination),
+            ]
+            for i in range(self.niter):
+                logger.info("iteration %d.", i + 1)
+                self.set_iteration(i + 1)
+                new_e = e
+                for name, f in optimizer:
+                    new_e = run(name, f, new_e, worklist=wl)
+                if new_e is e:
+                    break
+                e = new_e
+                wl.next_iteration()
+            self.set_iteration(None)
+
+            prog = run("closure", closure.conversion, e)
+            if self.jobs == 1:
+                prog = run("virtual", virtual.generate, prog)
+                prog = run("simm", simm.optimize, prog)
+            else:
+                prog = run(
+                    "virtual+simm (parallel)",
+                    parallel.generate,
+                    prog,
+                    jobs=self.jobs,
+                )
+            return prog
+
+    def emit(self, prog):
+        """compileの結果progにレジスタを割り当て、x86-64のアセンブリを生成する
+
+        レジスタ割り当てはアセンブリを作るときだけ行うので、レジスタに収まらない数の
+        引数を取る関数を含むプログラムも、compileの仮想マシンコードまでは作れる。
+        """
+        prog = self.run("regalloc", regalloc.allocate, prog)
+        return self.run("emit", emit.emit, prog)
+
+    def typing(self, ast):
+        "型推論 (型はastの型変数への代入として残り、K正規化で読み出す)"
+        typing.typing(ast, self.extenv)
+        return ast
+
+    def set_iteration(self, n):
+        "stats・remarks・profilerに、実行中の最適化の反復n (反復の外ならNone) を知らせる"
+        if self.stats is not None:
+            self.stats.iteration = n
+            if n is not None:
+                self.stats.iterations = n
+        if self.remarks is not None:
+            self.remarks.iteration = n
+        if self.profiler is not None:
+            self.profiler.iteration = n
+
+    def run(self, name, f, *args, **kwargs):
+        """パスfを実行する
+
+        statsがあれば時間とノードの数を記録し、profilerがあればプロファイルを取る。
+        """
+        if self.profiler is not None:
+            f = self.profiler.wrap(name, f)
+        if self.stats is None:
+            return f(*args, **kwargs)
+        return self.stats.run(name, f, *args, **kwargs)
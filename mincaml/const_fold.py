@@ -1,4 +1,8 @@
-from pyrsistent import pmap
+from . import ir
+from . import visitor
+from .env import Env
+from .util import rebuild
+from .worklist import Worklist
 
 
 def is_int(env, x):
@@ -23,14 +27,15 @@ def const(env, x):
     return env[x][1]
 
 
-class Visitor:
+class Visitor(visitor.Visitor):
+    kinds = ir.KNORMAL.kinds
+    default = visitor.pass_through
+
+    def __init__(self, worklist):
+        self.worklist = worklist
+
     def visit(self, env, e):
-        method = "visit_" + e[0]
-        if hasattr(self, method):
-            visitor = getattr(self, method)
-            return visitor(env, e)
-        else:
-            return e
+        return self.dispatch[e[0]](self, env, e)
 
     def visit_Var(self, env, e):
         x = e[1]
@@ -49,7 +54,7 @@ class Visitor:
             return e
 
     def visit_Add(self, env, e):
-        x, y = e[1], e[1]
+        x, y = e[1], e[2]
         if is_int(env, x) and is_int(env, y):
             r = const(env, x) + const(env, y)
             return ("Int", r)
@@ -113,7 +118,7 @@ class Visitor:
                 return self.visit(env, e1)
             else:
                 return self.visit(env, e2)
-        return (e[0], x, y, self.visit(env, e1), self.visit(env, e2))
+        return rebuild(e, x, y, self.visit(env, e1), self.visit(env, e2))
 
     def visit_IfLE(self, env, e):
         x, y, e1, e2 = e[1:]
@@ -124,32 +129,40 @@ class Visitor:
                 return self.visit(env, e1)
             else:
                 return self.visit(env, e2)
-        return (e[0], x, y, self.visit(env, e1), self.visit(env, e2))
+        return rebuild(e, x, y, self.visit(env, e1), self.visit(env, e2))
 
-    def visit_Let(self, env, e):
+    def enter_Let(self, env, e):
         (x, t), e1, e2 = e[1:]
         new_e1 = self.visit(env, e1)
-        new_e2 = self.visit(env.set(x, new_e1), e2)
-        return (e[0], (x, t), new_e1, new_e2)
-
-    def visit_LetRec(self, env, e):
-        fundef, e2 = e[1], e[2]
+        mark = env.mark()
+        env.bind(x, new_e1)
         return (
-            e[0],
-            fundef._replace(body=self.visit(env, fundef.body)),
-            self.visit(env, e2),
+            env.leave(mark, lambda new_e2: rebuild(e, e[1], new_e1, new_e2)),
+            (env,),
+            e2,
+        )
+
+    def enter_LetRec(self, env, e):
+        fundef = self.worklist.visit_body(
+            e[1], lambda body: self.visit(env, body), env
         )
+        return (lambda e2: rebuild(e, fundef, e2)), (env,), e[2]
 
-    def visit_LetTuple(self, env, e):
+    def enter_LetTuple(self, env, e):
         xts, y, e1 = e[1:]
         if is_tuple(env, y):
-            new_e1 = self.visit(env, e1)
-            for xt, z in zip(xts, env[y][1]):
-                new_e1 = ("Let", xt, ("Var", z), new_e1)
-            return new_e1
+
+            def expand(new_e1):
+                for xt, z in zip(xts, env[y][1]):
+                    new_e1 = ("Let", xt, ("Var", z), new_e1)
+                return new_e1
+
+            return expand, (env,), e1
         else:
-            return (e[0], xts, y, self.visit(env, e1))
+            return (lambda new_e1: rebuild(e, xts, y, new_e1)), (env,), e1
 
 
-def constant_folding(e):
-    return Visitor().visit(pmap(), e)
+def constant_folding(e, worklist=None):
+    if worklist is None:
+        worklist = Worklist()
+    return Visitor(worklist).visit(Env(), e)
@@ -1,71 +1,130 @@
-from . import logger
+from . import ir
+from . import remarks
+from . import visitor
 from .knorm import free_variables
+from .util import rebuild, union
+from .worklist import Worklist
 
 
 def effect(e):
     "eに副作用があるか判定"
-    name = e[0]
-    if name == "Let":
-        return effect(e[2]) or effect(e[3])
-    elif name in ("IfEq", "IfLE"):
-        return effect(e[3]) or effect(e[4])
-    elif name == "LetRec":
-        return effect(e[2])
-    elif name == "LetTuple":
-        return effect(e[3])
-    elif name in ("App", "Put", "ExtFunApp"):
-        return True
-    else:
-        return False
-
-
-class Visitor:
+    stack = [e]
+    while stack:
+        e = stack.pop()
+        name = e[0]
+        if name == "Let":
+            stack.append(e[3])
+            stack.append(e[2])
+        elif name in ("IfEq", "IfLE"):
+            stack.append(e[4])
+            stack.append(e[3])
+        elif name == "LetRec":
+            stack.append(e[2])
+        elif name == "LetTuple":
+            stack.append(e[3])
+        elif name in ("App", "Put", "ExtFunApp"):
+            return True
+    return False
+
+
+class Visitor(visitor.Visitor):
+    """不要な定義を削除した式と、その自由変数の集合の組を返すVisitor
+
+    自由変数の集合は部分式のものから一度だけ組み立てるので、
+    束縛ごとに本体全体を走査し直すことはない。
+    """
+
+    kinds = ir.KNORMAL.kinds
+
+    def __init__(self, worklist):
+        self.worklist = worklist
+        self.remarks = remarks.current.get()
+
     def visit(self, e):
-        method = "visit_" + e[0]
-        if hasattr(self, method):
-            visitor = getattr(self, method)
-            return visitor(e)
-        else:
-            return e
+        return self.dispatch[e[0]](self, e)
+
+    def default(self, e):
+        return e, free_variables(e)
 
     def visit_IfEq(self, e):
         x, y, e1, e2 = e[1:]
-        return (e[0], x, y, self.visit(e1), self.visit(e2))
+        new_e1, fv1 = self.visit(e1)
+        new_e2, fv2 = self.visit(e2)
+        fv = union(fv1, fv2)
+        fv.update((x, y))
+        return rebuild(e, x, y, new_e1, new_e2), fv
 
     def visit_IfLE(self, e):
         x, y, e1, e2 = e[1:]
-        return (e[0], x, y, self.visit(e1), self.visit(e2))
+        new_e1, fv1 = self.visit(e1)
+        new_e2, fv2 = self.visit(e2)
+        fv = union(fv1, fv2)
+        fv.update((x, y))
+        return rebuild(e, x, y, new_e1, new_e2), fv
 
-    def visit_Let(self, e):
+    def enter_Let(self, e):
         (x, t), e1, e2 = e[1:]
-        new_e1 = self.visit(e1)
-        new_e2 = self.visit(e2)
-        if effect(new_e1) or x in free_variables(new_e2):
-            return (e[0], (x, t), new_e1, new_e2)
-        else:
-            logger.info(f"eliminating variable {x}.")
-            return new_e2
-
-    def visit_LetRec(self, e):
+        new_e1, fv1 = self.visit(e1)
+
+        def leave(result):
+            new_e2, fv2 = result
+            if effect(new_e1) or x in fv2:
+                fv2.discard(x)
+                return rebuild(e, e[1], new_e1, new_e2), union(fv1, fv2)
+            else:
+                if self.remarks is not None:
+                    self.remarks.emit("elim", "unused-variable", (x,), self.function)
+                return new_e2, fv2
+
+        return leave, (), e2
+
+    def enter_LetRec(self, e):
         fundef = e[1]
-        e2 = self.visit(e[2])
-        if fundef.name in free_variables(e2):
-            return (e[0], fundef._replace(body=self.visit(fundef.body)), e2)
-        else:
-            logger.info(f"eliminating variable {fundef.name}.")
-            return e2
-
-    def visit_LetTuple(self, e):
+
+        def leave(result):
+            e2, fv2 = result
+            if fundef.name in fv2:
+                worklist = self.worklist
+                if worklist.skip(fundef):
+                    fv1 = set(worklist.fvs[fundef.name])
+                    new_fundef = fundef
+                else:
+                    body, fv1 = self.within(fundef.name, self.visit, fundef.body)
+                    fv1.difference_update(y for y, _ in fundef.args)
+                    worklist.fvs[fundef.name] = frozenset(fv1)
+                    new_fundef = worklist.update(fundef, body)
+                fv = union(fv1, fv2)
+                fv.discard(fundef.name)
+                return rebuild(e, new_fundef, e2), fv
+            else:
+                if self.remarks is not None:
+                    self.remarks.emit(
+                        "elim", "unused-function", (fundef.name,), self.function
+                    )
+                return e2, fv2
+
+        return leave, (), e[2]
+
+    def enter_LetTuple(self, e):
         xts, y, e1 = e[1:]
         xs = [x for x, _ in xts]
-        new_e1 = self.visit(e1)
-        live = free_variables(new_e1)
-        if any(x in live for x in xs):
-            return (e[0], xts, y, new_e1)
-        else:
-            logger.info(f"eliminating variables {xs}.")
-            return new_e1
+
+        def leave(result):
+            new_e1, live = result
+            if any(x in live for x in xs):
+                live.difference_update(xs)
+                live.add(y)
+                return rebuild(e, xts, y, new_e1), live
+            else:
+                if self.remarks is not None:
+                    self.remarks.emit("elim", "unused-tuple", xs, self.function)
+                return new_e1, live
+
+        return leave, (), e1
 
 
-def unused_definitions_elimination(e):
-    return Visitor().visit(e)
+def unused_definitions_elimination(e, worklist=None):
+    if worklist is None:
+        worklist = Worklist()
+    new_e, _ = Visitor(worklist).visit(e)
+    return new_e
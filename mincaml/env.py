@@ -0,0 +1,94 @@
+import contextlib
+
+_missing = object()
+
+
+class Env:
+    """辞書と取り消しの記録(trail)によって、入れ子のスコープを表す環境
+
+    pyrsistentのpmapのように束縛のたびに新しい環境を作る代わりに、一つの辞書を
+    破壊的に更新し、上書きした束縛をtrailに積んでおく。スコープに入るときに
+    mark()で印を取り、出るときにundo(印)でそこまで巻き戻す。
+    パスは式の木を行きがけ順にたどるので、束縛と巻き戻しは常に入れ子になる。
+    """
+
+    __slots__ = ("map", "trail")
+
+    def __init__(self, items=()):
+        self.map = dict(items)
+        self.trail = []
+
+    def __contains__(self, x):
+        return x in self.map
+
+    def __getitem__(self, x):
+        return self.map[x]
+
+    def __len__(self):
+        return len(self.map)
+
+    def __iter__(self):
+        return iter(self.map)
+
+    def __repr__(self):
+        return f"Env({self.map!r})"
+
+    def get(self, x, default=None):
+        return self.map.get(x, default)
+
+    def bind(self, x, v):
+        "xをvに束縛する (以前の束縛はundoで戻る)"
+        self.trail.append((x, self.map.get(x, _missing)))
+        self.map[x] = v
+
+    def update(self, items):
+        "(x, v)の列またはdictの束縛をすべて追加する"
+        if isinstance(items, dict):
+            items = items.items()
+        for x, v in items:
+            self.bind(x, v)
+
+    def mark(self):
+        "現在のスコープの印"
+        return len(self.trail)
+
+    def undo(self, mark):
+        "印markを取った後の束縛をすべて取り消す"
+        map, trail = self.map, self.trail
+        while len(trail) > mark:
+            x, v = trail.pop()
+            if v is _missing:
+                del map[x]
+            else:
+                map[x] = v
+
+    @contextlib.contextmanager
+    def scope(self, items=()):
+        "itemsを束縛したスコープ (抜けるときに束縛を取り消す)"
+        mark = self.mark()
+        self.update(items)
+        try:
+            yield self
+        finally:
+            self.undo(mark)
+
+    def leave(self, mark, leave=None):
+        """visit_spineのleaveとして、leaveを呼んでからmarkまで巻き戻す関数を返す
+
+        enter_<種類>で束縛した変数は、続きの式をたどり終えたときに取り消される。
+        """
+        undo = self.undo
+        if leave is None:
+
+            def _leave(result):
+                undo(mark)
+                return result
+
+        else:
+
+            def _leave(result):
+                result = leave(result)
+                undo(mark)
+                return result
+
+        return _leave
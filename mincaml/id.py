@@ -1,26 +1,48 @@
+import contextlib
+import contextvars
+
 from . import types
 
-tmp_cnt = 0
+
+class Supply:
+    "変数名の通し番号の供給源 (コンパイルごとに一つ)"
+
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+    def name(self, prefix):
+        "prefixに次の通し番号を付けた変数名を返す"
+        self.count += 1
+        return f"{prefix}{self.count}"
+
+
+# 実行中のコンパイルが使うSupply
+# コンテキスト変数なので、スレッドごとに別々のコンパイルを同時に実行できる
+current = contextvars.ContextVar("mincaml.id.current", default=Supply())
 
 
-def _inc():
-    global tmp_cnt
-    tmp_cnt += 1
+@contextlib.contextmanager
+def using(supply):
+    "with文の間、このスレッドで作る変数名の通し番号をsupplyから取る"
+    token = current.set(supply)
+    try:
+        yield supply
+    finally:
+        current.reset(token)
 
 
 def reset():
-    global tmp_cnt
-    tmp_cnt = 0
+    current.get().count = 0
 
 
 def gen_id(s):
-    _inc()
-    return f"{s}.{tmp_cnt}"
+    return current.get().name(f"{s}.")
 
 
 def gen_tmp_id(t):
-    _inc()
-    return "T{}{}".format(id_of_typ(t), tmp_cnt)
+    return current.get().name(f"T{id_of_typ(t)}")
 
 
 def id_of_typ(t):
@@ -1,54 +1,85 @@
-from pyrsistent import pmap
+from collections import namedtuple
 
-from . import logger
+from . import ir
 from . import alpha
-
-
-def size(e):
-    if e[0] in ("IfEq", "IfLE"):
-        e1, e2 = e[3], e[4]
-    elif e[0] == "Let":
-        e1, e2 = e[1], e[2]
-    elif e[0] == "LetRec":
-        e1, e2 = e[1].body, e[2]
-    elif e[0] == "LetTuple":
-        return 1 + size(e[3])
-    else:
-        return 1
-
-    return 1 + size(e1) + size(e2)
-
-
-class Visitor:
-    def __init__(self, threshold):
+from . import remarks
+from . import visitor
+from .env import Env
+from .util import rebuild
+from .worklist import Worklist
+
+
+Summary = namedtuple("Summary", "body size")
+
+
+def summarize(summaries, fundef):
+    """fundefの要約(本体の大きさ)を返す
+
+    要約は関数の名前をキーにsummariesに記録しておき、本体が前回と同じオブジェクトなら
+    そのまま使う。入れ子の関数の要約も使い回すので、変化した部分だけを数え直せばよい。
+    """
+    summary = summaries.get(fundef.name)
+    if summary is not None and summary.body is fundef.body:
+        return summary
+    summary = Summary(fundef.body, size(summaries, fundef.body))
+    summaries[fundef.name] = summary
+    return summary
+
+
+def size(summaries, e):
+    "eの大きさ (入れ子の関数の大きさはsummariesの要約を使う)"
+    n = 0
+    stack = [e]
+    while stack:
+        e = stack.pop()
+        n += 1
+        name = e[0]
+        if name in ("IfEq", "IfLE"):
+            stack.append(e[3])
+            stack.append(e[4])
+        elif name == "Let":
+            stack.append(e[2])
+            stack.append(e[3])
+        elif name == "LetRec":
+            n += summarize(summaries, e[1]).size
+            stack.append(e[2])
+        elif name == "LetTuple":
+            stack.append(e[3])
+    return n
+
+
+class Visitor(visitor.Visitor):
+    kinds = ir.KNORMAL.kinds
+    default = visitor.pass_through
+
+    def __init__(self, threshold, worklist):
         self.threshold = threshold
+        self.worklist = worklist
+        self.remarks = remarks.current.get()
 
     def visit(self, env, e):
-        method = "visit_" + e[0]
-        if hasattr(self, method):
-            visitor = getattr(self, method)
-            return visitor(env, e)
-        else:
-            return e
+        return self.dispatch[e[0]](self, env, e)
 
     def visit_IfEq(self, env, e):
-        return (e[0], e[1], e[2], self.visit(env, e[3]), self.visit(env, e[4]))
+        return rebuild(e, e[1], e[2], self.visit(env, e[3]), self.visit(env, e[4]))
 
     def visit_IfLE(self, env, e):
-        return (e[0], e[1], e[2], self.visit(env, e[3]), self.visit(env, e[4]))
+        return rebuild(e, e[1], e[2], self.visit(env, e[3]), self.visit(env, e[4]))
 
-    def visit_Let(self, env, e):
-        return (e[0], e[1], self.visit(env, e[2]), self.visit(env, e[3]))
+    def enter_Let(self, env, e):
+        e1 = self.visit(env, e[2])
+        return (lambda e2: rebuild(e, e[1], e1, e2)), (env,), e[3]
 
-    def visit_LetRec(self, env, e):
+    def enter_LetRec(self, env, e):
         fundef = e[1]
-        if size(fundef.body) <= self.threshold:
-            env = env.set(fundef.name, (fundef.args, fundef.body))
-        return (
-            e[0],
-            fundef._replace(body=self.visit(env, fundef.body)),
-            self.visit(env, e[2]),
+        mark = env.mark()
+        if summarize(self.worklist.summaries, fundef).size <= self.threshold:
+            env.bind(fundef.name, (fundef.args, fundef.body))
+        name = fundef.name
+        fundef = self.worklist.visit_body(
+            fundef, lambda body: self.within(name, self.visit, env, body), env
         )
+        return env.leave(mark, lambda e2: rebuild(e, fundef, e2)), (env,), e[2]
 
     def visit_App(self, env, e):
         x, ys = e[1], e[2]
@@ -56,15 +87,18 @@ class Visitor:
             return e
 
         zs, e = env[x]
-        logger.info(f"inlining {x}.")
+        if self.remarks is not None:
+            self.remarks.emit("inline", "inline", (x,), self.function)
         new_env = {}
         for (z, t), y in zip(zs, ys):
             new_env[z] = y
-        return alpha.conversion(e, pmap(new_env))
+        return alpha.conversion(e, Env(new_env))
 
-    def visit_LetTuple(self, env, e):
-        return (e[0], e[1], e[2], self.visit(env, e[3]))
+    def enter_LetTuple(self, env, e):
+        return (lambda e1: rebuild(e, e[1], e[2], e1)), (env,), e[3]
 
 
-def expand(threshold, e):
-    return Visitor(threshold).visit(pmap(), e)
+def expand(threshold, e, worklist=None):
+    if worklist is None:
+        worklist = Worklist()
+    return Visitor(threshold, worklist).visit(Env(), e)
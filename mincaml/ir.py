@@ -0,0 +1,138 @@
+"""K正規形・クロージャ変換後・仮想マシンコードの各中間表現のスキーマ
+
+各パスはタプル ("Let", (x, t), e1, e2) のような形で中間表現を扱う。
+このモジュールはノードの表現を変えず、それぞれのノードの種類に整数のopcodeと
+フィールド名を割り当てた表だけを持つ。種類の一覧は各パスの振り分け表に、
+フィールド名は大きさの計測(stats)と直列化(serialize)に、opcodeは直列化した
+形式でのノードのタグに使う。
+(__slots__のクラスでノードを表すと、タプルより作るのがずっと遅いので使わない。)
+"""
+
+# 部分式を持つフィールド
+EXP_FIELDS = frozenset(("e", "e1", "e2", "exp"))
+
+
+class Schema:
+    """ある中間表現のノードの種類と、そのopcode・フィールドの対応
+
+    specは(種類, 空白区切りのフィールド名)の列で、並び順がopcodeになる。
+    """
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.kinds = tuple(kind for kind, _ in spec)
+        self.opcodes = {kind: op for op, kind in enumerate(self.kinds)}
+        self.fields = {kind: tuple(fields.split()) for kind, fields in spec}
+
+    def size(self, e):
+        "タプル形式の式eのノードの数 (関数の本体も含む。再帰せずに数える)"
+        fields = self.fields
+        n = 0
+        stack = [e]
+        while stack:
+            e = stack.pop()
+            n += 1
+            for f, v in zip(fields[e[0]], e[1:]):
+                if f in EXP_FIELDS:
+                    stack.append(v)
+                elif f == "fundef":
+                    stack.append(v.body)
+        return n
+
+
+# mincaml.knorm
+KNORMAL = Schema(
+    "KNORMAL",
+    (
+        ("Unit", ""),
+        ("Int", "value"),
+        ("Float", "value"),
+        ("Neg", "x"),
+        ("Add", "x y"),
+        ("Sub", "x y"),
+        ("FNeg", "x"),
+        ("FAdd", "x y"),
+        ("FSub", "x y"),
+        ("FMul", "x y"),
+        ("FDiv", "x y"),
+        ("IfEq", "x y e1 e2"),
+        ("IfLE", "x y e1 e2"),
+        ("Let", "xt e1 e2"),
+        ("Var", "x"),
+        ("LetRec", "fundef e"),
+        ("App", "x ys"),
+        ("Tuple", "xs"),
+        ("LetTuple", "xts y e"),
+        ("Get", "x y"),
+        ("Put", "x y z"),
+        ("ExtArray", "x"),
+        ("ExtFunApp", "x ys"),
+    ),
+)
+
+# mincaml.closure
+CLOSURE = Schema(
+    "CLOSURE",
+    (
+        ("Unit", ""),
+        ("Int", "value"),
+        ("Float", "value"),
+        ("Neg", "x"),
+        ("Add", "x y"),
+        ("Sub", "x y"),
+        ("FNeg", "x"),
+        ("FAdd", "x y"),
+        ("FSub", "x y"),
+        ("FMul", "x y"),
+        ("FDiv", "x y"),
+        ("IfEq", "x y e1 e2"),
+        ("IfLE", "x y e1 e2"),
+        ("Let", "xt e1 e2"),
+        ("Var", "x"),
+        ("MakeCls", "xt closure e"),
+        ("AppCls", "x ys"),
+        ("AppDir", "x ys"),
+        ("Tuple", "xs"),
+        ("LetTuple", "xts y e"),
+        ("Get", "x y"),
+        ("Put", "x y z"),
+        ("ExtArray", "x"),
+    ),
+)
+
+# mincaml.x86.asm (命令列Ans/Letと、その中の命令)
+# y'・z'のように即値も取りうるオペランドは("V", x)か("C", i)のタプルのまま持つ
+VIRTUAL = Schema(
+    "VIRTUAL",
+    (
+        ("Ans", "exp"),
+        ("Let", "xt exp e"),
+        ("Nop", ""),
+        ("Set", "i"),
+        ("SetL", "l"),
+        ("Mov", "x"),
+        ("Neg", "x"),
+        ("Add", "x y"),
+        ("Sub", "x y"),
+        ("Ld", "x y i"),
+        ("St", "x y z i"),
+        ("FMovD", "x"),
+        ("FNegD", "x"),
+        ("FAddD", "x y"),
+        ("FSubD", "x y"),
+        ("FMulD", "x y"),
+        ("FDivD", "x y"),
+        ("LdDF", "x y i"),
+        ("StDF", "x y z i"),
+        ("Comment", "s"),
+        ("IfEq", "x y e1 e2"),
+        ("IfLE", "x y e1 e2"),
+        ("IfGE", "x y e1 e2"),
+        ("IfFEq", "x y e1 e2"),
+        ("IfFLE", "x y e1 e2"),
+        ("CallCls", "x ys zs"),
+        ("CallDir", "l ys zs"),
+        ("Save", "x y"),
+        ("Restore", "x"),
+    ),
+)
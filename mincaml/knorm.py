@@ -1,8 +1,10 @@
-from pyrsistent import pmap
 from collections import namedtuple
 
 from . import types
 from . import syntax
+from . import typing
+from . import visitor
+from .env import Env
 from .id import gen_tmp_id
 
 
@@ -20,37 +22,49 @@ def factory(op, *options, flat=True):
 
 
 def free_variables(e):
+    # Let・LetRec・LetTupleの続きの式は再帰せずにたどり、内側から自由変数を集める
+    spine = []
+    while e[0] in ("Let", "LetRec", "LetTuple"):
+        spine.append(e)
+        e = e[-1]
+
     name = e[0]
     if name in ("Unit", "Int", "Float", "ExtArray"):
-        return set()
+        fv = set()
     elif name in ("Var", "Neg", "FNeg"):
-        return {e[1]}
+        fv = {e[1]}
     elif name in ("Add", "Sub", "FAdd", "FSub", "FMul", "FDiv", "Get"):
-        return {e[1], e[2]}
+        fv = {e[1], e[2]}
     elif name in ("IfEq", "IfLE"):
         x, y, e1, e2 = e[1:]
-        return {x, y} | free_variables(e1) | free_variables(e2)
-    elif name == "Let":
-        (x, t), e1, e2 = e[1:]
-        return free_variables(e1) | (free_variables(e2) - {x})
-    elif name == "LetRec":
-        fundef, e2 = e[1], e[2]
-        zs = free_variables(fundef.body) - {y for y, _ in fundef.args}
-        return (zs | free_variables(e2)) - {fundef.name}
+        fv = {x, y} | free_variables(e1) | free_variables(e2)
     elif name == "App":
-        return {e[1]} | set(e[2])
+        fv = {e[1]} | set(e[2])
     elif name == "Tuple":
-        return set(e[1])
+        fv = set(e[1])
     elif name == "ExtFunApp":
-        return set(e[2])
+        fv = set(e[2])
     elif name == "Put":
-        return set(e[1:])
-    elif name == "LetTuple":
-        xs, y, e = e[1:]
-        return {y} | (free_variables(e) - {x for x, _ in xs})
+        fv = set(e[1:])
     else:
         raise ValueError(f"unknown expression: {name}")
 
+    for e in reversed(spine):
+        name = e[0]
+        if name == "Let":
+            (x, _), e1 = e[1], e[2]
+            fv.discard(x)
+            fv |= free_variables(e1)
+        elif name == "LetRec":
+            fundef = e[1]
+            fv |= free_variables(fundef.body) - {y for y, _ in fundef.args}
+            fv.discard(fundef.name)
+        else:  # LetTuple
+            xs, y = e[1], e[2]
+            fv.difference_update(x for x, _ in xs)
+            fv.add(y)
+    return fv
+
 
 def insert_let(env, f, exps):
     letenv, args = [], []
@@ -68,14 +82,24 @@ def insert_let(env, f, exps):
     return e
 
 
-class Visitor:
+class Visitor(visitor.Visitor):
+    """K正規化を行うVisitorクラス
+
+    型推論の後の構文木の型は型変数のままなので、使うところでderefで代入された型にする。
+    """
+
+    kinds = syntax.KINDS
+    kind_of = staticmethod(syntax.kind_of)
+
     def __init__(self, extenv):
         self.extenv = extenv
+        self.memo = {}  # typing.deref_typのmemo
+
+    def deref(self, t):
+        return typing.deref_typ(t, self.memo)
 
     def visit(self, env, e):
-        method = "visit_" + e.__class__.__name__
-        visitor = getattr(self, method)
-        return visitor(env, e)
+        return self.dispatch[e.__class__.__name__](self, env, e)
 
     def visit_Const(self, env, e):
         if e.typ == types.Unit:
@@ -171,31 +195,55 @@ class Visitor:
             ),
         )
 
-    def visit_Let(self, env, e):
+    def enter_Let(self, env, e):
         e1, t1 = self.visit(env, e.bound)
-        e2, t2 = self.visit(env.set(e.name, e.typ), e.body)
-        return ("Let", (e.name, e.typ), e1, e2), t2
-
-    def visit_LetRec(self, env, e):
-        env = env.set(e.fundef.name, e.fundef.typ)
-        e2, t2 = self.visit(env, e.body)
-        e1, t1 = self.visit(env.update(dict(e.fundef.args)), e.fundef.body)
+        t = self.deref(e.typ)
+        mark = env.mark()
+        env.bind(e.name, t)
         return (
-            ("LetRec", Fundef(e.fundef.name, e.fundef.typ, e.fundef.args, e1), e2),
-            t2,
+            env.leave(
+                mark,
+                lambda result: (("Let", (e.name, t), e1, result[0]), result[1]),
+            ),
+            (env,),
+            e.body,
         )
 
+    def enter_LetRec(self, env, e):
+        typ = self.deref(e.fundef.typ)
+        args = [(x, self.deref(t)) for x, t in e.fundef.args]
+        mark = env.mark()
+        env.bind(e.fundef.name, typ)
+
+        def leave(result):
+            e2, t2 = result
+            with env.scope(args):
+                e1, t1 = self.visit(env, e.fundef.body)
+            return (("LetRec", Fundef(e.fundef.name, typ, args, e1), e2), t2)
+
+        return env.leave(mark, leave), (env,), e.body
+
     def visit_Tuple(self, env, e):
         xs = [self.visit(env, e) for e in e.elems]
         return (
             insert_let(env, factory("Tuple", flat=False), xs),
-            types.Tuple([t for _, t in xs]),
+            types.Tuple.of([t for _, t in xs]),
         )
 
-    def visit_LetTuple(self, env, e):
+    def enter_LetTuple(self, env, e):
         e1, t1 = self.visit(env, e.bound)
-        e2, t2 = self.visit(env.update(dict(e.pat)), e.body)
-        return insert_let(env, lambda x: ("LetTuple", e.pat, x, e2), [(e1, t1)]), t2
+        pat = [(x, self.deref(t)) for x, t in e.pat]
+
+        def leave(result):
+            e2, t2 = result
+            return (
+                insert_let(env, lambda x: ("LetTuple", pat, x, e2), [(e1, t1)]),
+                t2,
+            )
+
+        mark = env.mark()
+        env.update(pat)
+        return env.leave(mark, leave), (env,), e.body
 
     def visit_Var(self, env, e):
         if e.name in env:
@@ -214,7 +262,7 @@ class Visitor:
             insert_let(
                 env, factory("ExtFunApp", ctor, flat=False), [(e1, t1), (e2, t2)]
             ),
-            types.Array(t2),
+            types.Array.of(t2),
         )
 
     def visit_App(self, env, e):
@@ -269,5 +317,5 @@ class Visitor:
 
 
 def normalize(ast, extenv):
-    kform, _ = Visitor(extenv).visit(pmap(), ast)
+    kform, _ = Visitor(extenv).visit(Env(), ast)
     return kform
@@ -0,0 +1,187 @@
+import re
+
+from . import logger
+from . import types
+from .id import gen_tmp_id
+
+
+class Token:
+    "PLYのLexTokenと互換のトークン"
+
+    __slots__ = ("type", "value", "lineno", "lexpos", "endlexpos", "lexer")
+
+    def __init__(self, type, value, lineno, lexpos, endlexpos):
+        self.type = type
+        self.value = value
+        self.lineno = lineno
+        self.lexpos = lexpos
+        self.endlexpos = endlexpos  # トークンの直後の位置
+
+    def __str__(self):
+        return f"LexToken({self.type},{self.value!r},{self.lineno},{self.lexpos})"
+
+    def __repr__(self):
+        return str(self)
+
+
+# Each match is (leading blanks, token text). The alternatives follow the
+# master regex PLY builds from parser.py; the last one catches one illegal
+# (UTF-8) character so that findall() never skips input silently.
+token_re = re.compile(
+    rb"""
+    ([ \t\r]*)
+    (
+        \n+
+      | [a-z][_a-zA-Z0-9]*
+      | _
+      | \d+(?:\.\d*)?(?:[eE][+-]?\d+)?
+      | Array\.(?:create|make)
+      | <> | <= | >= | -\. | \+\. | \*\. | /\. | <-
+      | [-+.()=<>,;]
+      | [\xc0-\xff][\x80-\xbf]*
+      | [^ \t\r]
+    )
+    """,
+    re.VERBOSE,
+)
+
+comment_start_re = re.compile(rb"\(\*")
+
+# コメントの入れ子と改行だけを探すので、コメントの長さに対して線形時間で読み飛ばせる
+comment_re = re.compile(rb"\(\*|\*\)|\n")
+
+newline_re = re.compile(rb"\n")
+
+# 一度にfindallする範囲のおおよその大きさ (改行の位置で区切る)
+CHUNK_SIZE = 1 << 16
+
+reserved = {
+    "not": "NOT",
+    "if": "IF",
+    "then": "THEN",
+    "else": "ELSE",
+    "let": "LET",
+    "in": "IN",
+    "rec": "REC",
+}
+
+symbols = {
+    "Array.create": "ARRAY_CREATE",
+    "Array.make": "ARRAY_CREATE",
+    "<>": "LESS_GREATER",
+    "<=": "LESS_EQUAL",
+    ">=": "GREATER_EQUAL",
+    "-.": "MINUS_DOT",
+    "+.": "PLUS_DOT",
+    "*.": "AST_DOT",
+    "/.": "SLASH_DOT",
+    "<-": "LESS_MINUS",
+    "+": "PLUS",
+    ".": "DOT",
+    "(": "LPAREN",
+    ")": "RPAREN",
+    "-": "MINUS",
+    "=": "EQUAL",
+    "<": "LESS",
+    ">": "GREATER",
+    ",": "COMMA",
+    ";": "SEMICOLON",
+}
+
+# トークンの字面から(型, 値)を引く表
+# t_IDENTがt_BOOLより先に試されるため、PLYでもtrue/falseは識別子になる
+fixed_tokens = {
+    text.encode(): (type, text) for text, type in {**reserved, **symbols}.items()
+}
+
+
+class Lexer:
+    """parser.pyのPLY字句解析器と同じトークン列を生成する字句解析器
+
+    入力はstrのほか、bytes・mmap・memoryviewをコピーせずにそのまま走査する。
+    コメントは入れ子に対応し、線形時間で読み飛ばす。
+    """
+
+    def __init__(self):
+        self.lexdata = b""
+        self.lineno = 1
+        self._tokens = iter(())
+
+    def input(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.lexdata = data
+        self.lineno = 1
+        self._tokens = self._scan(data)
+
+    def token(self):
+        return next(self._tokens, None)
+
+    def __iter__(self):
+        return self._tokens
+
+    def _scan(self, data):
+        findall = token_re.findall
+        fixed = fixed_tokens.get
+        idents = {}
+        end = len(data)
+        pos = 0
+        while pos < end:
+            # CHUNK_SIZEより先の最初の改行か、それより前のコメントの開始位置までを
+            # 一度に字句解析する (トークンは改行をまたがない)
+            m = newline_re.search(data, pos + CHUNK_SIZE)
+            stop = end if m is None else m.start()
+            m = comment_start_re.search(data, pos, stop)
+            if m is not None:
+                stop = m.start()
+
+            for blanks, text in findall(data, pos, stop):
+                pos += len(blanks)
+                after = pos + len(text)
+                t = fixed(text)
+                if t is not None:
+                    yield Token(t[0], t[1], self.lineno, pos, after)
+                else:
+                    c = text[0]
+                    if c == 10:  # \n
+                        self.lineno += len(text)
+                    elif 97 <= c <= 122:  # a-z
+                        value = idents.get(text)
+                        if value is None:
+                            value = idents[text] = text.decode()
+                        yield Token("IDENT", value, self.lineno, pos, after)
+                    elif 48 <= c <= 57:  # 0-9
+                        try:
+                            yield Token("INT", int(text), self.lineno, pos, after)
+                        except ValueError:
+                            yield Token("FLOAT", float(text), self.lineno, pos, after)
+                    elif c == 95:  # _
+                        yield Token(
+                            "IDENT", gen_tmp_id(types.Unit), self.lineno, pos, after
+                        )
+                    else:
+                        c = text.decode(errors="replace")
+                        logger.error(f"Illegal character {repr(c)}")
+                pos = after
+
+            pos = stop
+            if pos < end and data[pos : pos + 2] == b"(*":
+                pos = self._skip_comment(data, pos + 2)
+                if pos is None:
+                    return
+
+    def _skip_comment(self, data, pos):
+        "入れ子のコメントを読み飛ばし、コメント直後の位置を返す"
+        depth = 1
+        for m in comment_re.finditer(data, pos):
+            delim = m.group()
+            if delim == b"\n":
+                self.lineno += 1
+            elif delim == b"(*":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return m.end()
+        logger.error(f"{self.lineno}: unterminated comment")
+        return None
@@ -0,0 +1,10 @@
+# lextab.py. This file automatically created by PLY (version 3.11). Don't edit!
+_tabversion   = '3.10'
+_lextokens    = set(('ARRAY_CREATE', 'AST_DOT', 'BOOL', 'COMMA', 'DOT', 'ELSE', 'EQUAL', 'FLOAT', 'GREATER', 'GREATER_EQUAL', 'IDENT', 'IF', 'IN', 'INT', 'LESS', 'LESS_EQUAL', 'LESS_GREATER', 'LESS_MINUS', 'LET', 'LPAREN', 'MINUS', 'MINUS_DOT', 'NOT', 'PLUS', 'PLUS_DOT', 'REC', 'RPAREN', 'SEMICOLON', 'SLASH_DOT', 'THEN'))
+_lexreflags   = 64
+_lexliterals  = ''
+_lexstateinfo = {'INITIAL': 'inclusive'}
+_lexstatere   = {'INITIAL': [('(?P<t_IDENT>[a-z][_a-zA-Z0-9]*)|(?P<t_underscore>_)|(?P<t_BOOL>true|false)|(?P<t_NUMBER>\\d+(\\.\\d*)?([eE][+-]?\\d+)?)|(?P<t_newline>\\n+)|(?P<t_comment>\\(\\*(.|\\n)*?\\*\\))|(?P<t_ARRAY_CREATE>Array\\.(create|make))|(?P<t_PLUS_DOT>\\+\\.)|(?P<t_AST_DOT>\\*\\.)|(?P<t_MINUS_DOT>-\\.)|(?P<t_SLASH_DOT>/\\.)|(?P<t_PLUS>\\+)|(?P<t_LESS_GREATER><>)|(?P<t_LESS_EQUAL><=)|(?P<t_GREATER_EQUAL>>=)|(?P<t_DOT>\\.)|(?P<t_LESS_MINUS><-)|(?P<t_LPAREN>\\()|(?P<t_RPAREN>\\))|(?P<t_MINUS>-)|(?P<t_EQUAL>=)|(?P<t_LESS><)|(?P<t_GREATER>>)|(?P<t_COMMA>,)|(?P<t_SEMICOLON>;)', [None, ('t_IDENT', 'IDENT'), ('t_underscore', 'underscore'), ('t_BOOL', 'BOOL'), ('t_NUMBER', 'NUMBER'), None, None, ('t_newline', 'newline'), ('t_comment', 'comment'), None, (None, 'ARRAY_CREATE'), None, (None, 'PLUS_DOT'), (None, 'AST_DOT'), (None, 'MINUS_DOT'), (None, 'SLASH_DOT'), (None, 'PLUS'), (None, 'LESS_GREATER'), (None, 'LESS_EQUAL'), (None, 'GREATER_EQUAL'), (None, 'DOT'), (None, 'LESS_MINUS'), (None, 'LPAREN'), (None, 'RPAREN'), (None, 'MINUS'), (None, 'EQUAL'), (None, 'LESS'), (None, 'GREATER'), (None, 'COMMA'), (None, 'SEMICOLON')])]}
+_lexstateignore = {'INITIAL': ' \t\r'}
+_lexstateerrorf = {'INITIAL': 't_error'}
+_lexstateeoff = {}
@@ -1,7 +1,13 @@
+import os
+import copy
+import threading
+
 import ply.lex as lex
 import ply.yacc as yacc
 
 from . import logger
+from . import lexer as fastlex
+from . import rdparser
 from . import syntax
 from . import types
 from .id import gen_tmp_id
@@ -145,6 +151,29 @@ precedence = (
 )
 
 
+def span_of(p):
+    "規則の右辺全体のソースコード上の範囲"
+    return syntax.make_span(start_of(p.slice[1]), end_of(p.slice[-1]))
+
+
+def start_of(sym):
+    if type(sym) is not yacc.YaccSymbol:
+        return sym.lexpos
+    v = sym.value
+    if type(v) is list:
+        v = v[0]
+    return v.span >> syntax.SPAN_BITS
+
+
+def end_of(sym):
+    if type(sym) is not yacc.YaccSymbol:
+        return sym.endlexpos
+    v = sym.value
+    if type(v) is list:
+        v = v[-1]
+    return v.span & syntax.SPAN_MASK
+
+
 def p_simple_exp(p):
     "exp : simple_exp"
     p[0] = p[1]
@@ -153,55 +182,57 @@ def p_simple_exp(p):
 def p_exp_group(p):
     "simple_exp : LPAREN exp RPAREN"
     p[0] = p[2]
+    p[0].span = span_of(p)
 
 
 def p_unit(p):
     "simple_exp : LPAREN RPAREN"
-    p[0] = syntax.Const(types.Unit, None)
+    p[0] = syntax.Const(types.Unit, None, span_of(p))
 
 
 def p_bool(p):
     "simple_exp : BOOL"
-    p[0] = syntax.Const(types.Bool, p[1])
+    p[0] = syntax.Const(types.Bool, p[1], span_of(p))
 
 
 def p_int(p):
     "simple_exp : INT"
-    p[0] = syntax.Const(types.Int, p[1])
+    p[0] = syntax.Const(types.Int, p[1], span_of(p))
 
 
 def p_float(p):
     "simple_exp : FLOAT"
-    p[0] = syntax.Const(types.Float, p[1])
+    p[0] = syntax.Const(types.Float, p[1], span_of(p))
 
 
 def p_var(p):
     "simple_exp : IDENT"
-    p[0] = syntax.Var(p[1])
+    p[0] = syntax.Var(p[1], span_of(p))
 
 
 def p_array_get(p):
     "simple_exp : simple_exp DOT LPAREN exp RPAREN"
-    p[0] = syntax.Get(p[1], p[4])
+    p[0] = syntax.Get(p[1], p[4], span_of(p))
 
 
 def p_not(p):
     "exp : NOT exp %prec prec_app"
-    p[0] = syntax.UnaryExp("not", p[2])
+    p[0] = syntax.UnaryExp("not", p[2], span_of(p))
 
 
 def p_uminus(p):
     "exp : MINUS exp %prec prec_unary_minus"
     if isinstance(p[2], syntax.Const) and types.is_float(p[2].typ):
         p[2].value = -p[2].value
+        p[2].span = span_of(p)
         p[0] = p[2]
     else:
-        p[0] = syntax.UnaryExp("-", p[2])
+        p[0] = syntax.UnaryExp("-", p[2], span_of(p))
 
 
 def p_fneg(p):
     "exp : MINUS_DOT exp %prec prec_unary_minus"
-    p[0] = syntax.UnaryExp("-.", p[2])
+    p[0] = syntax.UnaryExp("-.", p[2], span_of(p))
 
 
 def p_arith_exp(p):
@@ -212,7 +243,7 @@ def p_arith_exp(p):
            | exp AST_DOT exp
            | exp SLASH_DOT exp
     """
-    p[0] = syntax.BinaryExp(p[2], p[1], p[3])
+    p[0] = syntax.BinaryExp(p[2], p[1], p[3], span_of(p))
 
 
 def p_cmp_exp(p):
@@ -224,76 +255,78 @@ def p_cmp_exp(p):
            | exp GREATER_EQUAL exp
     """
     op = p[2]
+    span = span_of(p)
     if op in ("=", "<="):
-        p[0] = syntax.BinaryExp(p[2], p[1], p[3])
+        p[0] = syntax.BinaryExp(p[2], p[1], p[3], span)
     if op == "<>":
-        p[0] = syntax.UnaryExp("not", syntax.BinaryExp("=", p[1], p[3]))
+        p[0] = syntax.UnaryExp("not", syntax.BinaryExp("=", p[1], p[3], span), span)
     if op == "<":
-        p[0] = syntax.UnaryExp("not", syntax.BinaryExp("<=", p[3], p[1]))
+        p[0] = syntax.UnaryExp("not", syntax.BinaryExp("<=", p[3], p[1], span), span)
     if op == ">":
-        p[0] = syntax.UnaryExp("not", syntax.BinaryExp("<=", p[1], p[3]))
+        p[0] = syntax.UnaryExp("not", syntax.BinaryExp("<=", p[1], p[3], span), span)
     if op == ">=":
-        p[0] = syntax.BinaryExp("<=", p[3], p[1])
+        p[0] = syntax.BinaryExp("<=", p[3], p[1], span)
 
 
 def p_if(p):
     "exp : IF exp THEN exp ELSE exp  %prec prec_if"
-    p[0] = syntax.If(p[2], p[4], p[6])
+    p[0] = syntax.If(p[2], p[4], p[6], span_of(p))
 
 
 def p_let(p):
     "exp : LET IDENT EQUAL exp IN exp  %prec prec_let"
-    p[0] = syntax.Let(types.Var(), p[2], p[4], p[6])
+    p[0] = syntax.Let(types.Var(), p[2], p[4], p[6], span_of(p))
 
 
 def p_let_rec(p):
     "exp : LET REC fundef IN exp  %prec prec_let"
-    p[0] = syntax.LetRec(p[3], p[5])
+    p[0] = syntax.LetRec(p[3], p[5], span_of(p))
 
 
 def p_fun_app(p):
     "exp : simple_exp actual_args  %prec prec_app"
-    p[0] = syntax.App(p[1], p[2])
+    p[0] = syntax.App(p[1], p[2], span_of(p))
 
 
 def p_tuple(p):
     "exp : elems  %prec prec_tuple"
-    p[0] = syntax.Tuple(p[1])
+    p[0] = syntax.Tuple(p[1], span_of(p))
 
 
 def p_let_tuple(p):
     "exp : LET LPAREN pat RPAREN EQUAL exp IN exp"
-    p[0] = syntax.LetTuple(p[3], p[6], p[8])
+    p[0] = syntax.LetTuple(p[3], p[6], p[8], span_of(p))
 
 
 def p_array_put(p):
     "exp : simple_exp DOT LPAREN exp RPAREN LESS_MINUS exp"
-    p[0] = syntax.Put(p[1], p[4], p[7])
+    p[0] = syntax.Put(p[1], p[4], p[7], span_of(p))
 
 
 def p_semicolon(p):
     "exp : exp SEMICOLON exp"
-    p[0] = syntax.Let(types.Unit, gen_tmp_id(types.Unit), p[1], p[3])
+    p[0] = syntax.Let(types.Unit, gen_tmp_id(types.Unit), p[1], p[3], span_of(p))
 
 
 def p_array_create(p):
     "exp : ARRAY_CREATE simple_exp simple_exp  %prec prec_app"
-    p[0] = syntax.Array(p[2], p[3])
+    p[0] = syntax.Array(p[2], p[3], span_of(p))
 
 
 def p_funcdef(p):
     "fundef : IDENT formal_args EQUAL exp"
-    p[0] = syntax.Fundef(p[1], p[2], p[4])
+    p[0] = syntax.Fundef(p[1], p[2], p[4], span_of(p))
 
 
 def p_formal_args(p):
-    """formal_args : IDENT formal_args
+    """formal_args : formal_args IDENT
                    | IDENT
     """
     if len(p) == 2:
         p[0] = [(p[1], types.Var())]
     else:
-        p[0] = [(p[1], types.Var())] + p[2]
+        p[1].append((p[2], types.Var()))
+        p[0] = p[1]
 
 
 def p_actual_args(p):
@@ -303,7 +336,8 @@ def p_actual_args(p):
     if len(p) == 2:
         p[0] = [p[1]]
     else:
-        p[0] = p[1] + [p[2]]
+        p[1].append(p[2])
+        p[0] = p[1]
 
 
 def p_elems(p):
@@ -311,7 +345,8 @@ def p_elems(p):
              | exp COMMA exp
     """
     if isinstance(p[1], list):
-        p[0] = p[1] + [p[3]]
+        p[1].append(p[3])
+        p[0] = p[1]
     else:
         p[0] = [p[1], p[3]]
 
@@ -321,21 +356,159 @@ def p_pat(p):
            | IDENT COMMA IDENT
     """
     if isinstance(p[1], list):
-        p[0] = p[1] + [(p[3], types.Var())]
+        p[1].append((p[3], types.Var()))
+        p[0] = p[1]
     else:
         p[0] = [(p[1], types.Var()), (p[3], types.Var())]
 
 
 def p_error(p):
-    logger.error(f"{p.lineno}: syntax error at '{p.value}'")
+    if p is None:
+        logger.error("syntax error at end of input")
+    else:
+        logger.error(f"{p.lineno}: syntax error at '{p.value}'")
+
+
+# The lexer and parser tables (lextab.py and parsetab.py) are shipped inside
+# the package and loaded in optimized mode, i.e. without re-validating the
+# grammar. Run `python -m mincaml.parser --build-tables` after changing any
+# token or grammar rule above.
+TABLES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_lexer = None
+_parser = None
+_lock = threading.Lock()
+
+
+def build_tables():
+    "字句解析器と構文解析器のテーブルを生成し、パッケージ内に書き出す"
+    lexer = lex.lex()
+    lexer.writetab("lextab", TABLES_DIR)
+    yacc.yacc(debug=False, write_tables=True, outputdir=TABLES_DIR)
+
+
+def get_parser():
+    "最初に呼ばれたときにだけ、生成済みテーブルから字句解析器と構文解析器を構築する"
+    global _lexer, _parser
+    with _lock:
+        if _parser is None:
+            _lexer = lex.lex(optimize=1, outputdir=TABLES_DIR)
+            _parser = yacc.yacc(optimize=1, debug=False, outputdir=TABLES_DIR)
+    return _lexer, _parser
+
+
+def with_endlexpos(lexer):
+    "PLYの字句解析器lexerのトークンに、mincaml.lexerと同じく終了位置endlexposを付ける"
+    token = lexer.token
 
+    def token_with_end():
+        tok = token()
+        if tok is not None:
+            tok.endlexpos = lexer.lexpos
+        return tok
 
-# Build the lexer and parser
-lexer = lex.lex()
-parser = yacc.yacc()
+    lexer.token = token_with_end
+    return lexer
+
+
+class ParseError(ValueError):
+    """構文解析の失敗 (構文解析器が構文木を返さなかった)
+
+    spanは最初の構文エラーのソースコード上の範囲 (分からなければ0)、locationは
+    その(行, 列)で、Compilerがソースコードから求めて設定する。
+    """
+
+    def __init__(self, span=0):
+        self.span = span
+        self.location = None
+        super().__init__(span)
+
+    def __str__(self):
+        msg = "syntax error"
+        if self.location is not None:
+            msg = "{}:{}: {}".format(*self.location, msg)
+        return msg
+
+
+LEXERS = ("fast", "ply")
+PARSERS = ("ply", "rd")
+
+
+class Parser:
+    """字句解析器と構文解析器の組
+
+    lexerには"fast" (mincaml.lexer) か"ply" (このモジュールの規則) を、
+    parserには"ply" (このモジュールの文法) か"rd" (mincaml.rdparser) を指定する。
+    PLYの字句解析器・構文解析器は解析中の状態を自身に持つので、get_parser()で
+    構築したものを複製して使う (表は共有する)。別々のParserは異なるスレッドで
+    同時に使えるが、一つのParserを同時に使ってはならない。
+
+    構文エラーの扱いは二つの構文解析器で異なる。PLYはエラーを報告した後もトークンを
+    読み飛ばして解析を続け (エラー回復)、途中から組み立て直した構文木を返すことがある。
+    rdparserは最初のエラーを報告したところで止まり、Noneを返す。
+    構文木を返さなかったとき、error_spanは分かれば最初のエラーの範囲で、分からなければ0。
+    """
+
+    def __init__(self, lexer="fast", parser="ply"):
+        if lexer == "fast":
+            self.lexer = fastlex.Lexer()
+        elif lexer == "ply":
+            self.lexer = with_endlexpos(get_parser()[0].clone())
+        else:
+            raise ValueError(f"unknown lexer: {lexer}")
+
+        if parser == "ply":
+            self.parser = copy.copy(get_parser()[1])
+        elif parser == "rd":
+            self.parser = rdparser.Parser(self.lexer)
+        else:
+            raise ValueError(f"unknown parser: {parser}")
+        self.error_span = 0
+
+    def parse(self, input):
+        "ソースコードを構文解析する (inputはstrのほか、bytes・mmap・memoryviewも受け付ける)"
+        if isinstance(self.lexer, lex.Lexer):
+            self.lexer.lineno = 1
+            if not isinstance(input, str):
+                input = str(input, "utf-8")
+        if isinstance(self.parser, rdparser.Parser):
+            e = self.parser.parse(input)
+            self.error_span = self.parser.error_span
+            return e
+        else:
+            # PLYのp_errorはどの構文解析器のエラーかを知らないので、位置は残らない
+            self.error_span = 0
+            e = self.parser.parse(input, lexer=self.lexer)
+            # PLYの構文解析器は解析の後もスタックに構文木を残すので、手放す
+            del self.parser.symstack[:], self.parser.statestack[:]
+            return e
+
+    def location(self, input, span):
+        "parseしたinputでの範囲spanの開始位置の(行, 列) (spanが0ならNone)"
+        if not span:
+            return None
+        if isinstance(self.lexer, lex.Lexer) and not isinstance(input, str):
+            # PLYの字句解析器での位置は、復号した文字列での位置
+            input = str(input, "utf-8")
+        return syntax.location(input, span)
+
+
+def parse(input, lexer="fast", parser="ply"):
+    """ソースコードを構文解析する
+
+    inputはstrのほか、bytes・mmap・memoryviewも受け付ける。
+    lexer・parserの指定はParserと同じ。
+    """
+    return Parser(lexer, parser).parse(input)
 
 
 if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["--build-tables"]:
+        build_tables()
+        sys.exit()
+
     while True:
         try:
             s = input("> ")
@@ -343,4 +516,4 @@ if __name__ == "__main__":
             break
         if not s:
             continue
-        yacc.parse(s)
+        parse(s)
@@ -0,0 +1,71 @@
+
+# parsetab.py
+# This file is automatically generated. Do not edit.
+# pylint: disable=W,C,R
+_tabversion = '3.10'
+
+_lr_method = 'LALR'
+
+_lr_signature = 'expnonassocINrightprec_letrightSEMICOLONrightprec_ifrightLESS_MINUSnonassocprec_tupleleftCOMMAleftEQUALLESS_GREATERLESSGREATERLESS_EQUALGREATER_EQUALleftPLUSMINUSPLUS_DOTMINUS_DOTleftAST_DOTSLASH_DOTrightprec_unary_minusleftprec_appleftDOTARRAY_CREATE AST_DOT BOOL COMMA DOT ELSE EQUAL FLOAT GREATER GREATER_EQUAL IDENT IF IN INT LESS LESS_EQUAL LESS_GREATER LESS_MINUS LET LPAREN MINUS MINUS_DOT NOT PLUS PLUS_DOT REC RPAREN SEMICOLON SLASH_DOT THENexp : simple_expsimple_exp : LPAREN exp RPARENsimple_exp : LPAREN RPARENsimple_exp : BOOLsimple_exp : INTsimple_exp : FLOATsimple_exp : IDENTsimple_exp : simple_exp DOT LPAREN exp RPARENexp : NOT exp %prec prec_appexp : MINUS exp %prec prec_unary_minusexp : MINUS_DOT exp %prec prec_unary_minusexp : exp PLUS exp\n           | exp MINUS exp\n           | exp PLUS_DOT exp\n           | exp MINUS_DOT exp\n           | exp AST_DOT exp\n           | exp SLASH_DOT exp\n    exp : exp EQUAL exp\n           | exp LESS_GREATER exp\n           | exp LESS exp\n           | exp GREATER exp\n           | exp LESS_EQUAL exp\n           | exp GREATER_EQUAL exp\n    exp : IF exp THEN exp ELSE exp  %prec prec_ifexp : LET IDENT EQUAL exp IN exp  %prec prec_letexp : LET REC fundef IN exp  %prec prec_letexp : simple_exp actual_args  %prec prec_appexp : elems  %prec prec_tupleexp : LET LPAREN pat RPAREN EQUAL exp IN expexp : simple_exp DOT LPAREN exp RPAREN LESS_MINUS expexp : exp SEMICOLON expexp : ARRAY_CREATE simple_exp simple_exp  %prec prec_appfundef : IDENT formal_args EQUAL expformal_args : formal_args IDENT\n                   | IDENT\n    actual_args : actual_args simple_exp  %prec prec_app\n                   | simple_exp  %prec prec_app\n    elems : elems COMMA exp\n             | exp COMMA exp\n    pat : pat COMMA IDENT\n           | IDENT COMMA IDENT\n    '
+    
+_lr_action_items = {'NOT':([0,3,4,5,6,10,15,16,17,18,19,20,21,22,23,24,25,26,27,28,39,59,60,61,69,73,81,82,85,86,90,96,],[3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,3,]),'MINUS':([0,1,2,3,4,5,6,8,9,10,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,32,33,34,35,39,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,59,60,61,66,67,68,69,70,71,72,73,79,80,81,82,83,85,86,89,90,91,92,93,94,95,96,97,],[4,16,-1,4,4,4,4,-7,-28,4,-4,-5,-6,4,4,4,4,4,4,4,4,4,4,4,4,4,4,-37,-27,-9,-10,-11,16,4,16,-3,-12,-13,-14,-15,-16,-17,16,16,16,16,16,16,16,16,-36,4,4,4,16,-2,-32,4,16,16,16,4,16,-8,4,4,16,4,4,-8,4,16,16,16,16,16,4,16,]),'MINUS_DOT':([0,1,2,3,4,5,6,8,9,10,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,32,33,34,35,39,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,59,60,61,66,67,68,69,70,71,72,73,79,80,81,82,83,85,86,89,90,91,92,93,94,95,96,97,],[5,18,-1,5,5,5,5,-7,-28,5,-4,-5,-6,5,5,5,5,5,5,5,5,5,5,5,5,5,5,-37,-27,-9,-10,-11,18,5,18,-3,-12,-13,-14,-15,-16,-17,18,18,18,18,18,18,18,18,-36,5,5,5,18,-2,-32,5,18,18,18,5,18,-8,5,5,18,5,5,-8,5,18,18,18,18,18,5,18,]),'IF':([0,3,4,5,6,10,15,16,17,18,19,20,21,22,23,24,25,26,27,28,39,59,60,61,69,73,81,82,85,86,90,96,],[6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,]),'LET':([0,3,4,5,6,10,15,16,17,18,19,20,21,22,23,24,25,26,27,28,39,59,60,61,69,73,81,82,85,86,90,96,],[7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,]),'ARRAY_CREATE':([0,3,4,5,6,10,15,16,17,18,19,20,21,22,23,24,25,26,27,28,39,59,60,61,69,73,81,82,85,86,90,96,],[11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,11,]),'LPAREN':([0,2,3,4,5,6,7,8,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,31,39,41,42,57,58,59,60,61,67,69,73,80,81,82,85,86,89,90,96,],[10,10,10,10,10,10,38,-7,10,10,-4,-5,-6,10,10,10,10,10,10,10,10,10,10,10,10,10,10,-37,10,59,10,-3,10,69,-36,10,10,10,-2,10,10,-8,10,10,10,10,-8,10,10,]),'BOOL':([0,2,3,4,5,6,8,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,39,41,42,58,59,60,61,67,69,73,80,81,82,85,86,89,90,96,],[12,12,12,12,12,12,-7,12,12,-4,-5,-6,12,12,12,12,12,12,12,12,12,12,12,12,12,12,-37,12,12,-3,12,-36,12,12,12,-2,12,12,-8,12,12,12,12,-8,12,12,]),'INT':([0,2,3,4,5,6,8,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,39,41,42,58,59,60,61,67,69,73,80,81,82,85,86,89,90,96,],[13,13,13,13,13,13,-7,13,13,-4,-5,-6,13,13,13,13,13,13,13,13,13,13,13,13,13,13,-37,13,13,-3,13,-36,13,13,13,-2,13,13,-8,13,13,13,13,-8,13,13,]),'FLOAT':([0,2,3,4,5,6,8,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,39,41,42,58,59,60,61,67,69,73,80,81,82,85,86,89,90,96,],[14,14,14,14,14,14,-7,14,14,-4,-5,-6,14,14,14,14,14,14,14,14,14,14,14,14,14,14,-37,14,14,-3,14,-36,14,14,14,-2,14,14,-8,14,14,14,14,-8,14,14,]),'IDENT':([0,2,3,4,5,6,7,8,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,37,38,39,41,42,58,59,60,61,63,67,69,73,74,75,77,78,80,81,82,84,85,86,89,90,96,],[8,8,8,8,8,8,36,-7,8,8,-4,-5,-6,8,8,8,8,8,8,8,8,8,8,8,8,8,8,-37,8,63,65,8,-3,8,-36,8,8,8,74,-2,8,8,-35,84,87,88,-8,8,8,-34,8,8,-8,8,8,]),'$end':([1,2,8,9,12,13,14,29,30,32,33,34,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,80,83,89,91,92,95,97,],[0,-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,-3,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,-31,-39,-36,-38,-2,-32,-8,-26,-8,-24,-25,-30,-29,]),'PLUS':([1,2,8,9,12,13,14,29,30,32,33,34,35,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,70,71,72,79,80,83,89,91,92,93,94,95,97,],[15,-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,15,15,-3,-12,-13,-14,-15,-16,-17,15,15,15,15,15,15,15,15,-36,15,-2,-32,15,15,15,15,-8,15,-8,15,15,15,15,15,15,]),'PLUS_DOT':([1,2,8,9,12,13,14,29,30,32,33,34,35,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,70,71,72,79,80,83,89,91,92,93,94,95,97,],[17,-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,17,17,-3,-12,-13,-14,-15,-16,-17,17,17,17,17,17,17,17,17,-36,17,-2,-32,17,17,17,17,-8,17,-8,17,17,17,17,17,17,]),'AST_DOT':([1,2,8,9,12,13,14,29,30,32,33,34,35,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,70,71,72,79,80,83,89,91,92,93,94,95,97,],[19,-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,19,19,-3,19,19,19,19,-16,-17,19,19,19,19,19,19,19,19,-36,19,-2,-32,19,19,19,19,-8,19,-8,19,19,19,19,19,19,]),'SLASH_DOT':([1,2,8,9,12,13,14,29,30,32,33,34,35,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,70,71,72,79,80,83,89,91,92,93,94,95,97,],[20,-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,20,20,-3,20,20,20,20,-16,-17,20,20,20,20,20,20,20,20,-36,20,-2,-32,20,20,20,20,-8,20,-8,20,20,20,20,20,20,]),'EQUAL':([1,2,8,9,12,13,14,29,30,32,33,34,35,36,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,70,71,72,74,75,76,79,80,83,84,89,91,92,93,94,95,97,],[21,-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,21,61,21,-3,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,21,21,-36,21,-2,-32,21,21,21,-35,85,86,21,-8,21,-34,-8,21,21,21,21,21,21,]),'LESS_GREATER':([1,2,8,9,12,13,14,29,30,32,33,34,35,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,70,71,72,79,80,83,89,91,92,93,94,95,97,],[22,-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,22,22,-3,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,22,22,-36,22,-2,-32,22,22,22,22,-8,22,-8,22,22,22,22,22,22,]),'LESS':([1,2,8,9,12,13,14,29,30,32,33,34,35,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,70,71,72,79,80,83,89,91,92,93,94,95,97,],[23,-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,23,23,-3,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,23,23,-36,23,-2,-32,23,23,23,23,-8,23,-8,23,23,23,23,23,23,]),'GREATER':([1,2,8,9,12,13,14,29,30,32,33,34,35,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,70,71,72,79,80,83,89,91,92,93,94,95,97,],[24,-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,24,24,-3,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,24,24,-36,24,-2,-32,24,24,24,24,-8,24,-8,24,24,24,24,24,24,]),'LESS_EQUAL':([1,2,8,9,12,13,14,29,30,32,33,34,35,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,70,71,72,79,80,83,89,91,92,93,94,95,97,],[25,-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,25,25,-3,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,25,25,-36,25,-2,-32,25,25,25,25,-8,25,-8,25,25,25,25,25,25,]),'GREATER_EQUAL':([1,2,8,9,12,13,14,29,30,32,33,34,35,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,70,71,72,79,80,83,89,91,92,93,94,95,97,],[26,-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,26,26,-3,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,26,26,-36,26,-2,-32,26,26,26,26,-8,26,-8,26,26,26,26,26,26,]),'SEMICOLON':([1,2,8,9,12,13,14,29,30,32,33,34,35,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,70,71,72,79,80,83,89,91,92,93,94,95,97,],[27,-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,27,27,-3,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,27,-39,-36,-38,-2,-32,27,27,27,27,-8,27,-8,-24,27,27,27,-30,27,]),'COMMA':([1,2,8,9,12,13,14,29,30,32,33,34,35,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,64,65,66,67,68,70,71,72,79,80,83,87,88,89,91,92,93,94,95,97,],[28,-1,-7,39,-4,-5,-6,-37,-27,-9,-10,-11,28,28,-3,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,28,-39,-36,77,78,-38,-2,-32,28,28,28,28,-8,28,-40,-41,-8,28,28,28,28,28,28,]),'THEN':([2,8,9,12,13,14,29,30,32,33,34,35,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,80,83,89,91,92,95,97,],[-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,60,-3,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,-31,-39,-36,-38,-2,-32,-8,-26,-8,-24,-25,-30,-29,]),'RPAREN':([2,8,9,10,12,13,14,29,30,32,33,34,40,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,64,66,67,68,70,79,80,83,87,88,89,91,92,95,97,],[-1,-7,-28,41,-4,-5,-6,-37,-27,-9,-10,-11,67,-3,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,-31,-39,-36,76,-38,-2,-32,80,89,-8,-26,-40,-41,-8,-24,-25,-30,-29,]),'ELSE':([2,8,9,12,13,14,29,30,32,33,34,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,66,67,68,71,80,83,89,91,92,95,97,],[-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,-3,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,-31,-39,-36,-38,-2,-32,81,-8,-26,-8,-24,-25,-30,-29,]),'IN':([2,8,9,12,13,14,29,30,32,33,34,41,43,44,45,46,47,48,49,50,51,52,53,54,55,56,58,62,66,67,68,72,80,83,89,91,92,93,94,95,97,],[-1,-7,-28,-4,-5,-6,-37,-27,-9,-10,-11,-3,-12,-13,-14,-15,-16,-17,-18,-19,-20,-21,-22,-23,-31,-39,-36,73,-38,-2,-32,82,-8,-26,-8,-24,-25,-33,96,-30,-29,]),'DOT':([2,8,12,13,14,29,41,42,58,67,68,80,89,],[31,-7,-4,-5,-6,57,-3,57,57,-2,57,-8,-8,]),'REC':([7,],[37,]),'LESS_MINUS':([80,],[90,]),}
+
+_lr_action = {}
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = {}
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {'exp':([0,3,4,5,6,10,15,16,17,18,19,20,21,22,23,24,25,26,27,28,39,59,60,61,69,73,81,82,85,86,90,96,],[1,32,33,34,35,40,43,44,45,46,47,48,49,50,51,52,53,54,55,56,66,70,71,72,79,83,91,92,93,94,95,97,]),'simple_exp':([0,2,3,4,5,6,10,11,15,16,17,18,19,20,21,22,23,24,25,26,27,28,30,39,42,59,60,61,69,73,81,82,85,86,90,96,],[2,29,2,2,2,2,2,42,2,2,2,2,2,2,2,2,2,2,2,2,2,2,58,2,68,2,2,2,2,2,2,2,2,2,2,2,]),'elems':([0,3,4,5,6,10,15,16,17,18,19,20,21,22,23,24,25,26,27,28,39,59,60,61,69,73,81,82,85,86,90,96,],[9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,]),'actual_args':([2,],[30,]),'fundef':([37,],[62,]),'pat':([38,],[64,]),'formal_args':([63,],[75,]),}
+
+_lr_goto = {}
+for _k, _v in _lr_goto_items.items():
+   for _x, _y in zip(_v[0], _v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = {}
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> exp","S'",1,None,None,None),
+  ('exp -> simple_exp','exp',1,'p_simple_exp','parser.py',152),
+  ('simple_exp -> LPAREN exp RPAREN','simple_exp',3,'p_exp_group','parser.py',157),
+  ('simple_exp -> LPAREN RPAREN','simple_exp',2,'p_unit','parser.py',162),
+  ('simple_exp -> BOOL','simple_exp',1,'p_bool','parser.py',167),
+  ('simple_exp -> INT','simple_exp',1,'p_int','parser.py',172),
+  ('simple_exp -> FLOAT','simple_exp',1,'p_float','parser.py',177),
+  ('simple_exp -> IDENT','simple_exp',1,'p_var','parser.py',182),
+  ('simple_exp -> simple_exp DOT LPAREN exp RPAREN','simple_exp',5,'p_array_get','parser.py',187),
+  ('exp -> NOT exp','exp',2,'p_not','parser.py',192),
+  ('exp -> MINUS exp','exp',2,'p_uminus','parser.py',197),
+  ('exp -> MINUS_DOT exp','exp',2,'p_fneg','parser.py',206),
+  ('exp -> exp PLUS exp','exp',3,'p_arith_exp','parser.py',211),
+  ('exp -> exp MINUS exp','exp',3,'p_arith_exp','parser.py',212),
+  ('exp -> exp PLUS_DOT exp','exp',3,'p_arith_exp','parser.py',213),
+  ('exp -> exp MINUS_DOT exp','exp',3,'p_arith_exp','parser.py',214),
+  ('exp -> exp AST_DOT exp','exp',3,'p_arith_exp','parser.py',215),
+  ('exp -> exp SLASH_DOT exp','exp',3,'p_arith_exp','parser.py',216),
+  ('exp -> exp EQUAL exp','exp',3,'p_cmp_exp','parser.py',222),
+  ('exp -> exp LESS_GREATER exp','exp',3,'p_cmp_exp','parser.py',223),
+  ('exp -> exp LESS exp','exp',3,'p_cmp_exp','parser.py',224),
+  ('exp -> exp GREATER exp','exp',3,'p_cmp_exp','parser.py',225),
+  ('exp -> exp LESS_EQUAL exp','exp',3,'p_cmp_exp','parser.py',226),
+  ('exp -> exp GREATER_EQUAL exp','exp',3,'p_cmp_exp','parser.py',227),
+  ('exp -> IF exp THEN exp ELSE exp','exp',6,'p_if','parser.py',243),
+  ('exp -> LET IDENT EQUAL exp IN exp','exp',6,'p_let','parser.py',248),
+  ('exp -> LET REC fundef IN exp','exp',5,'p_let_rec','parser.py',253),
+  ('exp -> simple_exp actual_args','exp',2,'p_fun_app','parser.py',258),
+  ('exp -> elems','exp',1,'p_tuple','parser.py',263),
+  ('exp -> LET LPAREN pat RPAREN EQUAL exp IN exp','exp',8,'p_let_tuple','parser.py',268),
+  ('exp -> simple_exp DOT LPAREN exp RPAREN LESS_MINUS exp','exp',7,'p_array_put','parser.py',273),
+  ('exp -> exp SEMICOLON exp','exp',3,'p_semicolon','parser.py',278),
+  ('exp -> ARRAY_CREATE simple_exp simple_exp','exp',3,'p_array_create','parser.py',283),
+  ('fundef -> IDENT formal_args EQUAL exp','fundef',4,'p_funcdef','parser.py',288),
+  ('formal_args -> formal_args IDENT','formal_args',2,'p_formal_args','parser.py',293),
+  ('formal_args -> IDENT','formal_args',1,'p_formal_args','parser.py',294),
+  ('actual_args -> actual_args simple_exp','actual_args',2,'p_actual_args','parser.py',304),
+  ('actual_args -> simple_exp','actual_args',1,'p_actual_args','parser.py',305),
+  ('elems -> elems COMMA exp','elems',3,'p_elems','parser.py',315),
+  ('elems -> exp COMMA exp','elems',3,'p_elems','parser.py',316),
+  ('pat -> pat COMMA IDENT','pat',3,'p_pat','parser.py',326),
+  ('pat -> IDENT COMMA IDENT','pat',3,'p_pat','parser.py',327),
+]
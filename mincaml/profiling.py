@@ -0,0 +1,67 @@
+"""コンパイルの段階ごとのプロファイル (--profile)
+
+Compilerにprofilerを渡すと、各段階をcProfileで別々に測り、ディレクトリに
+<通し番号>-<段階>[-<反復>].profとして書き出す。最適化のパスは反復ごとに別のファイルになる。
+書き出したファイルはpstatsやsnakevizなどで読める。
+"""
+
+import io
+import os
+import re
+import pstats
+import cProfile
+
+
+class Profiler:
+    "段階ごとのプロファイルをディレクトリdirectoryに書き出す"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.iteration = None  # 実行中の最適化の反復 (反復の外ならNone)
+        self.profiles = []  # (段階, 反復, ファイル名, cProfile.Profile)の列
+        os.makedirs(directory, exist_ok=True)
+
+    def wrap(self, name, f):
+        "段階nameのfを、プロファイルを取りながら実行する関数を返す"
+
+        def profiled(*args, **kwargs):
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                profile.disable()
+                self.dump(name, profile)
+
+        return profiled
+
+    def dump(self, name, profile):
+        stage = re.sub(r"[^0-9A-Za-z_]+", "_", name).strip("_")
+        stem = f"{len(self.profiles):03d}-{stage}"
+        if self.iteration is not None:
+            stem += f"-{self.iteration}"
+        fname = os.path.join(self.directory, stem + ".prof")
+        profile.dump_stats(fname)
+        self.profiles.append((name, self.iteration, fname, profile))
+
+    def report(self, top=10):
+        """段階ごとに最も時間を使った関数と、全体で時間を使った上位top個の関数の報告
+
+        時間は関数自身の時間(tottime)で比べる。
+        """
+        out = io.StringIO()
+        print(f"profiles of {len(self.profiles)} stages in {self.directory}", file=out)
+        for name, iteration, fname, profile in self.profiles:
+            st = pstats.Stats(profile)
+            total = st.total_tt
+            hot = max(st.stats.items(), key=lambda item: item[1][2], default=None)
+            stage = name if iteration is None else f"{name} #{iteration}"
+            line = f"  {stage:<24} {total * 1000:>9.2f}ms"
+            if hot is not None:
+                (path, lineno, func), (_, _, tt, _, _) = hot
+                line += f"  {os.path.basename(path)}:{lineno}({func}) {tt * 1000:.2f}ms"
+            print(line, file=out)
+        if self.profiles:
+            st = pstats.Stats(*(p for _, _, _, p in self.profiles), stream=out)
+            st.sort_stats("tottime").print_stats(top)
+        return out.getvalue().rstrip()
@@ -0,0 +1,288 @@
+import functools
+
+from . import logger
+from . import syntax
+from . import types
+from .id import gen_tmp_id
+
+
+class ParseError(Exception):
+    pass
+
+
+# 二項演算子の優先順位 (parser.pyのprecedenceと同じ順序で、大きいほど強く結合する)
+PREC_SEMICOLON = 1
+PREC_LESS_MINUS = 3
+PREC_COMMA = 5
+PREC_CMP = 6
+PREC_ADD = 7
+PREC_MUL = 8
+PREC_UNARY_MINUS = 9
+PREC_APP = 10
+
+binary_prec = {
+    "SEMICOLON": PREC_SEMICOLON,
+    "COMMA": PREC_COMMA,
+    "EQUAL": PREC_CMP,
+    "LESS_GREATER": PREC_CMP,
+    "LESS": PREC_CMP,
+    "GREATER": PREC_CMP,
+    "LESS_EQUAL": PREC_CMP,
+    "GREATER_EQUAL": PREC_CMP,
+    "PLUS": PREC_ADD,
+    "MINUS": PREC_ADD,
+    "PLUS_DOT": PREC_ADD,
+    "MINUS_DOT": PREC_ADD,
+    "AST_DOT": PREC_MUL,
+    "SLASH_DOT": PREC_MUL,
+}
+
+# simple_expの先頭になりうるトークン
+simple_exp_start = frozenset(("LPAREN", "BOOL", "INT", "FLOAT", "IDENT"))
+
+
+class Parser:
+    """parser.pyの文法と同じ抽象構文木を作る、優先順位法による再帰下降構文解析器
+
+    字句解析器はPLYの字句解析器と同じくinput()とtoken()を持つものを受け付ける。
+    PLYの構文解析器と違ってエラー回復をせず、最初の構文エラーを報告してNoneを返す。
+    そのときerror_spanにエラーの位置の範囲を残す (入力の終わりでは最後のトークンの後)。
+    """
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.tok = None
+        self.type = None  # 現在のトークンの型 (入力の終わりではNone)
+        self.end = 0  # 最後に読んだトークンの終了位置
+        self.error_span = 0
+
+    def parse(self, input):
+        self.lexer.input(input)
+        self.end = 0
+        self.error_span = 0
+        self.next_token = functools.partial(next, iter(self.lexer), None)
+        self.advance()
+        try:
+            e = self.exp(0)
+            if self.tok is not None:
+                self.error()
+        except ParseError:
+            return None
+        return e
+
+    def error(self):
+        tok = self.tok
+        if tok is None:
+            logger.error(f"{self.lexer.lineno}: syntax error at end of input")
+            self.error_span = syntax.make_span(self.end, self.end)
+        else:
+            logger.error(f"{tok.lineno}: syntax error at '{tok.value}'")
+            self.error_span = syntax.make_span(tok.lexpos, tok.endlexpos)
+        raise ParseError
+
+    def advance(self):
+        tok = self.tok
+        if tok is not None:
+            self.end = tok.endlexpos
+        self.tok = next_tok = self.next_token()
+        self.type = None if next_tok is None else next_tok.type
+        return tok
+
+    def span_from(self, start):
+        "位置startから最後に読んだトークンまでの範囲"
+        return syntax.make_span(start, self.end)
+
+    def expect(self, type):
+        if self.type != type:
+            self.error()
+        return self.advance()
+
+    def exp(self, min_prec):
+        "優先順位がmin_prec以上の二項演算子だけを含む式を読む"
+        # let ... inの本体と;の右辺は再帰せずにこのループで読み、
+        # 最後に内側から組み立てる (長いlet/;の列でもスタックを消費しない)
+        # spineの要素は(式の開始位置, 式を作る関数)
+        spine = []
+        while True:
+            if self.type == "LET":
+                start = self.advance().lexpos
+                spine.append((start, self.let()))
+                min_prec = 0
+                continue
+            left = self.binary_exp(min_prec)
+            if self.type == "SEMICOLON" and PREC_SEMICOLON >= min_prec:
+                self.advance()
+                start = syntax.span_start(left.span)
+                spine.append((start, functools.partial(seq, left)))
+                min_prec = PREC_SEMICOLON
+                continue
+            break
+        for start, ctor in reversed(spine):
+            left = ctor(left, span=self.span_from(start))
+        return left
+
+    def binary_exp(self, min_prec):
+        "優先順位がmin_prec以上の、;以外の二項演算子だけを含む式を読む"
+        left = self.prefix_exp()
+        while True:
+            op = self.type
+            prec = binary_prec.get(op)
+            if prec is None or prec < min_prec or op == "SEMICOLON":
+                return left
+            tok = self.advance()
+            start = syntax.span_start(left.span)
+            if op == "COMMA":
+                elems = [left, self.exp(PREC_COMMA + 1)]
+                while self.type == "COMMA":
+                    self.advance()
+                    elems.append(self.exp(PREC_COMMA + 1))
+                left = syntax.Tuple(elems, self.span_from(start))
+            elif prec == PREC_CMP:
+                right = self.exp(prec + 1)
+                left = comparison(tok.value, left, right, self.span_from(start))
+            else:
+                right = self.exp(prec + 1)
+                left = syntax.BinaryExp(tok.value, left, right, self.span_from(start))
+
+    def prefix_exp(self):
+        op = self.type
+        if op in simple_exp_start:
+            return self.app_or_put()
+        start = None if self.tok is None else self.tok.lexpos
+        if op == "IF":
+            self.advance()
+            cond = self.exp(0)
+            self.expect("THEN")
+            then = self.exp(0)
+            self.expect("ELSE")
+            else_ = self.exp(PREC_LESS_MINUS)
+            return syntax.If(cond, then, else_, self.span_from(start))
+        elif op == "NOT":
+            self.advance()
+            e = self.exp(PREC_APP)
+            return syntax.UnaryExp("not", e, self.span_from(start))
+        elif op == "MINUS":
+            self.advance()
+            e = self.exp(PREC_UNARY_MINUS)
+            if isinstance(e, syntax.Const) and types.is_float(e.typ):
+                e.value = -e.value
+                e.span = self.span_from(start)
+                return e
+            return syntax.UnaryExp("-", e, self.span_from(start))
+        elif op == "MINUS_DOT":
+            self.advance()
+            e = self.exp(PREC_UNARY_MINUS)
+            return syntax.UnaryExp("-.", e, self.span_from(start))
+        elif op == "ARRAY_CREATE":
+            self.advance()
+            e1 = self.simple_exp()
+            e2 = self.simple_exp()
+            return syntax.Array(e1, e2, self.span_from(start))
+        else:
+            self.error()
+
+    def let(self):
+        "letから本体の直前のinまでを読み、本体を受け取って式を作る関数を返す"
+        op = self.type
+        if op == "REC":
+            self.advance()
+            tok = self.expect("IDENT")
+            args = [(self.expect("IDENT").value, types.Var())]
+            while self.type == "IDENT":
+                args.append((self.advance().value, types.Var()))
+            self.expect("EQUAL")
+            body = self.exp(0)
+            fundef = syntax.Fundef(tok.value, args, body, self.span_from(tok.lexpos))
+            self.expect("IN")
+            return functools.partial(syntax.LetRec, fundef)
+        elif op == "LPAREN":
+            self.advance()
+            pat = [(self.expect("IDENT").value, types.Var())]
+            self.expect("COMMA")
+            pat.append((self.expect("IDENT").value, types.Var()))
+            while self.type == "COMMA":
+                self.advance()
+                pat.append((self.expect("IDENT").value, types.Var()))
+            self.expect("RPAREN")
+            self.expect("EQUAL")
+            bound = self.exp(0)
+            self.expect("IN")
+            return functools.partial(syntax.LetTuple, pat, bound)
+        else:
+            name = self.expect("IDENT").value
+            self.expect("EQUAL")
+            bound = self.exp(0)
+            self.expect("IN")
+            return functools.partial(syntax.Let, types.Var(), name, bound)
+
+    def app_or_put(self):
+        "関数適用、配列への書き込み、またはsimple_expを読む"
+        start = self.tok.lexpos
+        e = self.simple_exp(put=True)
+        if isinstance(e, tuple):
+            array, index = e
+            self.advance()
+            value = self.exp(PREC_LESS_MINUS)
+            return syntax.Put(array, index, value, self.span_from(start))
+        if self.type in simple_exp_start:
+            args = [self.simple_exp()]
+            while self.type in simple_exp_start:
+                args.append(self.simple_exp())
+            return syntax.App(e, args, self.span_from(start))
+        return e
+
+    def simple_exp(self, put=False):
+        """simple_expを読む
+
+        putが真で、配列の要素の後に<-が続く場合は(配列, 添字)の組を返す。
+        """
+        op = self.type
+        if op not in simple_exp_start:
+            self.error()
+        tok = self.advance()
+        start = tok.lexpos
+        if op == "IDENT":
+            e = syntax.Var(tok.value, self.span_from(start))
+        elif op == "INT":
+            e = syntax.Const(types.Int, tok.value, self.span_from(start))
+        elif op == "LPAREN":
+            if self.type == "RPAREN":
+                self.advance()
+                e = syntax.Const(types.Unit, None, self.span_from(start))
+            else:
+                e = self.exp(0)
+                self.expect("RPAREN")
+                e.span = self.span_from(start)
+        elif op == "FLOAT":
+            e = syntax.Const(types.Float, tok.value, self.span_from(start))
+        else:  # BOOL
+            e = syntax.Const(types.Bool, tok.value, self.span_from(start))
+
+        while self.type == "DOT":
+            self.advance()
+            self.expect("LPAREN")
+            index = self.exp(0)
+            self.expect("RPAREN")
+            if put and self.type == "LESS_MINUS":
+                return e, index
+            e = syntax.Get(e, index, self.span_from(start))
+        return e
+
+
+def seq(e1, e2, span=0):
+    "parser.p_semicolonと同じく、e1; e2をlet () = e1 in e2にする"
+    return syntax.Let(types.Unit, gen_tmp_id(types.Unit), e1, e2, span)
+
+
+def comparison(op, left, right, span=0):
+    "parser.p_cmp_expと同じく、比較演算子を=と<=に正規化する"
+    if op in ("=", "<="):
+        return syntax.BinaryExp(op, left, right, span)
+    elif op == "<>":
+        return syntax.UnaryExp("not", syntax.BinaryExp("=", left, right, span), span)
+    elif op == "<":
+        return syntax.UnaryExp("not", syntax.BinaryExp("<=", right, left, span), span)
+    elif op == ">":
+        return syntax.UnaryExp("not", syntax.BinaryExp("<=", left, right, span), span)
+    else:  # ">="
+        return syntax.BinaryExp("<=", right, left, span)
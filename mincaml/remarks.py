@@ -0,0 +1,69 @@
+"""最適化の報告(remarks)
+
+各パスは、β簡約・インライン展開・不要な定義の削除・クロージャの省略などを行うたびに
+(パス, 種類, 変数名, 関数)の組を報告する。報告はJSONLとして一行ずつ書き出す。
+using(Remarks(...))の中でなければパスは報告を作らないので、文字列の組み立ても行わない。
+"""
+
+import json
+import contextlib
+import contextvars
+
+
+class Remarks:
+    "報告をファイルfpにJSONLで書き出す"
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.iteration = None  # 実行中の最適化の反復 (反復の外ならNone)
+        self.count = 0
+
+    def emit(self, pass_, kind, names, function=None):
+        """報告を一つ書き出す
+
+        namesは関係する変数名の列、functionは報告の場所を本体に含む関数の名前
+        (トップレベルならNone)。
+        """
+        record = {
+            "pass": pass_,
+            "kind": kind,
+            "names": list(names),
+            "function": function,
+            "iteration": self.iteration,
+        }
+        self.fp.write(json.dumps(record))
+        self.fp.write("\n")
+        self.count += 1
+
+
+class Buffer:
+    """報告をためておき、commitしたときにtargetへ書き出す
+
+    やり直すかもしれない変換の報告に使う。やり直すならcommitせずに捨てる。
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.records = []
+
+    def emit(self, *args):
+        self.records.append(args)
+
+    def commit(self):
+        for args in self.records:
+            self.target.emit(*args)
+        self.records = []
+
+
+# 実行中のコンパイルの報告先 (Noneなら報告しない)
+current = contextvars.ContextVar("mincaml.remarks.current", default=None)
+
+
+@contextlib.contextmanager
+def using(remarks):
+    "with文の間、このスレッドで実行するパスの報告をremarksに書き出す"
+    token = current.set(remarks)
+    try:
+        yield remarks
+    finally:
+        current.reset(token)
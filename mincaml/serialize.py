@@ -0,0 +1,371 @@
+"""中間表現のバイナリ形式への変換
+
+K正規形・クロージャ変換後・仮想マシンコードのタプル形式の中間表現を、
+Fundefなどのnamedtupleやtypesの型も含めて、コンパクトなバイト列にする。
+
+中間表現は、後置順(子が先、親が後)に並べた一バイトの命令の列opsと、命令の引数
+(符号なし整数)の列argsに分けて書き出す。ノードはir.Schemaのopcodeで表す。
+変数名などの文字列は一度だけ文字列の表に書き、argsには表の番号を書く。整数・浮動小数点数の
+定数は定数の表に、型は型の表に書く。表はmarshalで書き出す。
+読み込みはopsを順に実行してスタックの上に値を組み立てる。どちらの向きも再帰しないので、
+深い式も扱える。cacheは、入れ子が深すぎてpickleできないプログラムをこの形式で保存する。
+"""
+
+import sys
+import array
+import marshal
+
+from . import ir
+from . import types
+from . import knorm
+from . import closure
+from .x86 import asm
+
+MAGIC = b"MCIR"
+VERSION = 2
+
+# argsの配列の型 (表の番号が大きくなるほど大きな型を使う)
+ARG_TYPECODES = "BHI"
+
+# 命令 (NODEより小さいもの)
+# 文字列: argsの次の値(文字列の表の番号)の文字列を積む
+STR = 0
+# None, False, True, 基本型を積む
+NONE = 1
+FALSE = 2
+TRUE = 3
+UNIT = 4
+INT = 5
+FLOAT = 6
+BOOL = 7
+# コンテナ: argsの次の値(要素の数n)だけ値を降ろして組み立てる
+TUPLE = 8
+LIST = 9
+SET = 10
+# レコード: argsの次の値(RECORDSの番号)のnamedtupleを組み立てる
+RECORD = 11
+# argsの次の値(型の表の番号)の型を積む
+TYPE = 12
+# 定数の表の次の値(整数か浮動小数点数)を積む
+CONST = 13
+# argsの次の値(要素の数n)だけ値を降ろしてfrozensetを組み立てる
+FROZENSET = 14
+# ノード: NODE + opcode
+NODE = 32
+
+# 型の表の各要素の種類
+ARRAY = 0
+TUPLE_TYPE = 1
+FUN = 2
+VAR = 3
+TYPE_CLASSES = (types.Array, types.Tuple, types.Fun, types.Var)
+
+SCHEMAS = (None, ir.KNORMAL, ir.CLOSURE, ir.VIRTUAL)
+RECORDS = (knorm.Fundef, closure.Fundef, closure.Closure, asm.Fundef)
+
+_record_codes = {cls: i for i, cls in enumerate(RECORDS)}
+_premitives = {
+    id(types.Unit): UNIT,
+    id(types.Int): INT,
+    id(types.Float): FLOAT,
+    id(types.Bool): BOOL,
+}
+_constants = {
+    NONE: None,
+    FALSE: False,
+    TRUE: True,
+    UNIT: types.Unit,
+    INT: types.Int,
+    FLOAT: types.Float,
+    BOOL: types.Bool,
+}
+
+
+class SerializeError(ValueError):
+    pass
+
+
+def dumps(obj, schema=None):
+    """objをバイト列にする
+
+    schema (ir.KNORMALなど) を与えると、そのノードをopcodeで表して小さくする。
+    """
+    if schema is None:
+        opcodes = {}
+    else:
+        opcodes = {
+            kind: (NODE + op, len(schema.fields[kind]))
+            for kind, op in schema.opcodes.items()
+        }
+    ops = bytearray()
+    args = []
+    strings = {}  # 文字列から文字列の表の番号への対応
+    consts = []
+    type_ids = {}  # 型のidから型の表の番号への対応
+    type_list = []
+    emit = ops.append
+    push = args.append
+
+    # 子を逆順にたどる前置順で書き、最後に全体を反転して後置順にする
+    # (argsとconstsも同じく反転するので、命令の引数は命令より前に書く)
+    stack = [obj]
+    pop = stack.pop
+    extend = stack.extend
+    while stack:
+        v = pop()
+        t = type(v)
+        if t is str:
+            n = strings.get(v)
+            if n is None:
+                n = strings[v] = len(strings)
+            push(n)
+            emit(STR)
+        elif t is tuple:
+            node = opcodes.get(v[0]) if v and type(v[0]) is str else None
+            if node is not None and node[1] == len(v) - 1:
+                emit(node[0])
+                extend(v[1:])
+            else:
+                push(len(v))
+                emit(TUPLE)
+                extend(v)
+        elif t is int or t is float:
+            consts.append(v)
+            emit(CONST)
+        elif t is list:
+            push(len(v))
+            emit(LIST)
+            extend(v)
+        elif v is None:
+            emit(NONE)
+        elif v is True:
+            emit(TRUE)
+        elif v is False:
+            emit(FALSE)
+        elif t is types.Premitive:
+            emit(_premitives[id(v)])
+        elif t in _record_codes:
+            push(_record_codes[t])
+            emit(RECORD)
+            extend(v)
+        elif t is set:
+            push(len(v))
+            emit(SET)
+            extend(v)
+        elif t is frozenset:
+            push(len(v))
+            emit(FROZENSET)
+            extend(v)
+        elif t in TYPE_CLASSES:
+            n = type_ids.get(id(v))
+            if n is None:
+                n = type_ids[id(v)] = len(type_list)
+                type_list.append(v)
+            push(n)
+            emit(TYPE)
+        else:
+            raise SerializeError(f"cannot serialize {v!r}")
+
+    ops.reverse()
+    args.reverse()
+    consts.reverse()
+    table = dump_types(type_list, type_ids)
+    typecode = arg_typecode(max(args, default=0))
+    arr = array.array(typecode, args)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    header = MAGIC + bytes((VERSION, SCHEMAS.index(schema)))
+    return header + marshal.dumps(
+        (bytes(ops), typecode, arr.tobytes(), list(strings), consts, table)
+    )
+
+
+def arg_typecode(n):
+    "n以下の符号なし整数を入れられるargsの配列の型"
+    for typecode in ARG_TYPECODES:
+        if n < 1 << (8 * array.array(typecode).itemsize):
+            return typecode
+    raise SerializeError(f"too large index {n}")
+
+
+def dump_types(type_list, type_ids):
+    """型の表を、(種類, 要素の型...)のタプルの列にする
+
+    要素の型は、基本型ならUNITなどの負数、それ以外は表の番号で表す。
+    type_listはたどる途中で見つけた型を加えながら伸びる。
+    """
+
+    def ref(t):
+        if type(t) is types.Premitive:
+            return -_premitives[id(t)]
+        if t is None:
+            return -NONE
+        n = type_ids.get(id(t))
+        if n is None:
+            n = type_ids[id(t)] = len(type_list)
+            type_list.append(t)
+        return n
+
+    table = []
+    i = 0
+    while i < len(type_list):
+        t = type_list[i]
+        if type(t) is types.Array:
+            table.append((ARRAY, ref(t.elem)))
+        elif type(t) is types.Tuple:
+            table.append((TUPLE_TYPE, *[ref(u) for u in t.elems]))
+        elif type(t) is types.Fun:
+            table.append((FUN, ref(t.ret), *[ref(u) for u in t.args]))
+        else:
+            table.append((VAR, ref(t.ref.contents)))
+        i += 1
+    return table
+
+
+def load_types(table):
+    """dump_typesの表から型の列を作る
+
+    型変数を含まなければ、要素の型から順にハッシュコンシングした型を作る。
+    型変数を含めば、すべての型を作ってから要素の型を埋める。
+    """
+    if any(entry[0] == VAR for entry in table):
+        return load_types_with_vars(table)
+
+    result = [None] * len(table)
+
+    def deref(n):
+        return _constants[-n] if n < 0 else result[n]
+
+    for i in range(len(table)):
+        # 要素の型を先に作るよう、明示的なスタックで後置順にたどる
+        stack = [i]
+        while stack:
+            n = stack[-1]
+            if result[n] is not None:
+                stack.pop()
+                continue
+            entry = table[n]
+            pending = [m for m in entry[1:] if m >= 0 and result[m] is None]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            kind = entry[0]
+            if kind == ARRAY:
+                result[n] = types.Array.of(deref(entry[1]))
+            elif kind == TUPLE_TYPE:
+                result[n] = types.Tuple.of([deref(m) for m in entry[1:]])
+            else:
+                result[n] = types.Fun.of([deref(m) for m in entry[2:]], deref(entry[1]))
+    return result
+
+
+def load_types_with_vars(table):
+    "型変数を含むdump_typesの表から型の列を作る (要素の型は、すべての型を作ってから埋める)"
+    result = [TYPE_CLASSES[entry[0]].__new__(TYPE_CLASSES[entry[0]]) for entry in table]
+
+    def deref(n):
+        return _constants[-n] if n < 0 else result[n]
+
+    for t, entry in zip(result, table):
+        kind = entry[0]
+        if kind == ARRAY:
+            t.elem = deref(entry[1])
+        elif kind == TUPLE_TYPE:
+            t.elems = [deref(n) for n in entry[1:]]
+        elif kind == FUN:
+            t.ret = deref(entry[1])
+            t.args = [deref(n) for n in entry[2:]]
+        else:
+            t.ref = types.Var.Ref()
+            t.ref.contents = deref(entry[1])
+    return result
+
+
+def loads(data):
+    """dumpsで作ったバイト列dataから値を組み立てる
+
+    dataが壊れていればSerializeErrorを投げる。
+    """
+    try:
+        return _loads(data)
+    except SerializeError:
+        raise
+    except (
+        IndexError,
+        KeyError,
+        TypeError,
+        ValueError,
+        AttributeError,
+        EOFError,
+        StopIteration,
+    ) as e:
+        raise SerializeError(f"broken data: {type(e).__name__}: {e}") from e
+
+
+def _loads(data):
+    if data[:4] != MAGIC:
+        raise SerializeError("not a serialized IR")
+    if data[4] != VERSION:
+        raise SerializeError(f"unsupported version {data[4]}")
+    schema = SCHEMAS[data[5]]
+    ops, typecode, arg_bytes, strings, consts, table = marshal.loads(data[6:])
+    args = array.array(typecode)
+    args.frombytes(arg_bytes)
+    if sys.byteorder == "big":
+        args.byteswap()
+    type_list = load_types(table)
+
+    nodes = {}
+    if schema is not None:
+        for kind, op in schema.opcodes.items():
+            nodes[NODE + op] = (kind, len(schema.fields[kind]))
+    constants = _constants
+
+    stack = []
+    push = stack.append
+    nxt = iter(args).__next__
+    next_const = iter(consts).__next__
+    for op in ops:
+        if op == STR:
+            push(strings[nxt()])
+        elif op >= NODE:
+            kind, n = nodes[op]
+            if n:
+                args = stack[-n:]
+                del stack[-n:]
+                push((kind, *args))
+            else:
+                push((kind,))
+        elif op == CONST:
+            push(next_const())
+        elif op == TYPE:
+            push(type_list[nxt()])
+        elif op in constants:
+            push(constants[op])
+        else:
+            if op == RECORD:
+                cls = RECORDS[nxt()]
+                n = len(cls._fields)
+            elif op in (TUPLE, LIST, SET, FROZENSET):
+                n = nxt()
+            else:
+                raise SerializeError(f"unknown instruction {op}")
+            if n:
+                args = stack[-n:]
+                del stack[-n:]
+            else:
+                args = []
+            if op == TUPLE:
+                push(tuple(args))
+            elif op == LIST:
+                push(args)
+            elif op == SET:
+                push(set(args))
+            elif op == FROZENSET:
+                push(frozenset(args))
+            else:
+                push(cls._make(args))
+    if len(stack) != 1:
+        raise SerializeError("broken data")
+    return stack[0]
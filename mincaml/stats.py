@@ -0,0 +1,103 @@
+"""コンパイルの各段階にかかった時間と、中間表現の大きさの記録 (--stats)
+
+Compilerにstatsを渡したときだけ記録するので、渡さなければ何もしない。
+"""
+
+import json
+import time
+
+from . import ir
+from . import syntax
+
+
+def size(x):
+    """中間表現xのノードの数 (ソースやアセンブリならNone)
+
+    xの形から、どの段階の中間表現かを判断する。
+    """
+    if isinstance(x, tuple):
+        if isinstance(x[0], str):
+            return ir.KNORMAL.size(x)
+        if len(x) == 2:
+            fundefs, e = x
+            schema = ir.CLOSURE
+        else:
+            _, fundefs, e = x
+            schema = ir.VIRTUAL
+        return sum(schema.size(f.body) for f in fundefs) + schema.size(e)
+    if not isinstance(x, syntax.Node):
+        return None
+    return syntax.size(x)
+
+
+class Pass:
+    "一つのパスの一回の実行の記録"
+
+    __slots__ = ("name", "iteration", "time", "before", "after")
+
+    def __init__(self, name, iteration, time, before, after):
+        self.name = name
+        self.iteration = iteration  # 最適化の何回目の反復か (反復の外ならNone)
+        self.time = time  # 秒
+        self.before = before  # 入力のノードの数 (数えられなければNone)
+        self.after = after  # 出力のノードの数 (数えられなければNone)
+
+    def to_dict(self):
+        return {f: getattr(self, f) for f in self.__slots__}
+
+
+class Stats:
+    "一回のコンパイルの記録"
+
+    def __init__(self):
+        self.passes = []
+        self.iteration = None  # 実行中の最適化の反復
+        self.iterations = 0  # 最適化の反復の回数
+        self.last = None  # 直前に数えた(式, ノードの数)
+
+    def size(self, e):
+        # 前のパスの出力と同じ式は数え直さない
+        if self.last is not None and self.last[0] is e:
+            return self.last[1]
+        n = size(e)
+        self.last = (e, n)
+        return n
+
+    def run(self, name, f, *args, **kwargs):
+        "f(*args, **kwargs)を実行し、時間と入力args[0]・出力のノードの数を記録する"
+        before = self.size(args[0])
+        start = time.perf_counter()
+        result = f(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        after = self.size(result)
+        self.passes.append(Pass(name, self.iteration, elapsed, before, after))
+        return result
+
+    @property
+    def total(self):
+        return sum(p.time for p in self.passes)
+
+    def to_json(self):
+        return json.dumps(
+            {
+                "passes": [p.to_dict() for p in self.passes],
+                "iterations": self.iterations,
+                "total": self.total,
+            }
+        )
+
+    def to_table(self):
+        lines = [
+            f"{'pass':<24} {'iter':>5} {'time(ms)':>10} {'before':>8} {'after':>8}"
+        ]
+        for p in self.passes:
+            iteration = "-" if p.iteration is None else p.iteration
+            before = "-" if p.before is None else p.before
+            after = "-" if p.after is None else p.after
+            lines.append(
+                f"{p.name:<24} {iteration:>5} {p.time * 1000:>10.2f} "
+                f"{before:>8} {after:>8}"
+            )
+        lines.append(f"{'total':<24} {'':>5} {self.total * 1000:>10.2f}")
+        lines.append(f"optimizer iterations: {self.iterations}")
+        return "\n".join(lines)
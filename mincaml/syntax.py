@@ -1,133 +1,225 @@
 from . import types
 
+# 抽象構文木のノードの種類
+KINDS = (
+    "Const",
+    "Var",
+    "UnaryExp",
+    "BinaryExp",
+    "Let",
+    "LetRec",
+    "Fundef",
+    "LetTuple",
+    "If",
+    "Get",
+    "Put",
+    "Array",
+    "Tuple",
+    "App",
+)
 
-class Const:
-    def __init__(self, typ, value):
+
+def kind_of(e):
+    "ノードの種類 (クラス名)"
+    return e.__class__.__name__
+
+
+# ソースコード上の範囲(span)は、開始位置と終了位置(字句解析器に与えた入力での位置)を
+# 一つの整数start << SPAN_BITS | endに詰めたもの。0は範囲が分からないことを表す
+SPAN_BITS = 32
+SPAN_MASK = (1 << SPAN_BITS) - 1
+
+
+def make_span(start, end):
+    return start << SPAN_BITS | end
+
+
+def span_start(span):
+    return span >> SPAN_BITS
+
+
+def span_end(span):
+    return span & SPAN_MASK
+
+
+def location(source, span):
+    """範囲spanの開始位置の(行, 列) (どちらも1から数え、列は文字で数える)
+
+    sourceは字句解析器に与えた入力 (str・bytes・memoryviewなど)。
+    """
+    before = source[: span_start(span)]
+    if not isinstance(before, str):
+        before = str(before, "utf-8", "replace")
+    return before.count("\n") + 1, len(before) - before.rfind("\n")
+
+
+class Node:
+    """抽象構文木のノードの基底クラス
+
+    child_fieldsは子のノードを持つ属性の名前の列で、listの属性は要素が子になる。
+    子をたどるときは、リストを作らずにこれを使う。
+    """
+
+    __slots__ = ("span",)
+    child_fields = ()
+
+
+class Const(Node):
+    __slots__ = ("typ", "value")
+
+    def __init__(self, typ, value, span=0):
         self.typ = typ
         self.value = value
+        self.span = span
 
-    def children(self):
-        return []
 
+class Var(Node):
+    __slots__ = ("name",)
 
-class Var:
-    def __init__(self, name):
+    def __init__(self, name, span=0):
         self.name = name
+        self.span = span
 
-    def children(self):
-        return []
 
+class UnaryExp(Node):
+    __slots__ = ("op", "arg")
+    child_fields = ("arg",)
 
-class UnaryExp:
-    def __init__(self, op, arg):
+    def __init__(self, op, arg, span=0):
         self.op = op
         self.arg = arg
+        self.span = span
 
-    def children(self):
-        return [self.arg]
 
+class BinaryExp(Node):
+    __slots__ = ("op", "left", "right")
+    child_fields = ("left", "right")
 
-class BinaryExp:
-    def __init__(self, op, left, right):
+    def __init__(self, op, left, right, span=0):
         self.op = op
         self.left = left
         self.right = right
+        self.span = span
 
-    def children(self):
-        return [self.left, self.right]
 
+class Let(Node):
+    __slots__ = ("typ", "name", "bound", "body")
+    child_fields = ("bound", "body")
 
-class Let:
-    def __init__(self, typ, name, bound, body):
+    def __init__(self, typ, name, bound, body, span=0):
         self.typ = typ
         self.name = name
         self.bound = bound
         self.body = body
+        self.span = span
 
-    def children(self):
-        return [self.bound, self.body]
 
+class LetRec(Node):
+    __slots__ = ("fundef", "body")
+    child_fields = ("fundef", "body")
 
-class LetRec:
-    def __init__(self, fundef, body):
+    def __init__(self, fundef, body, span=0):
         self.fundef = fundef
         self.body = body
+        self.span = span
 
-    def children(self):
-        return [self.fundef, self.body]
 
+class Fundef(Node):
+    __slots__ = ("typ", "name", "args", "body")
+    child_fields = ("body",)
 
-class Fundef:
-    def __init__(self, name, args, body):
+    def __init__(self, name, args, body, span=0):
         self.typ = types.Var()
         self.name = name
         self.args = args
         self.body = body
+        self.span = span
 
-    def children(self):
-        return [self.body]
 
+class LetTuple(Node):
+    __slots__ = ("pat", "bound", "body")
+    child_fields = ("bound", "body")
 
-class LetTuple:
-    def __init__(self, pat, bound, body):
+    def __init__(self, pat, bound, body, span=0):
         self.pat = pat
         self.bound = bound
         self.body = body
+        self.span = span
 
-    def children(self):
-        return [self.bound, self.body]
 
+class If(Node):
+    __slots__ = ("cond", "then", "else_")
+    child_fields = ("cond", "then", "else_")
 
-class If:
-    def __init__(self, cond, then, else_):
+    def __init__(self, cond, then, else_, span=0):
         self.cond = cond
         self.then = then
         self.else_ = else_
+        self.span = span
 
-    def children(self):
-        return [self.cond, self.then, self.else_]
 
+class Get(Node):
+    __slots__ = ("array", "index")
+    child_fields = ("array", "index")
 
-class Get:
-    def __init__(self, array, index):
+    def __init__(self, array, index, span=0):
         self.array = array
         self.index = index
+        self.span = span
 
-    def children(self):
-        return [self.array, self.index]
 
+class Put(Node):
+    __slots__ = ("array", "index", "exp")
+    child_fields = ("array", "index", "exp")
 
-class Put:
-    def __init__(self, array, index, exp):
+    def __init__(self, array, index, exp, span=0):
         self.array = array
         self.index = index
         self.exp = exp
+        self.span = span
 
-    def children(self):
-        return [self.array, self.index, self.exp]
 
+class Array(Node):
+    __slots__ = ("len", "init")
+    child_fields = ("len", "init")
 
-class Array:
-    def __init__(self, len, init):
+    def __init__(self, len, init, span=0):
         self.len = len
         self.init = init
+        self.span = span
 
-    def children(self):
-        return [self.len, self.init]
 
+class Tuple(Node):
+    __slots__ = ("elems",)
+    child_fields = ("elems",)
 
-class Tuple:
-    def __init__(self, elems):
+    def __init__(self, elems, span=0):
         self.elems = elems
+        self.span = span
 
-    def children(self):
-        return self.elems
 
+class App(Node):
+    __slots__ = ("fun", "args")
+    child_fields = ("fun", "args")
 
-class App:
-    def __init__(self, fun, args):
+    def __init__(self, fun, args, span=0):
         self.fun = fun
         self.args = args
-
-    def children(self):
-        return [self.fun] + self.args
+        self.span = span
+
+
+def size(e):
+    "抽象構文木eのノードの数 (再帰せずに数える)"
+    n = 0
+    stack = [e]
+    push = stack.append
+    while stack:
+        e = stack.pop()
+        n += 1
+        for field in e.child_fields:
+            child = getattr(e, field)
+            if type(child) is list:
+                stack.extend(child)
+            else:
+                push(child)
+    return n
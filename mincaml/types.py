@@ -1,11 +1,23 @@
-import operator
-import functools
+"""型の表現
+
+型変数を含まない型(基本型と、基本型から作ったArray・Tuple・Fun)は、Array.ofなどで作ると
+ハッシュコンシングされ、等しい型は同じオブジェクトになる。型検査の後の型はすべてこの形なので、
+型の比較はisで行える。型推論の途中の、型変数を含む型はコンストラクタで作る。
+"""
+
+import threading
+import weakref
 
 
 class Var:
+    __slots__ = ("ref",)
+
     class Ref:
+        __slots__ = ("contents", "rank")
+
         def __init__(self):
             self.contents = None
+            self.rank = 0  # union-findの木の高さの上界 (代入のない型変数で使う)
 
     def __init__(self):
         self.ref = Var.Ref()
@@ -15,6 +27,8 @@ class Var:
 
 
 class Premitive:
+    __slots__ = ("name",)
+
     def __init__(self, name):
         self.name = name
 
@@ -24,11 +38,59 @@ class Premitive:
     def __repr__(self):
         return f"<{self.name}>"
 
+    def __reduce__(self):
+        # is_intなどは同一性で比較するので、pickleしても同じオブジェクトに戻す
+        return self.name
+
+
+# ハッシュコンシングした型の表 ((クラス, 要素の型...)から型への対応)
+# 使われなくなった型は表から消える
+_interned = weakref.WeakValueDictionary()
+_interned_lock = threading.Lock()
+
+
+def _intern(key, make):
+    t = _interned.get(key)
+    if t is None:
+        with _interned_lock:
+            t = _interned.get(key)
+            if t is None:
+                t = _interned[key] = make()
+    return t
+
+
+class Composite:
+    """Array・Tuple・Funに共通の、ハッシュコンシングのための部分
+
+    サブクラスは、_internの表でのキーを返すkeyと、ofに渡す引数を返すargs_ofを定義する。
+    """
+
+    __slots__ = ("__weakref__",)
+
+    def __reduce__(self):
+        # ハッシュコンシングした型は、pickleから戻すときもハッシュコンシングする
+        if _interned.get(self.key()) is self:
+            return self.of, self.args_of()
+        return type(self), self.args_of()
+
+
+class Array(Composite):
+    __slots__ = ("elem",)
 
-class Array:
     def __init__(self, elem):
         self.elem = elem
 
+    @classmethod
+    def of(cls, elem):
+        "要素の型がelemの、ハッシュコンシングした配列の型"
+        return _intern((cls, elem), lambda: cls(elem))
+
+    def key(self):
+        return (Array, self.elem)
+
+    def args_of(self):
+        return (self.elem,)
+
     def __str__(self):
         return f"Array({self.elem})"
 
@@ -36,27 +98,55 @@ class Array:
         return f"<Array({repr(self.elem)})>"
 
 
-class Tuple:
+class Tuple(Composite):
+    __slots__ = ("elems",)
+
     def __init__(self, elems):
         self.elems = elems
 
+    @classmethod
+    def of(cls, elems):
+        "要素の型がelemsの、ハッシュコンシングした組の型"
+        elems = tuple(elems)
+        return _intern((cls, *elems), lambda: cls(elems))
+
+    def key(self):
+        return (Tuple, *self.elems)
+
+    def args_of(self):
+        return (self.elems,)
+
     def __str__(self):
-        return "Tuple({})".format(", ".join(str(t) for t in self.elem_types))
+        return "Tuple({})".format(", ".join(str(t) for t in self.elems))
 
     def __repr__(self):
-        return f"<Tuple({self.elems})>"
+        return f"<Tuple({list(self.elems)})>"
 
 
-class Fun:
+class Fun(Composite):
+    __slots__ = ("args", "ret")
+
     def __init__(self, args, ret):
         self.args = args
         self.ret = ret
 
+    @classmethod
+    def of(cls, args, ret):
+        "引数の型がargs、返り値の型がretの、ハッシュコンシングした関数の型"
+        args = tuple(args)
+        return _intern((cls, ret, *args), lambda: cls(args, ret))
+
+    def key(self):
+        return (Fun, self.ret, *self.args)
+
+    def args_of(self):
+        return (self.args, self.ret)
+
     def __str__(self):
         return "Fun({} -> {})".format(", ".join(str(t) for t in self.args), self.ret)
 
     def __repr__(self):
-        return f"<Fun({self.args} -> {repr(self.ret)})>"
+        return f"<Fun({list(self.args)} -> {repr(self.ret)})>"
 
 
 Unit = Premitive("Unit")
@@ -65,18 +155,36 @@ Float = Premitive("Float")
 Bool = Premitive("Bool")
 
 
-def type_func(class_or_tuple):
-    def f(instance):
-        return isinstance(instance, class_or_tuple)
+# 基本型は一つずつしかないのでisで、それ以外はクラスで判定する
+
+
+def is_unit(t):
+    return t is Unit
+
+
+def is_int(t):
+    return t is Int
+
+
+def is_float(t):
+    return t is Float
+
+
+def is_bool(t):
+    return t is Bool
+
+
+def is_var(t):
+    return type(t) is Var
+
+
+def is_array(t):
+    return type(t) is Array
+
 
-    return f
+def is_tuple(t):
+    return type(t) is Tuple
 
 
-is_unit = functools.partial(operator.eq, Unit)
-is_int = functools.partial(operator.eq, Int)
-is_float = functools.partial(operator.eq, Float)
-is_bool = functools.partial(operator.eq, Bool)
-is_var = type_func(class_or_tuple=Var)
-is_array = type_func(class_or_tuple=Array)
-is_tuple = type_func(class_or_tuple=Tuple)
-is_fun = type_func(class_or_tuple=Fun)
+def is_fun(t):
+    return type(t) is Fun
@@ -1,25 +1,52 @@
-from pyrsistent import pmap
 from . import logger
+from . import syntax
 from . import types
+from . import visitor
+from .env import Env
 
 
-class UnifyError(Exception):
+class UnifyError(ValueError):
+    """型の単一化の失敗
+
+    spanは失敗した式のソースコード上の範囲 (分からなければ0)、locationはその
+    (行, 列)で、Compilerがソースコードから求めて設定する。
+    """
+
     def __init__(self, t1, t2):
         self.t1 = t1
         self.t2 = t2
-        super().__init__(f"cannot unify {t1} and {t2}")
+        self.span = 0
+        self.location = None
+        super().__init__(t1, t2)
+
+    def __str__(self):
+        # 循環した型も持ちうるので、表示するときに初めて文字列にする
+        msg = f"cannot unify {self.t1} and {self.t2}"
+        if self.location is not None:
+            msg = "{}:{}: {}".format(*self.location, msg)
+        return msg
 
 
-class Visitor:
+class Visitor(visitor.Visitor):
     "抽象構文木をたどり型推論を行うVisitorクラス"
 
+    kinds = syntax.KINDS
+    kind_of = staticmethod(syntax.kind_of)
+
     def __init__(self, extenv):
         self.extenv = extenv
 
     def visit(self, env, e):
-        method = "visit_" + e.__class__.__name__
-        visitor = getattr(self, method)
-        return visitor(env, e)
+        return self.dispatch[e.__class__.__name__](self, env, e)
+
+    def unify(self, e, t1, t2):
+        "unifyが失敗したら、式eの範囲をUnifyErrorに記録する (内側の式で記録したものを優先する)"
+        try:
+            unify(t1, t2)
+        except UnifyError as exc:
+            if not exc.span:
+                exc.span = e.span
+            raise
 
     def visit_Const(self, env, e):
         return e.typ
@@ -38,13 +65,13 @@ class Visitor:
     def visit_UnaryExp(self, env, e):
         op = e.op
         if op == "not":
-            unify(types.Bool, self.visit(env, e.arg))
+            self.unify(e.arg, types.Bool, self.visit(env, e.arg))
             return types.Bool
         elif op == "-":
-            unify(types.Int, self.visit(env, e.arg))
+            self.unify(e.arg, types.Int, self.visit(env, e.arg))
             return types.Int
         elif op == "-.":
-            unify(types.Float, self.visit(env, e.arg))
+            self.unify(e.arg, types.Float, self.visit(env, e.arg))
             return types.Float
         else:
             raise ValueError(f"unknown unary operator: {op}")
@@ -52,180 +79,199 @@ class Visitor:
     def visit_BinaryExp(self, env, e):
         op = e.op
         if op in ("+", "-"):
-            unify(types.Int, self.visit(env, e.left))
-            unify(types.Int, self.visit(env, e.right))
+            self.unify(e.left, types.Int, self.visit(env, e.left))
+            self.unify(e.right, types.Int, self.visit(env, e.right))
             return types.Int
         elif op in ("+.", "-.", "*.", "/."):
-            unify(types.Float, self.visit(env, e.left))
-            unify(types.Float, self.visit(env, e.right))
+            self.unify(e.left, types.Float, self.visit(env, e.left))
+            self.unify(e.right, types.Float, self.visit(env, e.right))
             return types.Float
         elif op in ("=", "<="):
-            unify(self.visit(env, e.left), self.visit(env, e.right))
+            self.unify(e, self.visit(env, e.left), self.visit(env, e.right))
             return types.Bool
         else:
             raise ValueError(f"unknown binary operator: {op}")
 
-    def visit_Let(self, env, e):
-        unify(e.typ, self.visit(env, e.bound))
-        return self.visit(env.set(e.name, e.typ), e.body)
-
-    def visit_LetRec(self, env, e):
-        env = env.set(e.fundef.name, e.fundef.typ)
-        unify(
-            e.fundef.typ,
-            types.Fun(
-                [typ for _, typ in e.fundef.args],
-                self.visit(
-                    env.update({name: typ for name, typ in e.fundef.args}),
-                    e.fundef.body,
-                ),
-            ),
-        )
-        return self.visit(env, e.body)
-
-    def visit_LetTuple(self, env, e):
-        unify(types.Tuple([typ for _, typ in e.pat]), self.visit(env, e.bound))
-        return self.visit(env.update({name: typ for name, typ in e.pat}), e.body)
+    def enter_Let(self, env, e):
+        self.unify(e.bound, e.typ, self.visit(env, e.bound))
+        mark = env.mark()
+        env.bind(e.name, e.typ)
+        return env.leave(mark), (env,), e.body
+
+    def enter_LetRec(self, env, e):
+        mark = env.mark()
+        env.bind(e.fundef.name, e.fundef.typ)
+        with env.scope(e.fundef.args):
+            t = self.visit(env, e.fundef.body)
+        fun = types.Fun([typ for _, typ in e.fundef.args], t)
+        self.unify(e.fundef, e.fundef.typ, fun)
+        return env.leave(mark), (env,), e.body
+
+    def enter_LetTuple(self, env, e):
+        t = types.Tuple([typ for _, typ in e.pat])
+        self.unify(e.bound, t, self.visit(env, e.bound))
+        mark = env.mark()
+        env.update(e.pat)
+        return env.leave(mark), (env,), e.body
 
     def visit_If(self, env, e):
-        unify(self.visit(env, e.cond), types.Bool)
+        self.unify(e.cond, self.visit(env, e.cond), types.Bool)
         t1 = self.visit(env, e.then)
         t2 = self.visit(env, e.else_)
-        unify(t1, t2)
+        self.unify(e, t1, t2)
         return t1
 
     def visit_Tuple(self, env, e):
         return types.Tuple([self.visit(env, e) for e in e.elems])
 
     def visit_Array(self, env, e):
-        unify(self.visit(env, e.len), types.Int)
+        self.unify(e.len, self.visit(env, e.len), types.Int)
         return types.Array(self.visit(env, e.init))
 
     def visit_Get(self, env, e):
         t = types.Var()
-        unify(types.Array(t), self.visit(env, e.array))
-        unify(types.Int, self.visit(env, e.index))
+        self.unify(e.array, types.Array(t), self.visit(env, e.array))
+        self.unify(e.index, types.Int, self.visit(env, e.index))
         return t
 
     def visit_Put(self, env, e):
         t = types.Var()
-        unify(types.Array(t), self.visit(env, e.array))
-        unify(types.Int, self.visit(env, e.index))
+        self.unify(e.array, types.Array(t), self.visit(env, e.array))
+        self.unify(e.index, types.Int, self.visit(env, e.index))
         return types.Unit
 
     def visit_App(self, env, e):
         t = types.Var()
-        unify(
+        self.unify(
+            e,
             self.visit(env, e.fun),
             types.Fun([self.visit(env, arg) for arg in e.args], t),
         )
         return t
 
 
-def unify(t1, t2):
-    "型が合うように、型変数への代入をする"
-    if t1 == t2 and t1 in (types.Unit, types.Bool, types.Int, types.Float):
+def find(t):
+    """型tが型変数なら、代入をたどった先の代表の型を返す
+
+    代入は型変数を根とするunion-findの木で、たどった型変数を代表に直接つなぎ直す(経路圧縮)。
+    代表は代入のない型変数か、型変数でない型。
+    """
+    if type(t) is not types.Var:
+        return t
+    root = t
+    while type(root) is types.Var and root.ref.contents is not None:
+        root = root.ref.contents
+    while t is not root:
+        t.ref.contents, t = root, t.ref.contents
+    return root
+
+
+def unify(t1, t2, unifying=None):
+    """型が合うように、型変数への代入をする
+
+    出現検査は代入のたびには行わず、deref_typでまとめて行う。代入で循環した型ができても
+    止まるように、unifyingに単一化の途中の型のidを持ち、同じ型に戻ってきたら失敗とする。
+    """
+    t1 = find(t1)
+    t2 = find(t2)
+    if t1 is t2:
         return
 
+    if types.is_var(t1) and types.is_var(t2):
+        # rankの小さい木を大きい木の下につなぐ
+        r1, r2 = t1.ref, t2.ref
+        if r1.rank < r2.rank:
+            r1.contents = t2
+        else:
+            r2.contents = t1
+            if r1.rank == r2.rank:
+                r1.rank += 1
+        return
+    elif types.is_var(t1):
+        t1.ref.contents = t2
+        return
+    elif types.is_var(t2):
+        t2.ref.contents = t1
+        return
+
+    if unifying is None:
+        unifying = set()
+    elif id(t1) in unifying:
+        raise UnifyError(t1, t2)
+    unifying.add(id(t1))
+
     if types.is_fun(t1) and types.is_fun(t2):
         if len(t1.args) != len(t2.args):
             raise UnifyError(t1, t2)
         for t1_, t2_ in zip(t1.args, t2.args):
-            unify(t1_, t2_)
-        unify(t1.ret, t2.ret)
-        return
-
-    if types.is_tuple(t1) and types.is_tuple(t2):
+            unify(t1_, t2_, unifying)
+        unify(t1.ret, t2.ret, unifying)
+    elif types.is_tuple(t1) and types.is_tuple(t2):
         if len(t1.elems) != len(t2.elems):
             raise UnifyError(t1, t2)
         for t1_, t2_ in zip(t1.elems, t2.elems):
-            unify(t1_, t2_)
-        return
+            unify(t1_, t2_, unifying)
+    elif types.is_array(t1) and types.is_array(t2):
+        unify(t1.elem, t2.elem, unifying)
+    else:
+        raise UnifyError(t1, t2)
 
-    if types.is_array(t1) and types.is_array(t2):
-        unify(t1.elem, t2.elem)
-        return
+    unifying.discard(id(t1))
 
-    if types.is_var(t1) and types.is_var(t2) and t1.ref == t2.ref:
-        return
-    elif types.is_var(t1) and t1.ref.contents:
-        unify(t1.ref.contents, t2)
-        return
-    elif types.is_var(t2) and t2.ref.contents:
-        unify(t1, t2.ref.contents)
-        return
-    elif types.is_var(t1) and t1.ref.contents is None:
-        if occurs_check(t1.ref, t2):
-            raise UnifyError(t1, t2)
-        t1.ref.contents = t2
-        return
-    elif types.is_var(t2) and t2.ref.contents is None:
-        if occurs_check(t2.ref, t1):
-            raise UnifyError(t1, t2)
-        t2.ref.contents = t1
-        return
-
-    raise UnifyError(t1, t2)
 
+# deref_typでたどっている途中の型の印
+_visiting = object()
 
-def occurs_check(r1, t2):
-    "出現検査: 型t2の中に型変数の参照r1が現れるかチェック"
-    if types.is_fun(t2):
-        return any(occurs_check(r1, t) for t in t2.args) or occurs_check(r1, t2.ret)
-    elif types.is_tuple(t2):
-        return any(occurs_check(r1, t) for t in t2.elems)
-    elif types.is_array(t2):
-        return occurs_check(r1, t2.elem)
-    elif types.is_var(t2):
-        r2 = t2.ref
-        if r1 == r2:
-            return True
-        elif r2.contents is None:
-            return False
-        elif r2.contents is not None:
-            return occurs_check(r1, r2.contents)
-    return False
-
-
-def deref_typ(t):
-    if types.is_fun(t):
-        return types.Fun([deref_typ(x) for x in t.args], deref_typ(t.ret))
-    elif types.is_tuple(t):
-        return types.Tuple([deref_typ(x) for x in t.elems])
-    elif types.is_array(t):
-        return types.Array(deref_typ(t.elem))
-    elif types.is_var(t) and t.ref.contents is None:
-        logger.warn("uninstantiated type variable detected; assuming int.")
-        t.ref.contents = types.Int
-        return types.Int
-    elif types.is_var(t) and t.ref.contents is not None:
-        t2 = deref_typ(t.ref.contents)
-        t.ref.contents = t2
-        return t2
-    return t
 
+def deref_typ(t, memo):
+    """型変数を代入された型で置き換えた型を返す
 
-def deref_term(e):
-    name = e.__class__.__name__
-    if name == "Let":
-        e.typ = deref_typ(e.typ)
-    elif name == "LetRec":
-        e.fundef.typ = deref_typ(e.fundef.typ)
-        e.fundef.args = [(name, deref_typ(arg)) for name, arg in e.fundef.args]
-    elif name == "LetTuple":
-        e.pat = [(name, deref_typ(t)) for name, t in e.pat]
-
-    for c in e.children():
-        deref_term(c)
+    memoは、たどった型と結果の型のidから(型, 結果)への対応で、共有された型や
+    置き換えた後の型は一度だけたどる (型も持っておき、idが使い回されないようにする)。
+    代入が循環していれば(出現検査の失敗)、ValueErrorを送出する。
+    """
+    root = find(t)
+    entry = memo.get(id(root))
+    if entry is not None and entry[0] is root:
+        r = entry[1]
+        if r is _visiting:
+            raise ValueError("cannot construct an infinite type")
+    elif types.is_var(root):
+        logger.warn("uninstantiated type variable detected; assuming int.")
+        root.ref.contents = types.Int
+        r = types.Int
+    elif types.is_fun(root) or types.is_tuple(root) or types.is_array(root):
+        memo[id(root)] = (root, _visiting)
+        if types.is_fun(root):
+            r = types.Fun.of(
+                [deref_typ(x, memo) for x in root.args], deref_typ(root.ret, memo)
+            )
+        elif types.is_tuple(root):
+            r = types.Tuple.of([deref_typ(x, memo) for x in root.elems])
+        else:
+            r = types.Array.of(deref_typ(root.elem, memo))
+        memo[id(root)] = (root, r)
+        memo[id(r)] = (r, r)
+    else:
+        r = root
+    if types.is_var(t):
+        t.ref.contents = r
+    return r
 
 
 def typing(e, extenv):
+    """型推論
+
+    構文木の型は型変数のまま残し、代入された型にするのはK正規化で使うときに行う
+    (knorm.Visitor.deref)。外部変数の型環境extenvは、ここで代入された型にする。
+    """
     visitor = Visitor(extenv)
+    t = visitor.visit(Env(), e)
     try:
-        unify(types.Unit, visitor.visit(pmap(), e))
+        unify(types.Unit, t)
     except UnifyError:
         raise ValueError("top level does not have type unit")
 
+    memo = {}
     for name, t in extenv.items():
-        extenv[name] = deref_typ(t)
-    deref_term(e)
+        extenv[name] = deref_typ(t, memo)
@@ -3,3 +3,29 @@ def find(env, x):
         return env[x]
     else:
         return x
+
+
+def union(s, t):
+    "集合sとtの和を、大きい方を破壊的に更新して返す"
+    if len(s) < len(t):
+        s, t = t, s
+    s |= t
+    return s
+
+
+def find_all(env, xs):
+    "xsの各変数をenvで置き換えたリストを返す (置き換えがなければxsをそのまま返す)"
+    ys = [find(env, x) for x in xs]
+    return xs if ys == xs else ys
+
+
+def rebuild(e, *args):
+    """式eの要素をargsで置き換えた式を返す
+
+    argsの要素がすべて元の要素と同じオブジェクトならe自身を返すので、
+    最適化で変化しなかった部分木は同じオブジェクトのまま残る。
+    """
+    for old, new in zip(e[1:], args):
+        if old is not new:
+            return (e[0], *args)
+    return e
@@ -0,0 +1,72 @@
+def pass_through(self, *args):
+    "visit_<種類>を持たないノードをそのまま返すハンドラ"
+    return args[-1]
+
+
+class Visitor:
+    """ノードの種類からvisit_<種類>メソッドへの振り分け表を持つVisitorの基底クラス
+
+    サブクラスはkindsに扱うノードの種類を列挙する。振り分け表dispatchは
+    クラスの定義時に一度だけ作られ、visit_<種類>を持たない種類にはdefaultが
+    割り当てられる (defaultがNoneならその種類は表に載らない)。
+
+    Let・LetRec・LetTupleのように最後の要素が続きの式であるノードは、
+    visit_<種類>の代わりにenter_<種類>を定義すると、visit_spineによって
+    再帰せずに続きの式をたどる。長いletの列でもPythonのスタックを消費しない。
+    """
+
+    kinds = ()
+    default = None
+    function = None  # たどっている本体の関数の名前 (withinで設定する)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        dispatch = {}
+        enter = {}
+        for kind in cls.kinds:
+            handler = getattr(cls, "enter_" + kind, None)
+            if handler is not None:
+                enter[kind] = handler
+                dispatch[kind] = cls.visit_spine
+                continue
+            handler = getattr(cls, "visit_" + kind, cls.default)
+            if handler is not None:
+                dispatch[kind] = handler
+        cls.dispatch = dispatch
+        cls.enter = enter
+
+    def within(self, name, f, *args):
+        "関数nameの本体をたどるf(*args)を、self.functionをnameにして実行する"
+        function = self.function
+        self.function = name
+        try:
+            return f(*args)
+        finally:
+            self.function = function
+
+    @staticmethod
+    def kind_of(e):
+        "ノードの種類 (中間表現のタプルでは先頭の要素)"
+        return e[0]
+
+    def visit_spine(self, *args):
+        """enter_<種類>を持つノードの列を、続きの式へループでたどる
+
+        enter_<種類>(self, *args, e)は(leave, args, e2)を返す。e2は続けてたどる式で、
+        argsはe2をたどるときの引数、leaveはe2の結果からeの結果を作る関数
+        (Noneならe2の結果をそのままeの結果とする)。leaveは内側のノードから順に呼ばれる。
+        """
+        *args, e = args
+        enter = self.enter
+        kind_of = self.kind_of
+        leaves = []
+        kind = kind_of(e)
+        while kind in enter:
+            leave, args, e = enter[kind](self, *args, e)
+            if leave is not None:
+                leaves.append(leave)
+            kind = kind_of(e)
+        result = self.dispatch[kind](self, *args, e)
+        for leave in reversed(leaves):
+            result = leave(result)
+        return result
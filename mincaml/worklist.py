@@ -0,0 +1,41 @@
+class Worklist:
+    """最適化の反復の間で、変化した関数(LetRecの本体)を記録する
+
+    各パスは変化のない部分木を同じオブジェクトのまま返すので、
+    本体が別のオブジェクトになった関数が、その反復で変化した関数である。
+    次の反復では、前の反復とこの反復のそれまでのパスで変化しなかった関数の本体を
+    読み飛ばす。
+    ただし、パスの環境に束縛された変数を本体が参照している場合は読み飛ばさない。
+    """
+
+    def __init__(self):
+        self.dirty = None  # 前の反復で変化した関数の名前 (Noneなら全ての関数)
+        self.changed = set()  # この反復で変化した関数の名前
+        self.fvs = {}  # 関数の名前から、本体の自由変数のうち引数でないものへの対応
+        self.summaries = {}  # 関数の名前から、インライン展開の判断に使う要約への対応
+
+    def skip(self, fundef, env=()):
+        "fundefの本体を読み飛ばしてよいか判定する"
+        name = fundef.name
+        if self.dirty is None or name in self.dirty or name in self.changed:
+            return False
+        fv = self.fvs.get(name)
+        if fv is None:
+            return False
+        return not any(x in env for x in fv)
+
+    def update(self, fundef, body):
+        "fundefの本体をbodyに置き換え、変化があれば記録する"
+        if body is fundef.body:
+            return fundef
+        self.changed.add(fundef.name)
+        return fundef._replace(body=body)
+
+    def visit_body(self, fundef, visit, env=()):
+        "読み飛ばせない場合に限ってfundefの本体をvisitで変換する"
+        if self.skip(fundef, env):
+            return fundef
+        return self.update(fundef, visit(fundef.body))
+
+    def next_iteration(self):
+        self.dirty, self.changed = self.changed, set()
@@ -1,11 +1,34 @@
 from collections import namedtuple
 
 
-REGS = ("%eax", "%ebx", "%ecx", "%edx", "%esi", "%edi")
-REG_SP = "%ebp"
+# x86-64のレジスタ (%r15と%xmm15は値の入れ替えに使うので割り当てない)
+REGS = (
+    "%rax",
+    "%rbx",
+    "%rcx",
+    "%rdx",
+    "%rsi",
+    "%rdi",
+    "%r8",
+    "%r9",
+    "%r10",
+    "%r11",
+    "%r12",
+    "%r13",
+    "%r14",
+)
+FREGS = tuple(f"%xmm{i}" for i in range(15))
+REG_CL = REGS[-1]  # クロージャのアドレス
+REG_SW = "%r15"
+REG_FSW = "%xmm15"
+REG_SP = "%rbp"
 REG_HP = "min_caml_hp"
 
 
+def is_reg(x):
+    return x[0] == "%" or x == REG_HP
+
+
 def V(id):
     return ("V", id)
 
@@ -31,13 +54,24 @@ def align(i):
 
 
 def free_variables(e):
+    # Letの続きの式は再帰せずにたどり、内側から変数を集める
+    spine = []
+    while e[0] == "Let":
+        spine.append(e)
+        e = e[3]
+    if e[0] == "Ans":
+        fv = exp_free_variables(e[1])
+    else:
+        fv = exp_free_variables(e)
+    for (_, (x, t), e1, _) in reversed(spine):
+        fv.add(x)
+        fv |= exp_free_variables(e1)
+    return fv
+
+
+def exp_free_variables(e):
     name = e[0]
-    if name == "Ans":
-        return free_variables(e[1])
-    elif name == "Let":
-        (x, t), e1, e2 = e[1:]
-        return free_variables(e1) | {x} | free_variables(e2)
-    elif name in ("Nop", "Set", "SetL", "Comment", "Restore"):
+    if name in ("Nop", "Set", "SetL", "Comment", "Restore"):
         return set()
     elif name in ("Mov", "Neg", "FMovD", "FNegD", "Save"):
         return {e[1]}
@@ -74,3 +108,55 @@ def fv_id_or_imm(e):
 
 
 Fundef = namedtuple("Fundef", "name args fargs body ret")
+
+
+def listing(prog):
+    """仮想マシンコードのプログラムprog (定数テーブル, 関数の列, メインの式) の一覧
+
+    命令を一行ずつ並べ、条件分岐の中だけを字下げする。Letの列は再帰せずにたどるので、
+    pprintと違って長いletの列でもPythonのスタックを消費せず、出力も命令の数に比例する。
+    """
+    data, fundefs, e = prog
+    lines = [f"{label}: {d!r}" for label, d in data]
+    for fundef in fundefs:
+        args = ", ".join(list(fundef.args) + list(fundef.fargs))
+        lines.append(f"{fundef.name}({args}) -> {fundef.ret}:")
+        body_listing(lines, fundef.body, 1)
+    lines.append("main:")
+    body_listing(lines, e, 1)
+    return "\n".join(lines) + "\n"
+
+
+def body_listing(lines, e, indent):
+    "命令列eの各命令をindent段の字下げでlinesに加える"
+    stack = [(indent, e)]
+    while stack:
+        indent, e = stack.pop()
+        pad = "    " * indent
+        if type(e) is str:
+            lines.append(pad + e)
+            continue
+        if e[0] == "Let":
+            (x, t), exp = e[1], e[2]
+            stack.append((indent, e[3]))
+            dest = f"{x}:{t} = "
+        else:
+            exp = e[1]
+            dest = ""
+        name = exp[0]
+        if name in ("IfEq", "IfLE", "IfGE", "IfFEq", "IfFLE"):
+            lines.append(f"{pad}{dest}{name} {operand(exp[1])}, {operand(exp[2])}")
+            stack.append((indent + 1, exp[4]))
+            stack.append((indent, "else"))
+            stack.append((indent + 1, exp[3]))
+        else:
+            operands = ", ".join(operand(v) for v in exp[1:])
+            lines.append(f"{pad}{dest}{name} {operands}".rstrip())
+
+
+def operand(v):
+    if type(v) is tuple:
+        return str(v[1]) if v[0] == "V" else f"${v[1]}"
+    if type(v) is list:
+        return "[" + ", ".join(v) + "]"
+    return str(v)
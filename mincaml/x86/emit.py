@@ -0,0 +1,401 @@
+"""x86-64のアセンブリ生成
+
+レジスタ割り当ての後の仮想マシンコードから、GNU asのAT&T記法のアセンブリを作る。
+浮動小数点数はSSE2の命令で扱う。MinCamlのemit.mlと同じく、Saveした変数はREG_SPの指す
+MinCamlのスタックに置き、関数を呼び出すときはREG_SPをフレームの大きさだけ進める
+(スタックは上に伸び、%rspのスタックには戻り番地だけを積む)。
+
+外部関数 (libmincaml.cのmin_caml_*) はC言語の関数なので、呼び出すときだけ
+System V ABIに従って引数をC_REGS・C_FREGSに置き、%rspを16バイトに揃える。
+"""
+
+import os
+import struct
+import subprocess
+import tempfile
+
+from .. import ir
+from .. import visitor
+from .asm import REGS, FREGS, REG_CL, REG_SW, REG_FSW, REG_SP, REG_HP, is_reg
+
+# 外部関数の引数のレジスタ (System V ABI)
+C_REGS = ("%rdi", "%rsi", "%rdx", "%rcx", "%r8", "%r9")
+C_FREGS = tuple(f"%xmm{i}" for i in range(8))
+# min_caml_startで退避する、Cの関数が保存すべきレジスタ
+CALLEE_SAVED = ("%rbx", "%rbp", "%r12", "%r13", "%r14", "%r15")
+
+# 結果が整数・浮動小数点数の命令
+INT_KINDS = ("Set", "SetL", "Mov", "Neg", "Add", "Sub", "Ld")
+FLOAT_KINDS = ("FMovD", "FNegD", "FAddD", "FSubD", "FMulD", "FDivD", "LdDF")
+
+# 比較命令の後の、(成り立つとき, 成り立たないとき)の分岐命令
+JUMPS = {
+    "IfEq": ("je", "jne"),
+    "IfLE": ("jle", "jg"),
+    "IfGE": ("jge", "jl"),
+    "IfFEq": ("je", "jne"),
+    "IfFLE": ("jbe", "ja"),
+}
+
+# 末尾の命令の結果を返すことを表す、結果を置くレジスタの代わり
+TAIL = "tail"
+
+RUNTIME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "libmincaml.c")
+
+
+def operand(x):
+    "レジスタxのオペランド (ヒープポインタはメモリ上の変数)"
+    return f"{REG_HP}(%rip)" if x == REG_HP else x
+
+
+def is_imm32(i):
+    "iが符号付き32ビットの即値で表せるか"
+    return -(1 << 31) <= i < 1 << 31
+
+
+def shuffle(sw, moves):
+    """並列の代入moves ((元, 先)の列) を、順に行える代入の列にする
+
+    先が他の代入の元でない代入から行い、循環だけが残ったらswを経由して一つ外す。
+    """
+    moves = [(x, y) for x, y in moves if x != y]
+    result = []
+    while moves:
+        sources = {x for x, _ in moves}
+        acyclic = [(x, y) for x, y in moves if y not in sources]
+        if acyclic:
+            result.extend(acyclic)
+            moves = [(x, y) for x, y in moves if y in sources]
+        else:
+            (x, y), *moves = moves
+            result.append((y, sw))
+            result.append((x, y))
+            moves = [(sw if x2 == y else x2, z) for x2, z in moves if x2 != z]
+    return result
+
+
+class Emitter(visitor.Visitor):
+    """命令列のアセンブリを書き出す
+
+    stackmapはSaveした変数からスタックの位置(8バイト単位)への対応で、関数の中で
+    一度付けた位置は変えない。stacksetはその時点ですでにスタックにある変数の集合で、
+    分岐の後は両方の節の共通部分になる。
+    """
+
+    kinds = ir.VIRTUAL.kinds
+
+    def __init__(self, functions):
+        # プログラムの関数のラベルの集合 (それ以外は外部関数)
+        self.functions = functions
+        self.lines = []
+        self.labels = 0
+        self.stackmap = {}
+        self.stackset = set()
+
+    def emit(self, s):
+        self.lines.append(f"\t{s}")
+
+    def label(self, l):
+        self.lines.append(f"{l}:")
+
+    def gen_label(self, s):
+        "アセンブリの中だけで使うラベル"
+        self.labels += 1
+        return f".L{s}{self.labels}"
+
+    def visit(self, dest, e):
+        "destは末尾の命令の結果を置くレジスタ (関数の本体ならTAIL)"
+        return self.dispatch[e[0]](self, dest, e)
+
+    def enter_Let(self, dest, e):
+        (x, _), exp, e2 = e[1:]
+        self.instruction(x, exp)
+        return None, (dest,), e2
+
+    def visit_Ans(self, dest, e):
+        exp = e[1]
+        name = exp[0]
+        if dest != TAIL:
+            self.instruction(dest, exp)
+        elif name in JUMPS:
+            self.if_(TAIL, exp)
+        elif name == "CallCls" or name == "CallDir" and exp[1] in self.functions:
+            self.call(TAIL, exp)
+        else:
+            if name in INT_KINDS:
+                self.instruction(REGS[0], exp)
+            elif name in FLOAT_KINDS:
+                self.instruction(FREGS[0], exp)
+            else:
+                self.instruction(None, exp)
+            self.emit("ret")
+
+    def offset(self, x):
+        return f"{8 * self.stackmap[x]}({REG_SP})"
+
+    def stacksize(self):
+        return 8 * len(self.stackmap)
+
+    def imm(self, y):
+        "即値または変数のオペランド (32ビットに収まらない即値はREG_SWに置く)"
+        if y[0] == "V":
+            return operand(y[1])
+        if is_imm32(y[1]):
+            return f"${y[1]}"
+        self.emit(f"movabsq ${y[1]}, {REG_SW}")
+        return REG_SW
+
+    def address(self, x, y, i):
+        "レジスタx・即値または変数y・倍率iの番地"
+        if y[0] == "V":
+            return f"({x},{y[1]},{i})"
+        if is_imm32(y[1] * i):
+            return f"{y[1] * i}({x})"
+        self.emit(f"movabsq ${y[1] * i}, {REG_SW}")
+        return f"({x},{REG_SW})"
+
+    def instruction(self, x, exp):
+        "命令expの結果をレジスタxに置く (結果を使わなければxはレジスタでない)"
+        name = exp[0]
+        if name in INT_KINDS or name in FLOAT_KINDS:
+            if not is_reg(x):
+                return
+        elif name in JUMPS:
+            return self.if_(x, exp)
+        elif name in ("CallCls", "CallDir"):
+            return self.call(x, exp)
+        return self.dispatch[name](self, operand(x), exp)
+
+    def visit_Nop(self, x, exp):
+        pass
+
+    def visit_Set(self, x, exp):
+        i = exp[1]
+        self.emit(f"movq ${i}, {x}" if is_imm32(i) else f"movabsq ${i}, {x}")
+
+    def visit_SetL(self, x, exp):
+        self.emit(f"leaq {exp[1]}(%rip), {x}")
+
+    def visit_Mov(self, x, exp):
+        y = operand(exp[1])
+        if x != y:
+            self.emit(f"movq {y}, {x}")
+
+    def visit_Neg(self, x, exp):
+        self.visit_Mov(x, exp)
+        self.emit(f"negq {x}")
+
+    def visit_Add(self, x, exp):
+        y, z = operand(exp[1]), exp[2]
+        if z == ("V", x):
+            self.emit(f"addq {y}, {x}")
+        else:
+            if x != y:
+                self.emit(f"movq {y}, {x}")
+            self.emit(f"addq {self.imm(z)}, {x}")
+
+    def visit_Sub(self, x, exp):
+        y, z = operand(exp[1]), exp[2]
+        if z == ("V", x):
+            self.emit(f"subq {y}, {x}")
+            self.emit(f"negq {x}")
+        else:
+            if x != y:
+                self.emit(f"movq {y}, {x}")
+            self.emit(f"subq {self.imm(z)}, {x}")
+
+    def visit_Ld(self, x, exp):
+        _, y, z, i = exp
+        self.emit(f"movq {self.address(y, z, i)}, {x}")
+
+    def visit_St(self, _, exp):
+        _, x, y, z, i = exp
+        self.emit(f"movq {operand(x)}, {self.address(y, z, i)}")
+
+    def visit_FMovD(self, x, exp):
+        y = exp[1]
+        if x != y:
+            self.emit(f"movapd {y}, {x}")
+
+    def visit_FNegD(self, x, exp):
+        self.visit_FMovD(x, exp)
+        self.emit(f"xorpd min_caml_fnegd(%rip), {x}")
+
+    def commutative(self, op, x, exp):
+        y, z = exp[1:]
+        if x == z:
+            self.emit(f"{op} {y}, {x}")
+        else:
+            if x != y:
+                self.emit(f"movapd {y}, {x}")
+            self.emit(f"{op} {z}, {x}")
+
+    def noncommutative(self, op, x, exp):
+        y, z = exp[1:]
+        if x == z and x != y:
+            self.emit(f"movapd {z}, {REG_FSW}")
+            z = REG_FSW
+        if x != y:
+            self.emit(f"movapd {y}, {x}")
+        self.emit(f"{op} {z}, {x}")
+
+    def visit_FAddD(self, x, exp):
+        self.commutative("addsd", x, exp)
+
+    def visit_FSubD(self, x, exp):
+        self.noncommutative("subsd", x, exp)
+
+    def visit_FMulD(self, x, exp):
+        self.commutative("mulsd", x, exp)
+
+    def visit_FDivD(self, x, exp):
+        self.noncommutative("divsd", x, exp)
+
+    def visit_LdDF(self, x, exp):
+        _, y, z, i = exp
+        self.emit(f"movsd {self.address(y, z, i)}, {x}")
+
+    def visit_StDF(self, _, exp):
+        _, x, y, z, i = exp
+        self.emit(f"movsd {x}, {self.address(y, z, i)}")
+
+    def visit_Comment(self, _, exp):
+        self.emit(f"# {exp[1]}")
+
+    def visit_Save(self, _, exp):
+        x, y = exp[1:]
+        if y in self.stackset:
+            return
+        self.stackset.add(y)
+        if y not in self.stackmap:
+            self.stackmap[y] = len(self.stackmap)
+        op = "movsd" if x in FREGS else "movq"
+        self.emit(f"{op} {x}, {self.offset(y)}")
+
+    def visit_Restore(self, x, exp):
+        op = "movsd" if x in FREGS else "movq"
+        self.emit(f"{op} {self.offset(exp[1])}, {x}")
+
+    def if_(self, dest, exp):
+        "分岐命令 (destがTAILなら、両方の節の最後で戻る)"
+        name, x, y, e1, e2 = exp
+        if isinstance(y, str):
+            self.emit(f"comisd {y}, {x}")
+        else:
+            self.emit(f"cmpq {self.imm(y)}, {x}")
+        b, bn = JUMPS[name]
+        b_else = self.gen_label(f"{b}_else")
+        self.emit(f"{bn} {b_else}")
+        stackset = set(self.stackset)
+        self.visit(dest, e1)
+        if dest == TAIL:
+            self.label(b_else)
+            self.stackset = stackset
+            self.visit(dest, e2)
+            return
+        stackset1 = self.stackset
+        b_cont = self.gen_label(f"{b}_cont")
+        self.emit(f"jmp {b_cont}")
+        self.label(b_else)
+        self.stackset = stackset
+        self.visit(dest, e2)
+        self.label(b_cont)
+        self.stackset &= stackset1
+
+    def call(self, dest, exp):
+        "関数呼び出し (destがTAILなら末尾呼び出し。外部関数の呼び出しは末尾でも戻ってくる)"
+        name, f, ys, zs = exp
+        if name == "CallDir" and f not in self.functions:
+            self.args([], ys, zs, C_REGS, C_FREGS)
+            # %rspは戻り番地の数だけずれているので、Cの関数を呼ぶ間だけ揃える
+            # (REG_SWはCの関数が保存するレジスタ)
+            self.emit(f"movq %rsp, {REG_SW}")
+            self.emit("andq $-16, %rsp")
+            self.emit(f"call {f}")
+            self.emit(f"movq {REG_SW}, %rsp")
+        elif dest == TAIL:
+            if name == "CallCls":
+                self.args([(f, REG_CL)], ys, zs, REGS, FREGS)
+                self.emit(f"jmp *({REG_CL})")
+            else:
+                self.args([], ys, zs, REGS, FREGS)
+                self.emit(f"jmp {f}")
+            return
+        else:
+            if name == "CallCls":
+                self.args([(f, REG_CL)], ys, zs, REGS, FREGS)
+            else:
+                self.args([], ys, zs, REGS, FREGS)
+            ss = self.stacksize()
+            if ss > 0:
+                self.emit(f"addq ${ss}, {REG_SP}")
+            self.emit(f"call *({REG_CL})" if name == "CallCls" else f"call {f}")
+            if ss > 0:
+                self.emit(f"subq ${ss}, {REG_SP}")
+        if dest in REGS and dest != REGS[0]:
+            self.emit(f"movq {REGS[0]}, {dest}")
+        elif dest in FREGS and dest != FREGS[0]:
+            self.emit(f"movapd {FREGS[0]}, {dest}")
+
+    def args(self, moves, ys, zs, regs, fregs):
+        "引数ys・zsを、レジスタregs・fregsに前から置く (movesは他に行う代入)"
+        if len(moves) + len(ys) > len(regs) or len(zs) > len(fregs):
+            raise ValueError("too many arguments")
+        moves = moves + list(zip(ys, regs))
+        for y, r in shuffle(REG_SW, moves):
+            self.emit(f"movq {y}, {r}")
+        for z, r in shuffle(REG_FSW, list(zip(zs, fregs))):
+            self.emit(f"movapd {z}, {r}")
+
+    def fundef(self, fundef):
+        self.label(fundef.name)
+        self.stackmap = {}
+        self.stackset = set()
+        self.visit(TAIL, fundef.body)
+
+
+def emit(prog):
+    "レジスタを割り当てたプログラムprogのアセンブリを返す"
+    data, fundefs, e = prog
+    emitter = Emitter({f.name for f in fundefs})
+    lines = emitter.lines
+    lines.append("\t.data")
+    lines.append("\t.balign 16")
+    # FNegDで符号のビットだけを反転するマスク
+    emitter.label("min_caml_fnegd")
+    emitter.emit(".quad 0x8000000000000000, 0")
+    for label, d in data:
+        emitter.label(label)
+        (bits,) = struct.unpack("<Q", struct.pack("<d", d))
+        emitter.emit(f".quad {bits:#018x}  # {d!r}")
+    lines.append("\t.text")
+    for fundef in fundefs:
+        emitter.fundef(fundef)
+    lines.append("\t.globl min_caml_start")
+    emitter.label("min_caml_start")
+    for r in CALLEE_SAVED:
+        emitter.emit(f"pushq {r}")
+    emitter.emit(f"movq %rdi, {REG_SP}")
+    emitter.emit(f"movq %rsi, {operand(REG_HP)}")
+    emitter.stackmap = {}
+    emitter.stackset = set()
+    emitter.visit(REGS[0], e)
+    for r in reversed(CALLEE_SAVED):
+        emitter.emit(f"popq {r}")
+    emitter.emit("ret")
+    lines.append('\t.section .note.GNU-stack,"",@progbits')
+    lines.append("")
+    return "\n".join(lines)
+
+
+def link(asm, output, cc=None):
+    """アセンブリasmをランタイム(RUNTIME)とリンクして、実行ファイルoutputを作る
+
+    ccを与えなければ、環境変数CCかccを使う。
+    """
+    cc = cc or os.environ.get("CC", "cc")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "prog.s")
+        with open(path, "w") as fp:
+            fp.write(asm)
+        subprocess.run([cc, "-O2", "-o", output, path, RUNTIME, "-lm"], check=True)
@@ -0,0 +1,117 @@
+/*
+ * MinCamlのx86-64のランタイム
+ *
+ * emit.pyが生成したアセンブリとリンクする。mainがMinCamlのスタックとヒープを確保して
+ * min_caml_startを呼び、MinCamlのプログラムは外部関数min_caml_*を呼び出す。
+ * ヒープはmin_caml_hpから上に伸び、解放しない。
+ */
+
+#include <math.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#ifndef MIN_CAML_STACK_SIZE
+#define MIN_CAML_STACK_SIZE (64L << 20)
+#endif
+#ifndef MIN_CAML_HEAP_SIZE
+#define MIN_CAML_HEAP_SIZE (1L << 30)
+#endif
+
+/* ヒープの次に割り当てる番地 (MinCamlのプログラムも直接進める) */
+char *min_caml_hp;
+
+void min_caml_start(char *sp, char *hp);
+
+void min_caml_print_newline(void) { putchar('\n'); }
+
+void min_caml_print_int(long n) { printf("%ld", n); }
+
+void min_caml_print_byte(long n) { putchar((int)n); }
+
+/* OCamlのstring_of_floatと同じく、整数に見える数には.を付ける */
+static void print_float(FILE *fp, double d)
+{
+    char buf[32];
+    snprintf(buf, sizeof(buf), "%.12g", d);
+    fputs(buf, fp);
+    if (strspn(buf, "-0123456789") == strlen(buf))
+        fputc('.', fp);
+}
+
+void min_caml_print_float(double d) { print_float(stdout, d); }
+
+void min_caml_prerr_int(long n) { fprintf(stderr, "%ld", n); }
+
+void min_caml_prerr_byte(long n) { fputc((int)n, stderr); }
+
+void min_caml_prerr_float(double d) { print_float(stderr, d); }
+
+long min_caml_read_int(void)
+{
+    long n;
+    if (scanf("%ld", &n) != 1) {
+        fputs("read_int: no integer\n", stderr);
+        exit(1);
+    }
+    return n;
+}
+
+double min_caml_read_float(void)
+{
+    double d;
+    if (scanf("%lf", &d) != 1) {
+        fputs("read_float: no float\n", stderr);
+        exit(1);
+    }
+    return d;
+}
+
+long *min_caml_create_array(long n, long x)
+{
+    long *a = (long *)min_caml_hp;
+    for (long i = 0; i < n; i++)
+        a[i] = x;
+    min_caml_hp += (n > 0 ? n : 0) * sizeof(long);
+    return a;
+}
+
+double *min_caml_create_float_array(long n, double d)
+{
+    double *a = (double *)min_caml_hp;
+    for (long i = 0; i < n; i++)
+        a[i] = d;
+    min_caml_hp += (n > 0 ? n : 0) * sizeof(double);
+    return a;
+}
+
+double min_caml_float_of_int(long n) { return (double)n; }
+
+long min_caml_int_of_float(double d) { return (long)d; }
+
+long min_caml_truncate(double d) { return (long)d; }
+
+double min_caml_abs_float(double d) { return fabs(d); }
+
+double min_caml_sqrt(double d) { return sqrt(d); }
+
+double min_caml_floor(double d) { return floor(d); }
+
+double min_caml_cos(double d) { return cos(d); }
+
+double min_caml_sin(double d) { return sin(d); }
+
+double min_caml_atan(double d) { return atan(d); }
+
+int main(void)
+{
+    char *sp = malloc(MIN_CAML_STACK_SIZE);
+    char *hp = malloc(MIN_CAML_HEAP_SIZE);
+    if (sp == NULL || hp == NULL) {
+        fputs("cannot allocate the stack and the heap\n", stderr);
+        return 1;
+    }
+    min_caml_start(sp, hp);
+    fflush(stdout);
+    return 0;
+}
@@ -0,0 +1,146 @@
+"""トップレベルの関数ごとの仮想マシンコード生成と即値最適化を、プロセスプールで並列に行う
+
+各ワーカーは変数名と浮動小数点数の定数のラベルを仮の名前で作り、その順序を記録する。
+親プロセスは関数をvirtual.generateと同じ順に並べ、記録を再生して本当の名前を
+付け直すので、結果は逐次版(virtual.generateとsimm.optimize)と同じになる。
+"""
+
+import os
+import concurrent.futures
+
+from .. import id
+from ..env import Env
+from . import virtual, simm
+
+# ワーカーに一度に渡す関数の数の目安 (ワーカー数に対する倍率)
+CHUNKS_PER_WORKER = 4
+
+
+class Recorder(id.Supply):
+    """作った変数名を順に記録するSupply
+
+    通し番号をbase(コード生成の前の通し番号)から始めるので、ワーカーが作る名前は
+    それまでにある変数名と重ならない。
+    """
+
+    def __init__(self, base):
+        super().__init__()
+        self.count = base
+        self.log = []
+
+    def name(self, prefix):
+        name = super().name(prefix)
+        self.log.append((prefix, name))
+        return name
+
+
+class Visitor(virtual.Visitor):
+    "定数テーブルを持たず、定数のラベルを仮の名前にするvirtual.Visitor"
+
+    def __init__(self, log):
+        super().__init__()
+        self.log = log
+
+    def constant(self, d):
+        label = f"?{len(self.log)}"  # 変数名には現れない文字で始める
+        self.log.append((None, d, label))
+        return label
+
+
+def generate_chunk(base, fundefs, e=None):
+    """fundefsの各関数とメインの式eのコードを生成・即値最適化する
+
+    関数ごとに(コード, 記録)の組を返す。メインの式の結果は最後に置く。
+    """
+    recorder = Recorder(base)
+    results = []
+    with id.using(recorder):
+        for fundef in fundefs:
+            recorder.log = []
+            fundef = virtual.gen_fundef(Visitor(recorder.log), fundef)
+            body, _ = simm.Visitor().visit(Env(), fundef.body)
+            results.append((fundef._replace(body=body), recorder.log))
+        if e is not None:
+            recorder.log = []
+            e = Visitor(recorder.log).visit_body(Env(), e)
+            e, _ = simm.Visitor().visit(Env(), e)
+            results.append((e, recorder.log))
+    return results
+
+
+def replay(data, labels, log):
+    "記録logを再生して、仮の名前から本当の名前への対応を返す"
+    supply = id.current.get()
+    mapping = {}
+    for entry in log:
+        if entry[0] is None:
+            _, d, label = entry
+            mapping[label] = virtual.constant(data, labels, d)
+        else:
+            prefix, name = entry
+            mapping[name] = supply.name(prefix)
+    return mapping
+
+
+def rename(e, mapping):
+    "命令列eの中の変数名とラベルを、mappingにしたがって置き換える"
+    get = mapping.get
+    # Letの続きは再帰せずにたどり、内側から組み立てる
+    spine = []
+    while e[0] == "Let":
+        spine.append(e)
+        e = e[3]
+    e = ("Ans", rename_exp(e[1], mapping))
+    for _, (x, t), exp, _ in reversed(spine):
+        e = ("Let", (get(x, x), t), rename_exp(exp, mapping), e)
+    return e
+
+
+def rename_exp(exp, mapping):
+    "命令expの中の変数名とラベルを、mappingにしたがって置き換える"
+    get = mapping.get
+    new_exp = [exp[0]]
+    for x in exp[1:]:
+        if isinstance(x, str):
+            x = get(x, x)
+        elif isinstance(x, list):
+            x = [get(y, y) for y in x]
+        elif isinstance(x, tuple):
+            if x[0] == "V":
+                x = ("V", get(x[1], x[1]))
+            elif x[0] != "C":
+                x = rename(x, mapping)  # 分岐命令の各節
+        new_exp.append(x)
+    return tuple(new_exp)
+
+
+def generate(prog, jobs=None):
+    "virtual.generateとsimm.optimizeを、トップレベルの関数をjobs個のプロセスに分けて行う"
+    fundefs, e = prog
+    base = id.current.get().count
+    jobs = jobs or os.cpu_count() or 1
+    size = max(1, len(fundefs) // (jobs * CHUNKS_PER_WORKER))
+    chunks = [fundefs[i : i + size] for i in range(0, len(fundefs), size)]
+
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        futures = [executor.submit(generate_chunk, base, chunk) for chunk in chunks]
+        # メインの式は大きくなりやすいので、ワーカーに送らずにこのプロセスで処理する
+        main = generate_chunk(base, [], e)
+        for chunk, future in zip(chunks, futures):
+            try:
+                results.extend(future.result())
+            except RecursionError:
+                # 入れ子の深すぎる本体はpickleできないので、このプロセスで処理する
+                results.extend(generate_chunk(base, chunk))
+    results.extend(main)
+
+    # virtual.generateと同じ順に名前を付け直す
+    data, labels = [], {}
+    new_fundefs = []
+    for fundef, log in results[:-1]:
+        mapping = replay(data, labels, log)
+        new_fundefs.append(fundef._replace(body=rename(fundef.body, mapping)))
+    e, log = results[-1]
+    new_e = rename(e, replay(data, labels, log))
+    return data, new_fundefs, new_e
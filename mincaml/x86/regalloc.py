@@ -0,0 +1,302 @@
+"""レジスタ割り当て
+
+即値最適化の後の仮想マシンコードの変数に、整数はasm.REGS、浮動小数点数はasm.FREGSの
+レジスタを割り当てる。MinCamlのregAlloc.mlと同じく命令列を先頭から貪欲に割り当て、
+関数呼び出しはすべてのレジスタを壊す(caller-save)ものとして、呼び出しの後も使う変数を
+Saveでスタックに退避し、次に使う命令の前でRestoreする。空いたレジスタがなければ、
+最も遠くまで使う変数を退避する(spill)。
+
+regAlloc.mlは変数を定義するたびに続きの命令列全体の自由変数を求めるので、関数の大きさの
+二乗の時間がかかる。ここでは先にLivenessで命令に通し番号を付け、変数ごとに最後に使う
+命令の番号を求めておく。番号は分岐の各節を続けて並べた順に付けるので、変数が生きている
+範囲は定義から最後に使う命令までの番号の区間に含まれ、レジスタが空いているかは番号を
+比べるだけで分かる。命令一つあたりの時間はレジスタの数に比例するだけで済む。
+"""
+
+from .. import ir
+from .. import types
+from .. import visitor
+from ..id import gen_tmp_id
+from .asm import Ans, Let, REGS, FREGS, REG_CL, is_reg, Fundef
+
+IF_KINDS = ("IfEq", "IfLE", "IfGE", "IfFEq", "IfFLE")
+
+
+def uses(exp):
+    "命令expが読む変数の列 (分岐命令の各節の中は含まない)"
+    name = exp[0]
+    if name in ("Mov", "Neg", "FMovD", "FNegD"):
+        return [exp[1]]
+    elif name in ("Add", "Sub", "Ld", "LdDF"):
+        x, y = exp[1], exp[2]
+        return [x, y[1]] if y[0] == "V" else [x]
+    elif name in ("St", "StDF"):
+        x, y, z = exp[1], exp[2], exp[3]
+        return [x, y, z[1]] if z[0] == "V" else [x, y]
+    elif name in ("FAddD", "FSubD", "FMulD", "FDivD"):
+        return [exp[1], exp[2]]
+    elif name in IF_KINDS:
+        x, y = exp[1], exp[2]
+        if isinstance(y, str):
+            return [x, y]  # 浮動小数点数の比較
+        return [x, y[1]] if y[0] == "V" else [x]
+    elif name == "CallCls":
+        return [exp[1], *exp[2], *exp[3]]
+    elif name == "CallDir":
+        return [*exp[2], *exp[3]]
+    else:
+        return []
+
+
+def ret_reg(t):
+    "型tの値を返すレジスタ (Unitなら None)"
+    if types.is_unit(t):
+        return None
+    return FREGS[0] if types.is_float(t) else REGS[0]
+
+
+class Liveness(visitor.Visitor):
+    """命令に通し番号を付け、変数ごとに最後に使う命令の番号と、望ましいレジスタを求める
+
+    望ましいレジスタは、関数呼び出しの引数になる変数はその引数のレジスタ、関数の本体の
+    最後に返す変数は返り値のレジスタ、呼び出しの結果はその返り値のレジスタ。
+    """
+
+    kinds = ir.VIRTUAL.kinds
+
+    def __init__(self):
+        self.pos = 0
+        self.last_use = {}  # 変数から最後に使う命令の番号への対応
+        self.hints = {}  # 変数から望ましいレジスタへの対応
+
+    def visit(self, ret, e):
+        "retは末尾の命令の結果を置くレジスタ (関数の本体の末尾でなければNone)"
+        return self.dispatch[e[0]](self, ret, e)
+
+    def enter_Let(self, ret, e):
+        (x, t), exp, e2 = e[1:]
+        self.instruction(None, exp)
+        if exp[0] in ("CallCls", "CallDir") and not types.is_unit(t):
+            self.hints.setdefault(x, ret_reg(t))
+        return None, (ret,), e2
+
+    def visit_Ans(self, ret, e):
+        self.instruction(ret, e[1])
+
+    def instruction(self, ret, exp):
+        self.pos += 1
+        pos = self.pos
+        last_use = self.last_use
+        for y in uses(exp):
+            last_use[y] = pos
+        name = exp[0]
+        hint = self.hints.setdefault
+        if name in IF_KINDS:
+            self.visit(ret, exp[3])
+            self.visit(ret, exp[4])
+        elif name in ("CallCls", "CallDir"):
+            if name == "CallCls":
+                hint(exp[1], REG_CL)
+            for y, r in zip(exp[2], REGS):
+                hint(y, r)
+            for z, r in zip(exp[3], FREGS):
+                hint(z, r)
+        elif name in ("Mov", "FMovD") and ret is not None:
+            hint(exp[1], ret)
+
+
+class Allocator(visitor.Visitor):
+    """命令列の変数をレジスタに置き換える
+
+    regsは変数からレジスタへ、ownerはレジスタから変数への対応で、レジスタにある変数だけを
+    持つ (すでに死んだ変数も残りうる)。レジスタにない生きた変数は、スタックに退避されている。
+    """
+
+    kinds = ir.VIRTUAL.kinds
+
+    def __init__(self, liveness):
+        self.last_use = liveness.last_use
+        self.hints = liveness.hints
+        self.pos = 0
+        self.regs = {}
+        self.owner = {}
+        self.types = {}  # Restoreするときの変数の型
+
+    def visit(self, e):
+        return self.dispatch[e[0]](self, e)
+
+    def live(self, x, pos):
+        "変数xを番号pos以降の命令で使うか"
+        return self.last_use.get(x, 0) >= pos
+
+    def assign(self, x, r):
+        old = self.owner.get(r)
+        if old is not None:
+            del self.regs[old]
+        self.owner[r] = x
+        self.regs[x] = r
+
+    def bind(self, x, t, r):
+        self.types[x] = t
+        self.assign(x, r)
+
+    def alloc(self, x, t, pos, busy=()):
+        """型tの変数xに、番号pos以降で使う変数のないレジスタを割り当てる
+
+        (レジスタ, 退避した変数)を返す。空いたレジスタがなければ、busy以外で最も遠くまで
+        使う変数をレジスタから外す (退避した変数がなければNone)。
+        """
+        regs = FREGS if types.is_float(t) else REGS
+        hint = self.hints.get(x)
+        owner = self.owner
+        spilled = None
+        for r in regs if hint is None else (hint, *regs):
+            y = owner.get(r)
+            if y is None or not self.live(y, pos):
+                break
+        else:
+            last_use = self.last_use
+            r = max(
+                (r for r in regs if owner[r] not in busy),
+                key=lambda r: last_use.get(owner[r], 0),
+            )
+            spilled = owner[r]
+        self.bind(x, t, r)
+        return r, spilled
+
+    def find(self, x):
+        return x if is_reg(x) else self.regs[x]
+
+    def find_imm(self, y):
+        return ("V", self.find(y[1])) if y[0] == "V" else y
+
+    def instruction(self, exp):
+        """命令expの変数をレジスタに置き換える
+
+        (前に置く命令の列, 置き換えた命令, 分岐の直前のregs)を返す。前に置く命令は
+        (変数と型, 命令)の組で、使う変数のRestoreと、退避のためのSave。
+        分岐命令でなければ、分岐の直前のregsはNone。
+        """
+        self.pos += 1
+        pos = self.pos
+        pre = []
+        operands = uses(exp)
+        for y in operands:
+            if is_reg(y) or y in self.regs:
+                continue
+            t = self.types[y]
+            r, spilled = self.alloc(y, t, pos, operands)
+            if spilled is not None:
+                pre.append(save(r, spilled))
+            pre.append(((r, t), ("Restore", y)))
+        before = None
+
+        name = exp[0]
+        find, find_imm = self.find, self.find_imm
+        if name in ("Mov", "Neg", "FMovD", "FNegD"):
+            exp = (name, find(exp[1]))
+        elif name in ("Add", "Sub", "Ld", "LdDF"):
+            exp = (name, find(exp[1]), find_imm(exp[2]), *exp[3:])
+        elif name in ("St", "StDF"):
+            exp = (name, find(exp[1]), find(exp[2]), find_imm(exp[3]), exp[4])
+        elif name in ("FAddD", "FSubD", "FMulD", "FDivD"):
+            exp = (name, find(exp[1]), find(exp[2]))
+        elif name in IF_KINDS:
+            exp, before = self.if_(exp, pre)
+        elif name in ("CallCls", "CallDir"):
+            f = find(exp[1]) if name == "CallCls" else exp[1]
+            exp = (name, f, [find(y) for y in exp[2]], [find(z) for z in exp[3]])
+            # 呼び出しの後も使う変数は退避し、呼び出しの後はどのレジスタにも変数がない
+            for y, r in self.regs.items():
+                if self.live(y, pos + 1):
+                    pre.append(save(r, y))
+            self.regs = {}
+            self.owner = {}
+        return pre, exp, before
+
+    def if_(self, exp, pre):
+        """分岐命令expの各節にレジスタを割り当てる
+
+        分岐の後は、両方の節の終わりで同じレジスタにある変数だけをレジスタにあるものとし、
+        それ以外の分岐の後も使う変数は分岐の前に退避する。
+        """
+        name, x, y, e1, e2 = exp
+        y = self.find(y) if isinstance(y, str) else self.find_imm(y)
+        x = self.find(x)
+        regs, owner = self.regs, self.owner
+        self.regs, self.owner = dict(regs), dict(owner)
+        e1 = self.visit(e1)
+        regs1 = self.regs
+        self.regs, self.owner = dict(regs), dict(owner)
+        e2 = self.visit(e2)
+        regs2 = self.regs
+
+        end = self.pos + 1
+        self.regs = {
+            z: r for z, r in regs1.items() if regs2.get(z) == r and self.live(z, end)
+        }
+        self.owner = {r: z for z, r in self.regs.items()}
+        for z, r in regs.items():
+            if z not in self.regs and self.live(z, end):
+                pre.append(save(r, z))
+        return (name, x, y, e1, e2), regs
+
+    def enter_Let(self, e):
+        (x, t), exp, e2 = e[1:]
+        pre, exp, before = self.instruction(exp)
+        if types.is_unit(t) or is_reg(x):
+            r = x
+        else:
+            r, spilled = self.alloc(x, t, self.pos + 1)
+            # 分岐の結果に割り当てたなら、退避する変数が分岐の前にあったレジスタから退避する
+            if spilled is None:
+                pass
+            elif before is None:
+                pre.append(save(r, spilled))
+            elif spilled in before:
+                pre.append(save(before[spilled], spilled))
+
+        def leave(e2):
+            return prepend(pre, Let((r, t), exp, e2))
+
+        return leave, (), e2
+
+    def visit_Ans(self, e):
+        pre, exp, _ = self.instruction(e[1])
+        return prepend(pre, Ans(*exp))
+
+
+def save(r, x):
+    "レジスタrにある変数xを退避する命令 (前に置く命令の列の要素)"
+    return (gen_tmp_id(types.Unit), types.Unit), ("Save", r, x)
+
+
+def prepend(pre, e):
+    for xt, exp in reversed(pre):
+        e = Let(xt, exp, e)
+    return e
+
+
+def allocate_fundef(fundef):
+    "関数のレジスタ割り当て (引数は前からREGS・FREGSに、クロージャはREG_CLに置かれる)"
+    name, args, fargs, body, t = fundef
+    if len(args) >= len(REGS) or len(fargs) > len(FREGS):
+        raise ValueError(f"too many arguments: {name}")
+    liveness = Liveness()
+    liveness.visit(ret_reg(t), body)
+    allocator = Allocator(liveness)
+    allocator.bind(name, types.Int, REG_CL)
+    for y, r in zip(args, REGS):
+        allocator.bind(y, types.Int, r)
+    for z, r in zip(fargs, FREGS):
+        allocator.bind(z, types.Float, r)
+    body = allocator.visit(body)
+    return Fundef(name, list(REGS[: len(args)]), list(FREGS[: len(fargs)]), body, t)
+
+
+def allocate(prog):
+    "プログラム全体のレジスタ割り当て"
+    data, fundefs, e = prog
+    liveness = Liveness()
+    liveness.visit(None, e)
+    return data, [allocate_fundef(f) for f in fundefs], Allocator(liveness).visit(e)
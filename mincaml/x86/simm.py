@@ -1,33 +1,60 @@
-from pyrsistent import pmap
-
+from .. import ir
+from .. import visitor
+from ..env import Env
+from ..util import union
 from .virtual import C, Ans, Let
-from .asm import free_variables
+from .asm import exp_free_variables
+
+
+class Visitor(visitor.Visitor):
+    """即値最適化を行ったコードと、その中の変数の集合(asm.free_variables)の組を返す
+
+    命令(Ansの中身)のvisit_<種類>は変換後の命令だけを返し、変数の集合は
+    visit_Ans・enter_Letが下から組み立てる。
+    """
 
+    kinds = ir.VIRTUAL.kinds
+    default = visitor.pass_through
 
-class Visitor:
     def visit(self, env, e):
-        method = "visit_" + e[0]
-        if hasattr(self, method):
-            visitor = getattr(self, method)
-            return visitor(env, e)
-        else:
-            return e
+        return self.dispatch[e[0]](self, env, e)
+
+    def visit_exp(self, env, exp):
+        "命令expを変換し、変換後の命令とその中の変数の集合の組を返す"
+        if exp[0] in ("IfEq", "IfLE", "IfGE", "IfFEq", "IfFLE"):
+            return self.visit(env, exp)
+        new_exp = self.visit(env, exp)
+        return new_exp, exp_free_variables(new_exp)
 
     def visit_Ans(self, env, e):
-        exp = e[1]
-        return Ans(*self.visit(env, exp))
+        exp, fv = self.visit_exp(env, e[1])
+        return Ans(*exp), fv
 
-    def visit_Let(self, env, e):
+    def enter_Let(self, env, e):
         (x, t), exp, e = e[1:]
         if exp[0] == "Set":
             i = exp[1]
-            new_e = self.visit(env.set(x, i), e)
-            if x in free_variables(new_e):
-                return Let((x, t), ("Set", i), new_e)
-            else:
-                return new_e
+
+            def leave(result):
+                new_e, fv = result
+                if x in fv:
+                    fv.add(x)
+                    return Let((x, t), ("Set", i), new_e), fv
+                else:
+                    return new_e, fv
+
+            mark = env.mark()
+            env.bind(x, i)
+            return env.leave(mark, leave), (env,), e
         else:
-            return Let((x, t), self.visit(env, exp), self.visit(env, e))
+            new_exp, fv1 = self.visit_exp(env, exp)
+
+            def leave(result):
+                new_e, fv2 = result
+                fv2.add(x)
+                return Let((x, t), new_exp, new_e), union(fv1, fv2)
+
+            return leave, (env,), e
 
     def visit_Add(self, env, e):
         x, (t, y) = e[1:]
@@ -85,40 +112,52 @@ class Visitor:
         else:
             return e
 
+    def if_(self, env, name, x, y, e1, e2):
+        "分岐命令を作り、その中の変数の集合との組を返す"
+        new_e1, fv1 = self.visit(env, e1)
+        new_e2, fv2 = self.visit(env, e2)
+        fv = union(fv1, fv2)
+        fv.add(x)
+        if isinstance(y, str):
+            fv.add(y)  # 浮動小数点数の比較のyは即値を取らない変数
+        elif y[0] == "V":
+            fv.add(y[1])
+        return (name, x, y, new_e1, new_e2), fv
+
     def visit_IfEq(self, env, e):
         x, (t, y), e1, e2 = e[1:]
         if t == "V" and y in env:
-            return ("IfEq", x, C(env[y]), self.visit(env, e1), self.visit(env, e2))
+            return self.if_(env, "IfEq", x, C(env[y]), e1, e2)
         elif t == "V" and x in env:
-            return ("IfEq", y, C(env[x]), self.visit(env, e1), self.visit(env, e2))
+            return self.if_(env, "IfEq", y, C(env[x]), e1, e2)
         else:
-            return ("IfEq", x, (t, y), self.visit(env, e1), self.visit(env, e2))
+            return self.if_(env, "IfEq", x, (t, y), e1, e2)
 
     def visit_IfLE(self, env, e):
         x, (t, y), e1, e2 = e[1:]
         if t == "V" and y in env:
-            return ("IfLE", x, C(env[y]), self.visit(env, e1), self.visit(env, e2))
+            return self.if_(env, "IfLE", x, C(env[y]), e1, e2)
         elif t == "V" and x in env:
-            return ("IfGE", y, C(env[x]), self.visit(env, e1), self.visit(env, e2))
+            return self.if_(env, "IfGE", y, C(env[x]), e1, e2)
         else:
-            return ("IfLE", x, (t, y), self.visit(env, e1), self.visit(env, e2))
+            return self.if_(env, "IfLE", x, (t, y), e1, e2)
 
     def visit_IfGE(self, env, e):
         x, (t, y), e1, e2 = e[1:]
         if t == "V" and y in env:
-            return ("IfGE", x, C(env[y]), self.visit(env, e1), self.visit(env, e2))
+            return self.if_(env, "IfGE", x, C(env[y]), e1, e2)
         elif t == "V" and x in env:
-            return ("IfLE", y, C(env[x]), self.visit(env, e1), self.visit(env, e2))
+            return self.if_(env, "IfLE", y, C(env[x]), e1, e2)
         else:
-            return ("IfGE", x, (t, y), self.visit(env, e1), self.visit(env, e2))
+            return self.if_(env, "IfGE", x, (t, y), e1, e2)
 
     def visit_IfFEq(self, env, e):
-        x, (t, y), e1, e2 = e[1:]
-        return (e[0], x, (t, y), self.visit(env, e1), self.visit(env, e2))
+        x, y, e1, e2 = e[1:]
+        return self.if_(env, e[0], x, y, e1, e2)
 
     def visit_IfFLE(self, env, e):
-        x, (t, y), e1, e2 = e[1:]
-        return (e[0], x, (t, y), self.visit(env, e1), self.visit(env, e2))
+        x, y, e1, e2 = e[1:]
+        return self.if_(env, e[0], x, y, e1, e2)
 
 
 def optimize(prog):
@@ -127,6 +166,6 @@ def optimize(prog):
     visitor = Visitor()
     return (
         data,
-        [f._replace(body=visitor.visit(pmap(), f.body)) for f in fundefs],
-        visitor.visit(pmap(), e),
+        [f._replace(body=visitor.visit(Env(), f.body)[0]) for f in fundefs],
+        visitor.visit(Env(), e)[0],
     )
@@ -1,11 +1,11 @@
-from pyrsistent import pmap
-
 import functools
 
 # from .. import logger
 from ..id import gen_id, gen_tmp_id
+from .. import ir
 from .. import types
-from ..closure import free_variables
+from .. import visitor
+from ..env import Env
 from .asm import V, C, Ans, Let, REG_HP, align, Fundef
 
 
@@ -18,13 +18,17 @@ def seq(e1, e2):
 
 
 def concat(e1, xt, e2):
-    if e1[0] == "Ans":
-        return Let(xt, e1[1], e2)
-    elif e1[0] == "Let":
-        yt, exp, new_e1 = e1[1:]
-        return Let(yt, exp, concat(new_e1, xt, e2))
-    else:
+    "命令列e1の結果をxtに束縛してe2を続ける"
+    spine = []
+    while e1[0] == "Let":
+        spine.append(e1)
+        e1 = e1[3]
+    if e1[0] != "Ans":
         raise ValueError
+    e = Let(xt, e1[1], e2)
+    for _, yt, exp, _ in reversed(spine):
+        e = Let(yt, exp, e)
+    return e
 
 
 def separate(xts):
@@ -32,7 +36,7 @@ def separate(xts):
     for x, t in xts:
         if types.is_float(t):
             float_lst.append(x)
-        elif types.is_int(t):
+        elif not types.is_unit(t):
             int_lst.append(x)
     return int_lst, float_lst
 
@@ -47,19 +51,77 @@ def expand(xts, ini, addf, addi):
             offset = align(offset)
             return offset + 8, addf(x, offset, acc)
         else:
-            return offset + 4, addi(x, t, offset, acc)
+            return offset + 8, addi(x, t, offset, acc)
 
     return functools.reduce(func, xts, ini)
 
 
-class Visitor:
+def used_variables(e):
+    """クロージャ変換後の式eの中で値を読まれる変数の集合 (再帰せずにたどる)
+
+    α変換の後なので一つの本体の中で同じ名前を二度束縛することはなく、
+    束縛された変数がこの集合になければ、その続きの式でも使われない。
+    """
+    used = set()
+    stack = [e]
+    while stack:
+        e = stack.pop()
+        name = e[0]
+        if name in ("Unit", "Int", "Float", "ExtArray"):
+            pass
+        elif name in ("IfEq", "IfLE"):
+            used.add(e[1])
+            used.add(e[2])
+            stack.append(e[3])
+            stack.append(e[4])
+        elif name == "Let":
+            stack.append(e[2])
+            stack.append(e[3])
+        elif name == "MakeCls":
+            used.update(e[2][1])
+            stack.append(e[3])
+        elif name == "LetTuple":
+            used.add(e[2])
+            stack.append(e[3])
+        elif name == "AppCls":
+            used.add(e[1])
+            used.update(e[2])
+        elif name in ("AppDir", "Tuple"):
+            used.update(e[-1])
+        else:
+            used.update(e[1:])
+    return used
+
+
+def constant(data, labels, c):
+    """定数テーブルdataにある定数cのラベルを返す (なければ追加する)
+
+    labelsはdataの値からラベルへの対応で、dataを先頭から探す代わりに使う。
+    """
+    # すでに定数テーブルにあったら再利用
+    label = labels.get(c)
+    if label is None:
+        label = gen_id("l")
+        data.append((label, c))
+        labels[c] = label
+    return label
+
+
+class Visitor(visitor.Visitor):
+    kinds = ir.CLOSURE.kinds
+
     def __init__(self):
         self.data = []  # 定数テーブル
+        self.labels = {}  # 定数テーブルの値からラベルへの対応
+        self.used = set()  # たどっている本体で使われる変数 (used_variables)
 
     def visit(self, env, e):
-        method = "visit_" + e[0]
-        visitor = getattr(self, method)
-        return visitor(env, e)
+        return self.dispatch[e[0]](self, env, e)
+
+    def visit_body(self, env, e):
+        "関数の本体やメインの式eのコードを生成する"
+        self.used = used_variables(e)
+        return self.visit(env, e)
 
     def visit_Unit(self, env, e):
         return Ans("Nop")
@@ -67,17 +129,12 @@ class Visitor:
     def visit_Int(self, env, e):
         return Ans("Set", e[1])
 
+    def constant(self, d):
+        "浮動小数点数の定数dのラベルを返す"
+        return constant(self.data, self.labels, d)
+
     def visit_Float(self, env, e):
-        d = e[1]
-        label = None
-        # すでに定数テーブルにあったら再利用
-        for l, d in self.data:
-            if d == e[1]:
-                label = l
-                break
-        if label is None:
-            label = gen_id("l")
-            self.data.append((label, d))
+        label = self.constant(e[1])
         x = gen_id("l")
         return Let((x, types.Int), ("SetL", label), Ans("LdDF", x, C(0), 1))
 
@@ -132,11 +189,16 @@ class Visitor:
         else:
             raise ValueError("inequality supported only for bool, int, and float")
 
-    def visit_Let(self, env, e):
+    def enter_Let(self, env, e):
         (x, t1), e1, e2 = e[1:]
         new_e1 = self.visit(env, e1)
-        new_e2 = self.visit(env.set(x, t1), e2)
-        return concat(new_e1, (x, t1), new_e2)
+        mark = env.mark()
+        env.bind(x, t1)
+        return (
+            env.leave(mark, lambda new_e2: concat(new_e1, (x, t1), new_e2)),
+            (env,),
+            e2,
+        )
 
     def visit_Var(self, env, e):
         x = e[1]
@@ -148,27 +210,38 @@ class Visitor:
         else:
             return Ans("Mov", x)
 
-    def visit_MakeCls(self, env, e):
+    def enter_MakeCls(self, env, e):
         "クロージャの生成"
         (x, t), (l, ys), e2 = e[1:]
-        # Closureのアドレスをセットしてから、自由変数の値をストア
-        new_e2 = self.visit(env.set(x, t), e2)
-        offset, store_fv = expand(
-            [(y, env[y]) for y in ys],
-            (4, new_e2),
-            lambda y, offset, store_fv: seq(("StDF", y, x, C(offset), 1), store_fv),
-            lambda y, _, offset, store_fv: seq(("St", y, x, C(offset), 1), store_fv),
-        )
-        z = gen_id("l")
-        return Let(
-            (x, t),
-            ("Mov", REG_HP),
-            Let(
-                (REG_HP, types.Int),
-                ("Add", REG_HP, C(align(offset))),
-                Let((z, types.Int), ("SetL", l), seq(("St", z, x, C(0), 1), store_fv)),
-            ),
-        )
+
+        def leave(new_e2):
+            # Closureのアドレスをセットしてから、自由変数の値をストア
+            offset, store_fv = expand(
+                [(y, env[y]) for y in ys],
+                (8, new_e2),
+                lambda y, offset, store_fv: seq(("StDF", y, x, C(offset), 1), store_fv),
+                lambda y, _, offset, store_fv: seq(
+                    ("St", y, x, C(offset), 1), store_fv
+                ),
+            )
+            z = gen_id("l")
+            return Let(
+                (x, t),
+                ("Mov", REG_HP),
+                Let(
+                    (REG_HP, types.Int),
+                    ("Add", REG_HP, C(align(offset))),
+                    Let(
+                        (z, types.Int),
+                        ("SetL", l),
+                        seq(("St", z, x, C(0), 1), store_fv),
+                    ),
+                ),
+            )
+
+        mark = env.mark()
+        env.bind(x, t)
+        return env.leave(mark, leave), (env,), e2
 
     def visit_AppCls(self, env, e):
         x, ys = e[1:]
@@ -190,14 +263,14 @@ class Visitor:
             lambda x, _, offset, store: seq(("St", x, y, C(offset), 1), store),
         )
         return Let(
-            (y, types.Tuple([env[x] for x in xs])),
+            (y, types.Tuple.of([env[x] for x in xs])),
             ("Mov", REG_HP),
             Let((REG_HP, types.Int), ("Add", REG_HP, C(align(offset))), store),
         )
 
-    def visit_LetTuple(self, env, e):
+    def enter_LetTuple(self, env, e):
         xts, y, e2 = e[1:]
-        s = free_variables(e2)
+        s = self.used
 
         def addf(x, offset, load):
             if x not in s:
@@ -211,8 +284,13 @@ class Visitor:
             else:
                 return Let((x, t), ("Ld", y, C(offset), 1), load)
 
-        _, load = expand(xts, (0, self.visit(env.update(dict(xts)), e2)), addf, addi)
-        return load
+        def leave(new_e2):
+            _, load = expand(xts, (0, new_e2), addf, addi)
+            return load
+
+        mark = env.mark()
+        env.update(xts)
+        return env.leave(mark, leave), (env,), e2
 
     def visit_Get(self, env, e):
         x, y = e[1:]
@@ -220,12 +298,12 @@ class Visitor:
         if types.is_array(t):
             if types.is_unit(t.elem):
                 return Ans("Nop")
-            elif types.is_unit(t.elem):
+            elif types.is_float(t.elem):
                 return Ans("LdDF", x, V(y), 8)
             else:
-                return Ans("Ld", x, V(y), 4)
+                return Ans("Ld", x, V(y), 8)
         else:
-            raise (f"cannot get from {t}")
+            raise ValueError(f"cannot get from {t}")
 
     def visit_Put(self, env, e):
         x, y, z = e[1:]
@@ -233,12 +311,12 @@ class Visitor:
         if types.is_array(t):
             if types.is_unit(t.elem):
                 return Ans("Nop")
-            elif types.is_unit(t.elem):
+            elif types.is_float(t.elem):
                 return Ans("StDF", z, x, V(y), 8)
             else:
-                return Ans("St", z, x, V(y), 4)
+                return Ans("St", z, x, V(y), 8)
         else:
-            raise (f"cannot put into {t}")
+            raise ValueError(f"cannot put into {t}")
 
     def visit_ExtArray(self, env, e):
         return Ans("SetL", "min_caml_" + e[1])
@@ -253,7 +331,7 @@ def gen_fundef(visitor, closure):
     env.update(dict(yts))
     offset, load = expand(
         zts,
-        (4, visitor.visit(pmap(env), e)),
+        (8, visitor.visit_body(Env(env), e)),
         lambda z, offset, load: fletd(z, ("LdDF", x, C(offset), 1), load),
         lambda z, t, offset, load: Let((z, t), ("Ld", x, C(offset), 1), load),
     )
@@ -266,5 +344,5 @@ def generate(prog):
     fundefs, e = prog
     visitor = Visitor()
     fundefs = [gen_fundef(visitor, f) for f in fundefs]
-    e = visitor.visit(pmap(), e)
+    e = visitor.visit_body(Env(), e)
     return visitor.data, fundefs, e